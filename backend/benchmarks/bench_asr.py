@@ -0,0 +1,118 @@
+"""
+比較 CPU fp32 與 int8 Whisper 的速度與正確率
+
+用法（在 backend 目錄下執行）：
+    python -m benchmarks.bench_asr --fixtures data/asr_fixtures --model-size small --threads 8
+
+fixtures 目錄放 .wav 音檔，同名 .txt 為參考逐字稿（沒有時以 fp32 結果作為參考）。
+輸出每個後端的 real-time factor (RTF = 解碼時間 / 音檔長度)、WER 與 CER。
+"""
+import argparse
+import os
+import time
+import librosa
+from models.asr_backends import run_asr
+
+
+def edit_distance(ref, hyp):
+    """
+    Levenshtein 距離（替換、插入、刪除成本皆為 1）
+    """
+    previous = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, start=1):
+        current = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, start=1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h))
+        previous = current
+    return previous[-1]
+
+
+def error_rate(ref_tokens, hyp_tokens):
+    if not ref_tokens:
+        return 0.0 if not hyp_tokens else 1.0
+    return edit_distance(ref_tokens, hyp_tokens) / len(ref_tokens)
+
+
+def word_error_rate(reference, hypothesis):
+    return error_rate(reference.split(), hypothesis.split())
+
+
+def char_error_rate(reference, hypothesis):
+    # 中文沒有空白斷詞，字元錯誤率比較有意義
+    return error_rate(list(reference.replace(" ", "")), list(hypothesis.replace(" ", "")))
+
+
+def load_fixtures(fixture_dir):
+    fixtures = []
+    for name in sorted(os.listdir(fixture_dir)):
+        if not name.endswith(".wav"):
+            continue
+        audio_path = os.path.join(fixture_dir, name)
+        ref_path = os.path.splitext(audio_path)[0] + ".txt"
+        reference = None
+        if os.path.exists(ref_path):
+            with open(ref_path, "r", encoding="utf-8") as f:
+                reference = f.read().strip()
+        fixtures.append((audio_path, reference))
+    return fixtures
+
+
+def transcribe_fixture(audio_path, backend, model_size, threads):
+    start = time.perf_counter()
+    result = run_asr(audio_path, backend=backend, model_size=model_size, num_threads=threads)
+    elapsed = time.perf_counter() - start
+    text = " ".join(seg["text"].strip() for seg in result["segments"])
+    return text, elapsed
+
+
+def run_benchmark(fixture_dir, model_size, threads, backends):
+    fixtures = load_fixtures(fixture_dir)
+    if not fixtures:
+        print(f"No .wav fixtures found in {fixture_dir}")
+        return {}
+
+    # 先各跑一次讓模型載入，不算進解碼時間
+    for backend in backends:
+        run_asr(fixtures[0][0], backend=backend, model_size=model_size, num_threads=threads)
+
+    totals = {backend: {"audio": 0.0, "decode": 0.0, "wer": [], "cer": []} for backend in backends}
+    for audio_path, reference in fixtures:
+        audio_seconds = librosa.get_duration(path=audio_path)
+        hypotheses = {}
+        for backend in backends:
+            text, elapsed = transcribe_fixture(audio_path, backend, model_size, threads)
+            hypotheses[backend] = text
+            totals[backend]["audio"] += audio_seconds
+            totals[backend]["decode"] += elapsed
+
+        ref_text = reference if reference is not None else hypotheses[backends[0]]
+        for backend in backends:
+            totals[backend]["wer"].append(word_error_rate(ref_text, hypotheses[backend]))
+            totals[backend]["cer"].append(char_error_rate(ref_text, hypotheses[backend]))
+        print(f"{os.path.basename(audio_path)} ({audio_seconds:.1f}s): "
+              + ", ".join(f"{b} CER={totals[b]['cer'][-1]:.3f}" for b in backends))
+
+    report = {}
+    print(f"\nWhisper {model_size}, {threads or 'default'} threads, {len(fixtures)} files")
+    for backend in backends:
+        t = totals[backend]
+        report[backend] = {
+            "rtf": t["decode"] / t["audio"] if t["audio"] else 0.0,
+            "wer": sum(t["wer"]) / len(t["wer"]),
+            "cer": sum(t["cer"]) / len(t["cer"]),
+        }
+        print(f"{backend:>18}: RTF={report[backend]['rtf']:.3f} "
+              f"WER={report[backend]['wer']:.3f} CER={report[backend]['cer']:.3f}")
+    base, quant = backends[0], backends[-1]
+    if report[quant]["rtf"] > 0:
+        print(f"Speed-up {quant} vs {base}: {report[base]['rtf'] / report[quant]['rtf']:.2f}x")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CPU Whisper fp32 vs int8 benchmark")
+    parser.add_argument("--fixtures", default="data/asr_fixtures", help="Directory of .wav (+ .txt) fixtures")
+    parser.add_argument("--model-size", default="small")
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+    run_benchmark(args.fixtures, args.model_size, args.threads, ["whisper-fp32-cpu", "whisper-int8-cpu"])
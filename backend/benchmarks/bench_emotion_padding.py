@@ -0,0 +1,81 @@
+"""
+情緒模型：固定 6 秒補齊 vs 依長度分桶的動態補齊
+
+用法（在 backend 目錄下執行）：
+    python -m benchmarks.bench_emotion_padding --audio data/lecture.wav --segments 200 --runtime onnx
+
+長度分布模擬 Whisper 語段（對數常態，中位數約 3 秒，截在 0.5–15 秒）。
+給 --audio 時從真實音檔切片，否則使用合成雜訊。輸出每秒處理的語段數與兩種模式的標籤一致率。
+group norm 的模型補零會經過 conv 的 GroupNorm，--max-pad-ratio 為同一批最長 / 最短的上限（預設 EMOTION_MAX_PAD_RATIO）。
+--runtime 選擇 torch / onnx / int8（預設 EMOTION_RUNTIME），onnx 需先執行 python -m models.model_export --model emotion。
+"""
+import argparse
+import time
+import numpy as np
+from models.audio_emotion_classifier import predict_batch, get_emotion_model, sample_rate, EMOTION_RUNTIME
+
+
+def whisper_like_lengths(n, rng, median_seconds=3.0, sigma=0.6, low=0.5, high=15.0):
+    return np.clip(rng.lognormal(np.log(median_seconds), sigma, size=n), low, high)
+
+
+def make_clips(n, rng, audio=None):
+    clips = []
+    for seconds in whisper_like_lengths(n, rng):
+        length = int(seconds * sample_rate)
+        if audio is not None and len(audio) > length:
+            start = rng.integers(0, len(audio) - length)
+            clips.append(audio[start:start + length])
+        else:
+            clips.append((rng.standard_normal(length) * 0.05).astype(np.float32))
+    return clips
+
+
+def time_mode(clips, processor, model, repeats, **kwargs):
+    predict_batch(clips[:4], processor, model, **kwargs)  # warm-up
+    best = float("inf")
+    results = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        results = predict_batch(clips, processor, model, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, results
+
+
+def run_benchmark(num_segments, batch_size, repeats, audio_path=None, seed=0, max_pad_ratio=None, runtime=None):
+    rng = np.random.default_rng(seed)
+    audio = None
+    if audio_path:
+        import librosa
+        audio, _ = librosa.load(audio_path, sr=sample_rate)
+    clips = make_clips(num_segments, rng, audio)
+    processor, model = get_emotion_model(runtime)
+
+    lengths = np.array([len(c) / sample_rate for c in clips])
+    print(f"{num_segments} segments, length median {np.median(lengths):.2f}s, "
+          f"p90 {np.percentile(lengths, 90):.2f}s, batch size {batch_size}, runtime {runtime or EMOTION_RUNTIME}")
+
+    fixed_time, fixed = time_mode(clips, processor, model, repeats, max_batch_size=batch_size,
+                                  padding="max_length")
+    bucket_time, bucketed = time_mode(clips, processor, model, repeats, max_batch_size=batch_size,
+                                      padding="longest", bucket_by_length=True, max_pad_ratio=max_pad_ratio)
+
+    agreement = np.mean([a[0] == b[0] for a, b in zip(fixed, bucketed)])
+    print(f"fixed 6s padding     : {num_segments / fixed_time:8.2f} segments/s ({fixed_time:.2f}s)")
+    print(f"bucketed dynamic pad : {num_segments / bucket_time:8.2f} segments/s ({bucket_time:.2f}s)")
+    print(f"speed-up {fixed_time / bucket_time:.2f}x, label agreement {agreement:.1%}")
+    return {"fixed_seconds": fixed_time, "bucketed_seconds": bucket_time, "label_agreement": agreement}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emotion model padding benchmark")
+    parser.add_argument("--audio", default=None, help="Optional wav file to slice segments from")
+    parser.add_argument("--segments", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-pad-ratio", type=float, default=None,
+                        help="Max longest/shortest length ratio within a bucketed batch (default: EMOTION_MAX_PAD_RATIO)")
+    parser.add_argument("--runtime", choices=["torch", "onnx", "int8"], default=None)
+    args = parser.parse_args()
+    run_benchmark(args.segments, args.batch_size, args.repeats, args.audio, max_pad_ratio=args.max_pad_ratio,
+                  runtime=args.runtime)
@@ -0,0 +1,96 @@
+"""
+int8 動態量化 vs fp32：HuBERT 情緒模型與結巴模型的一致性報告
+
+用法（在 backend 目錄下執行）：
+    python -m benchmarks.bench_quantization --audio data/lecture.wav --model all
+
+將音檔切成 3 秒片段（沒有 --audio 時使用合成雜訊），比較標籤一致率、
+最高分數差、每段延遲與模型大小。
+"""
+import argparse
+import time
+import numpy as np
+from models.audio_buffer import AudioBuffer
+from models.quantization import agreement_report, model_size_mb
+
+
+def make_clips(audio_path, num_clips, clip_seconds=3.0, sample_rate=16000, seed=0):
+    if audio_path:
+        buffer = AudioBuffer.from_file(audio_path)
+        step = clip_seconds
+        starts = np.arange(0, max(buffer.duration - clip_seconds, 0) + 1e-6, step)[:num_clips]
+        return [buffer.slice(s, s + clip_seconds) for s in starts]
+    rng = np.random.default_rng(seed)
+    return [(rng.standard_normal(int(clip_seconds * sample_rate)) * 0.05).astype(np.float32)
+            for _ in range(num_clips)]
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def report_emotion(clips):
+    from models.audio_emotion_classifier import predict_batch, get_emotion_model
+    processor, fp32 = get_emotion_model("torch")
+    _, int8 = get_emotion_model("int8")
+    reference, fp32_time = _timed(lambda: predict_batch(clips, processor, fp32, max_batch_size=1))
+    candidate, int8_time = _timed(lambda: predict_batch(clips, processor, int8, max_batch_size=1))
+    report = agreement_report(reference, candidate)
+    report.update({
+        "fp32_ms_per_segment": 1000 * fp32_time / len(clips),
+        "int8_ms_per_segment": 1000 * int8_time / len(clips),
+        "fp32_size_mb": model_size_mb(fp32),
+        "int8_size_mb": model_size_mb(int8),
+    })
+    return report
+
+
+def _pipeline_results(pipe, clips):
+    results = []
+    for clip in clips:
+        output = pipe(clip)
+        scores = {res["label"]: res["score"] for res in output}
+        top = max(output, key=lambda x: x["score"])
+        results.append((top["label"], top["score"], scores))
+    return results
+
+
+def report_stutter(clips):
+    from models.prosody_analyzer import get_stutter_pipeline
+    fp32 = get_stutter_pipeline("torch")
+    int8 = get_stutter_pipeline("int8")
+    reference, fp32_time = _timed(lambda: _pipeline_results(fp32, clips))
+    candidate, int8_time = _timed(lambda: _pipeline_results(int8, clips))
+    report = agreement_report(reference, candidate)
+    report.update({
+        "fp32_ms_per_segment": 1000 * fp32_time / len(clips),
+        "int8_ms_per_segment": 1000 * int8_time / len(clips),
+        "fp32_size_mb": model_size_mb(fp32.model),
+        "int8_size_mb": model_size_mb(int8.model),
+    })
+    return report
+
+
+def print_report(name, report):
+    print(f"\n[{name}] {report['count']} segments")
+    print(f"  label agreement     : {report['label_agreement']:.1%}")
+    print(f"  top-score |delta|   : mean {report['top_score_delta_mean']:.4f}, max {report['top_score_delta_max']:.4f}")
+    print(f"  any-class |delta|   : max {report['max_score_delta']:.4f}")
+    print(f"  latency per segment : fp32 {report['fp32_ms_per_segment']:.1f} ms, int8 {report['int8_ms_per_segment']:.1f} ms")
+    print(f"  model size          : fp32 {report['fp32_size_mb']:.0f} MB, int8 {report['int8_size_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="int8 vs fp32 agreement report")
+    parser.add_argument("--audio", default=None)
+    parser.add_argument("--model", choices=["emotion", "stutter", "all"], default="all")
+    parser.add_argument("--clips", type=int, default=50)
+    args = parser.parse_args()
+
+    clips = make_clips(args.audio, args.clips)
+    if args.model in ("emotion", "all"):
+        print_report("emotion", report_emotion(clips))
+    if args.model in ("stutter", "all"):
+        print_report("stutter", report_stutter(clips))
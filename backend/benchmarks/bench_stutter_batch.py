@@ -0,0 +1,88 @@
+"""
+結巴模型：逐段 pipeline vs batch 推論
+
+用法（在 backend 目錄下執行）：
+    python -m benchmarks.bench_stutter_batch --audio data/lecture.wav --segments 200 --batch-sizes 1 4 8 16 --pad-ratios 1.0 1.25 2.0
+
+長度分布模擬 Whisper 語段（對數常態，中位數約 3 秒，截在 0.5–15 秒）。
+給 --audio 時從真實音檔切片，否則使用合成雜訊。輸出每秒處理的語段數、
+與逐段 pipeline 的標籤一致率與分數最大差（在計時區段外計算）。--pad-ratios 為同一批最長 / 最短的上限：
+1.0 只讓同長度的 clip 同批（結果與逐段相同），比例越大 batch 越滿、GroupNorm 經過的補零也越多。
+"""
+import argparse
+import time
+import numpy as np
+from models.prosody_analyzer import get_stutter_pipeline, stutter_predict_batch
+from models.audio_buffer import AudioBuffer
+from models.quantization import agreement_report
+
+
+def make_clips(n, rng, audio=None, sample_rate=16000, median_seconds=3.0, sigma=0.6, low=0.5, high=15.0):
+    clips = []
+    for seconds in np.clip(rng.lognormal(np.log(median_seconds), sigma, size=n), low, high):
+        length = int(seconds * sample_rate)
+        if audio is not None and len(audio) > length:
+            start = rng.integers(0, len(audio) - length)
+            clips.append(audio[start:start + length])
+        else:
+            clips.append((rng.standard_normal(length) * 0.05).astype(np.float32))
+    return clips
+
+
+def _as_results(outputs):
+    return [(out[0]["label"], out[0]["score"], {res["label"]: res["score"] for res in out}) for out in outputs]
+
+
+def time_fn(fn, repeats):
+    best = float("inf")
+    results = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        results = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, results
+
+
+def run_benchmark(clips, batch_sizes, max_padded_seconds, repeats=3, runtime=None, pad_ratios=(None,)):
+    pipe = get_stutter_pipeline(runtime)
+    pipe(clips[0])  # warm-up
+    audio_seconds = sum(len(c) for c in clips) / 16000
+
+    pipeline_time, reference = time_fn(lambda: [pipe(clip) for clip in clips], repeats)
+    reference = _as_results(reference)
+    print(f"{len(clips)} segments, {audio_seconds:.1f}s audio")
+    print(f"per-segment pipeline : {pipeline_time:.2f}s ({len(clips) / pipeline_time:.1f} seg/s)")
+
+    report = {"pipeline_seconds": pipeline_time, "batched": {}}
+    for pad_ratio in pad_ratios:
+        for batch_size in batch_sizes:
+            # 比對關閉（check_rate=0），計時只包含 batch 推論
+            elapsed, outputs = time_fn(lambda: stutter_predict_batch(clips, pipe, max_batch_size=batch_size,
+                                                                     max_padded_seconds=max_padded_seconds,
+                                                                     max_pad_ratio=pad_ratio, check_rate=0),
+                                      repeats)
+            agreement = agreement_report(reference, _as_results(outputs))
+            report["batched"][(pad_ratio, batch_size)] = {"seconds": elapsed, **agreement}
+            print(f"ratio {pad_ratio or 'default'} batch {batch_size:>3}: {elapsed:.2f}s ({len(clips) / elapsed:.1f} seg/s, "
+                  f"{pipeline_time / elapsed:.1f}x), label agreement {agreement['label_agreement']:.1%}, "
+                  f"max score delta {agreement['max_score_delta']:.4f}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-segment vs batched stutter inference")
+    parser.add_argument("--audio", default=None)
+    parser.add_argument("--segments", type=int, default=100)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--max-padded-seconds", type=float, default=30.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--runtime", choices=["torch", "onnx", "int8"], default=None)
+    parser.add_argument("--pad-ratios", type=float, nargs="+", default=[None],
+                        help="Max longest/shortest length ratio within a batch (default: STUTTER_MAX_PAD_RATIO)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    audio = AudioBuffer.from_file(args.audio).audio if args.audio else None
+    run_benchmark(make_clips(args.segments, rng, audio), args.batch_sizes, args.max_padded_seconds,
+                  repeats=args.repeats, runtime=args.runtime, pad_ratios=args.pad_ratios)
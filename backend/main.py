@@ -1,15 +1,26 @@
+import time
+_process_start = time.perf_counter()  # 用來計算 cold start 時間
+
 import numpy as np
 import os
 import random
 import sys
 import json
 import hashlib
+from collections import deque
+from concurrent.futures import Future
 from datetime import datetime
-from models.cloud_and_transcription import download_file_from_cloud, extract_audio_from_video, transcribe_audio_to_sentences, convert_m4a_to_wav
-from models.audio_emotion_classifier import predict, processor, model
-from models.prosody_analyzer import analyze_prosody, analyze_stuttering,convert_to_json_serializable
+from models.cloud_and_transcription import download_file_from_cloud, extract_audio_from_video, transcribe_audio_to_sentences, stream_transcribe_audio, convert_m4a_to_wav
+from models.whisper_pool import warmup_whisper, pool_stats, DEFAULT_MODEL_SIZE
+from models.model_registry import model_stats
+from models.audio_buffer import AudioBuffer
+from models.feature_store import get_or_compute_tracks, load_tracks
+from models.cache_store import open_cache_store, start_cache_sweeper, cache_stats, segment_key, segment_prefix, parse_segment_key, nearest_segment, record_segment_reuse, CACHE_MATCH_TOLERANCE
+from models.fingerprint import file_fingerprint, fingerprint_stats
+from models.parallel_prosody import ParallelProsodyExecutor, resolve_workers
+from models.prosody_analyzer import analyze_prosody, analyze_stuttering, cascade_stats, stutter_batch_stats, convert_to_json_serializable
 import requests
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 
 class Logger:
     def __init__(self, filepath):
@@ -29,56 +40,99 @@ class Logger:
         self.log.flush()
 
 class AudioAnalysisCache:
-    def __init__(self, cache_file="cache/cache_data.json"):
+    def __init__(self, cache_file="cache/cache_data.json", backend=None):
+        # backend: "sqlite"（預設，逐筆寫入，第一次開啟時匯入 cache_file）或 "json"（原本整份改寫的方式）
         self.cache_file = cache_file
         os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-        self.cache_data = self._load_cache()
-
-    def _load_cache(self):
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, "r", encoding="utf-8") as f:
-                    content = f.read().strip()
-                    if not content:
-                        print(f"Cache file {self.cache_file} is empty, initializing with empty dict")
-                        return {}
-                    return json.loads(content)
-            except json.JSONDecodeError as e:
-                print(f"Failed to decode cache file {self.cache_file}: {str(e)}. Initializing with empty dict")
-                return {}
-            except Exception as e:
-                print(f"Error reading cache file {self.cache_file}: {str(e)}. Initializing with empty dict")
-                return {}
-        print(f"Cache file {self.cache_file} does not exist, initializing with empty dict")
-        return {}
-
-    def _save_cache(self):
-        with open(self.cache_file, "w", encoding="utf-8") as f:
-            json.dump(self.cache_data, f, ensure_ascii=False, indent=2)
-
-    def _generate_cache_key(self, file_path, start_time=None, end_time=None):
-        with open(file_path, "rb") as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()
+        self.store = open_cache_store(cache_file, backend)
+        start_cache_sweeper(cache_file, backend)
+
+    def batch(self):
+        """
+        with cache.batch(): 區塊內的寫入合併 commit（一個請求一次，而不是每個語段一次）
+        """
+        return self.store.batch()
+
+    def entries(self, prefix=""):
+        # 依寫入順序回傳 key 以 prefix 開頭的 (key, {"timestamp", "results"})
+        return self.store.items(prefix)
+
+    def segments(self, fingerprint, pitch_tracker=None, prosody_mode=None):
+        # 該音檔在指定追蹤器與模式下所有語段快取的 (key, {"timestamp", "results"})，依 (start, end) 排序，只讀這個音檔的項目
+        # 不同斷句對同一段各存一份（起訖時間都在 CACHE_MATCH_TOLERANCE 內）時只回傳最近寫入的那份
+        kept = []
+        for key, entry in self.store.segments(segment_prefix(fingerprint, pitch_tracker, prosody_mode)):
+            _, start, end = parse_segment_key(key)
+            duplicate = None
+            for j in range(len(kept) - 1, -1, -1):
+                if start - kept[j][1] > CACHE_MATCH_TOLERANCE:
+                    break
+                if abs(end - kept[j][2]) <= CACHE_MATCH_TOLERANCE:
+                    duplicate = j
+                    break
+            if duplicate is None:
+                kept.append((key, start, end, entry))
+            elif entry["timestamp"] > kept[duplicate][3]["timestamp"]:
+                kept[duplicate] = (key, start, end, entry)
+        return [(key, entry) for key, _, _, entry in kept]
+
+    def _generate_cache_key(self, file_path, start_time=None, end_time=None, fingerprint=None, pitch_tracker=None, prosody_mode=None):
+        # fingerprint：呼叫端已取得的 file_fingerprint(file_path)，傳入時不再查表
+        # 語段 key 包含音高追蹤器與 prosody 模式（"segments"、"tracks"，雲端路徑為 "analysis"），
+        # 起訖時間量化到 CACHE_TIME_RESOLUTION，斷句的微小浮點差異仍對到同一個 key
+        file_hash = fingerprint or file_fingerprint(file_path)
         if start_time is not None and end_time is not None:
-            return f"{file_hash}_{start_time}_{end_time}"
+            return segment_key(file_hash, start_time, end_time, pitch_tracker, prosody_mode)
         return file_hash
 
-    def get_cached_result(self, file_path, start_time=None, end_time=None):
-        cache_key = self._generate_cache_key(file_path, start_time, end_time)
-        cached_data = self.cache_data.get(cache_key)
-        if cached_data:
-            cache_time = datetime.fromisoformat(cached_data["timestamp"])
-            if (datetime.now() - cache_time).days < 7:
-                return cached_data["results"]
-        return None
-
-    def save_to_cache(self, file_path, results, start_time=None, end_time=None):
-        cache_key = self._generate_cache_key(file_path, start_time, end_time)
-        self.cache_data[cache_key] = {
+    def get_cached_result(self, file_path, start_time=None, end_time=None, fingerprint=None, pitch_tracker=None, prosody_mode=None):
+        cache_key = self._generate_cache_key(file_path, start_time, end_time, fingerprint, pitch_tracker, prosody_mode)
+        cached_data = self.store.get(cache_key)  # 超過 CACHE_TTL_DAYS 的項目回傳 None
+        return cached_data["results"] if cached_data else None
+
+    def get_near_prosody(self, file_path, start_time, end_time, fingerprint=None, pitch_tracker=None, prosody_mode=None):
+        """
+        起訖時間都在 CACHE_MATCH_TOLERANCE 內的既有語段的 pitch / energy 統計（與斷句無關的數值），沒有時回傳 None
+        text、Duration、segment_index 來自另一次斷句，不沿用，由呼叫端依目前的語段重新填入後存到自己的 key（原本的 key 保留）
+        """
+        prefix = segment_prefix(fingerprint or file_fingerprint(file_path), pitch_tracker, prosody_mode)
+        near = nearest_segment(self.store, prefix, start_time, end_time)
+        if near is None:
+            return None
+        near_key, near_data = near
+        pitch_feedback = near_data["results"].get("pitch_feedback")
+        if not isinstance(pitch_feedback, list) or not pitch_feedback:
+            return None
+        print(f"Reusing cached prosody of {near_key} for segment {start_time}-{end_time}")
+        return {name: pitch_feedback[0].get(name, 0) for name in ("Pitch Mean", "Pitch Variation", "Energy Mean", "Energy Variation")}
+
+    def save_to_cache(self, file_path, results, start_time=None, end_time=None, fingerprint=None, pitch_tracker=None, prosody_mode=None):
+        cache_key = self._generate_cache_key(file_path, start_time, end_time, fingerprint, pitch_tracker, prosody_mode)
+        self.store.put(cache_key, {
             "timestamp": datetime.now().isoformat(),
             "results": results,
-        }
-        self._save_cache()
+        })
+
+    def _generate_transcript_key(self, file_path, model_size=None, language=None, word_timestamps=True, fingerprint=None):
+        # 以 "transcript_" 開頭，避免和以音檔 hash 開頭的語段快取混在一起
+        file_hash = self._generate_cache_key(file_path, fingerprint=fingerprint)
+        return f"transcript_{file_hash}_{model_size or DEFAULT_MODEL_SIZE}_{language or 'auto'}_{int(bool(word_timestamps))}"
+
+    def get_cached_transcript(self, file_path, model_size=None, language=None, word_timestamps=True, fingerprint=None):
+        cache_key = self._generate_transcript_key(file_path, model_size, language, word_timestamps, fingerprint)
+        cached_data = self.store.get(cache_key)  # 超過 CACHE_TTL_DAYS 的項目回傳 None
+        return cached_data["results"] if cached_data else None
+
+    def save_transcript(self, file_path, sentences, segments, word_timestamps, model_size=None, language=None, include_word_timestamps=True, fingerprint=None):
+        cache_key = self._generate_transcript_key(file_path, model_size, language, include_word_timestamps, fingerprint)
+        self.store.put(cache_key, {
+            "timestamp": datetime.now().isoformat(),
+            "results": convert_to_json_serializable({
+                "sentences": sentences,
+                "segments": segments,
+                "word_timestamps": word_timestamps,
+            }),
+        })
 
 def process_local_audio(cache=None):
     if cache is None:
@@ -100,7 +154,7 @@ def process_local_audio(cache=None):
     else:
         print(f"No .wav files found in {data_folder}")
 
-def process_speech_from_cloud(file_url, cache=None):
+def process_speech_from_cloud(file_url, cache=None, emotion_mode="segments"):
     if cache is None:
         cache = AudioAnalysisCache()
     
@@ -114,7 +168,7 @@ def process_speech_from_cloud(file_url, cache=None):
         convert_m4a_to_wav(m4a_audio_path, wav_audio_path)
 
     print("Running Whisper to divide sentences...\n")
-    sentences, segments = transcribe_audio_to_sentences(wav_audio_path)
+    sentences, segments, _ = transcribe_audio_to_sentences(wav_audio_path)
     combined_segments = []
     for i in range(0, len(segments), 2):
         segment = {"text": segments[i]['text'], "start": segments[i]['start'], "end": segments[i]['end']}
@@ -124,21 +178,50 @@ def process_speech_from_cloud(file_url, cache=None):
         combined_segments.append(segment)
 
     print("Running analysis on segments...\n")
-    for segment in combined_segments:
-        cached_results = cache.get_cached_result(wav_audio_path, start_time=segment['start'], end_time=segment['end'])
-        if cached_results:
-            print(f"Using cached results for: {segment['text']}")
-            print_analysis_results(cached_results)
-            continue
-        print(f"Running new analysis for: {segment['text']}")
-        results = run_analysis(wav_audio_path, start_time=segment['start'], end_time=segment['end'])
-        results['text'] = segment['text']
-        cache.save_to_cache(wav_audio_path, results, start_time=segment['start'], end_time=segment['end'])
-        print_analysis_results(results)
+    fingerprint = file_fingerprint(wav_audio_path)
+    cached = [
+        cache.get_cached_result(wav_audio_path, start_time=segment['start'], end_time=segment['end'], fingerprint=fingerprint,
+                                prosody_mode="analysis")
+        for segment in combined_segments
+    ]
+    # 未命中快取的語段一次批次跑情緒模型
+    from models.audio_emotion_classifier import predict_batch, emotion_timeline, aggregate_timeline, get_emotion_model
+    pending = [segment for segment, cached_results in zip(combined_segments, cached) if not cached_results]
+    processor, model = get_emotion_model()
+    pending_ranges = [(seg['start'], seg['end']) for seg in pending]
+    if not pending:
+        emotions = []
+    elif emotion_mode == "timeline":
+        # 固定窗口滑過整段錄音，長語段不會只被截取前 6 秒
+        timeline = emotion_timeline(wav_audio_path, processor, model)
+        emotions = aggregate_timeline(timeline, pending_ranges)
+    else:
+        emotions = predict_batch(pending_ranges, processor, model, path=wav_audio_path,
+                                 padding="longest", bucket_by_length=True)
+    emotion_by_segment = {id(seg): emotion for seg, emotion in zip(pending, emotions)}
 
-def run_analysis(audio_path, start_time=None, end_time=None):
+    with cache.batch():
+        for segment, cached_results in zip(combined_segments, cached):
+            if cached_results:
+                print(f"Using cached results for: {segment['text']}")
+                print_analysis_results(cached_results)
+                continue
+            print(f"Running new analysis for: {segment['text']}")
+            record_segment_reuse("recomputed")
+            results = run_analysis(wav_audio_path, start_time=segment['start'], end_time=segment['end'], emotion=emotion_by_segment[id(segment)])
+            results['text'] = segment['text']
+            cache.save_to_cache(wav_audio_path, results, start_time=segment['start'], end_time=segment['end'], fingerprint=fingerprint,
+                                prosody_mode="analysis")
+            print_analysis_results(results)
+
+def run_analysis(audio_path, start_time=None, end_time=None, emotion=None):
     results = {'emotion_analysis': {}, 'prosody_analysis': {}}
-    emotion, score, emotion_scores = predict(audio_path, processor, model, start_time=start_time, end_time=end_time)
+    if emotion is None:
+        # 情緒模型只有這條路徑會用到，延遲到第一次分析時才 import 與載入；與多段批次推論走同一個 predict_batch
+        from models.audio_emotion_classifier import predict_batch, get_emotion_model
+        processor, model = get_emotion_model()
+        emotion = predict_batch([(start_time, end_time)], processor, model, path=audio_path)[0]
+    emotion, score, emotion_scores = emotion
     results['emotion_analysis'] = {
         'primary_emotion': emotion,
         'primary_score': float(score),
@@ -175,9 +258,12 @@ def print_analysis_results(results):
                 print(f"{feature}: {value:.2f}")
     print("\n")
 
-def analyze_pitch_segments(cache, audio_path=None, cache_data=None, threshold=15, gender="male", target_style="default", target_speed="standard"):
+def analyze_pitch_segments(cache, audio_path=None, cache_data=None, threshold=15, gender="male", target_style="default", target_speed="standard", tracks=None, fingerprint=None, pitch_tracker=None, prosody_mode=None):
     """
     Analyze pitch segments and provide style- and speed-specific feedback.
+    - fingerprint: Optional content hash of audio_path (file_fingerprint), to avoid re-deriving it.
+    - pitch_tracker / prosody_mode: Which cached segments to read ('pyin' / 'yin', 'segments' / 'tracks'); defaults match process_speech_stream.
+    - tracks: Optional FrameTracks of the recording; pitch and energy are then read from the frame tracks for each segment's time range.
     - threshold: Base threshold for low pitch variation (default 15 Hz).
     - gender: Optional 'male' or 'female' to adjust thresholds slightly.
     - target_style: 'default' or 'passionate' to provide style-specific suggestions.
@@ -222,15 +308,11 @@ def analyze_pitch_segments(cache, audio_path=None, cache_data=None, threshold=15
 
     # Load cache data (保持不變)
     if audio_path:
-        base_hash = hashlib.md5(open(audio_path, 'rb').read()).hexdigest()
-        if not os.path.exists(cache.cache_file):
-            print(f"No cache file found: {cache.cache_file}")
-            return []
+        base_hash = fingerprint or file_fingerprint(audio_path)
         try:
-            with open(cache.cache_file, "r", encoding='utf-8') as f:
-                all_cached_data = json.load(f)
+            all_cached_data = dict(cache.segments(base_hash, pitch_tracker, prosody_mode))
         except Exception as e:
-            print(f"Error reading cache file: {str(e)}")
+            print(f"Error reading cache: {str(e)}")
             return []
     elif cache_data:
         all_cached_data = cache_data
@@ -244,6 +326,8 @@ def analyze_pitch_segments(cache, audio_path=None, cache_data=None, threshold=15
             results = cached_data.get("results", {})
             if "pitch_feedback" in results and results["pitch_feedback"]:
                 pitch_entry = results["pitch_feedback"][0]
+                if tracks is not None:
+                    pitch_entry = dict(pitch_entry, **tracks.prosody(pitch_entry["start_time"], pitch_entry["end_time"]))
                 pitch_variance = pitch_entry["Pitch Variation"]
                 if pitch_variance is not None and pitch_variance > 0:
                     segment_data = {
@@ -396,105 +480,306 @@ def send_to_api(endpoint, data):
     except requests.exceptions.RequestException as e:
         print(f"Failed to send data to {endpoint}: {str(e)}")
 
-def process_speech_from_file(file_path, cache=None, gender=None, target_style="default", target_speed="standard"):
+def iter_transcribed_segments(wav_audio_path, cache=None, streaming=False, audio=None, fingerprint=None):
+    """
+    依序產生 (segment, words)。streaming=True 時每個語段一解碼完成就產生，
+    不必等整個音檔轉錄結束。有 cache 時先查逐字稿快取，轉錄完成後寫回。
+    audio 為已解碼的 AudioBuffer 時，Whisper 直接使用它而不再解碼一次。
+    """
+    cached_transcript = cache.get_cached_transcript(wav_audio_path, fingerprint=fingerprint) if cache is not None else None
+    if cached_transcript:
+        print("Using cached transcript")
+        for segment in cached_transcript["segments"]:
+            yield segment, segment.get("words", [])
+        return
+
+    if streaming:
+        sentences, segments, word_timestamps = [], [], []
+        for sentence, segment, words in stream_transcribe_audio(audio if audio is not None else wav_audio_path):
+            sentences.append(sentence)
+            segments.append(segment)
+            word_timestamps.extend({"word": w["word"], "start": w["start"], "end": w["end"]} for w in words)
+            yield segment, words
+        if cache is not None:
+            cache.save_transcript(wav_audio_path, sentences, segments, word_timestamps, fingerprint=fingerprint)
+    else:
+        sentences, segments, word_timestamps = transcribe_audio_to_sentences(audio if audio is not None else wav_audio_path)
+        if cache is not None:
+            cache.save_transcript(wav_audio_path, sentences, segments, word_timestamps, fingerprint=fingerprint)
+        for segment in segments:
+            yield segment, segment.get("words", [])
+
+def analyze_segment_prosody(cache, wav_audio_path, segment_index, segment, audio=None, pitch_tracker=None, tracks=None, fingerprint=None, tracks_stored=False):
+    """
+    單一語段的 prosody 分析（先查快取），回傳 (cache_key, results, prosody)；無有效結果時回傳 None
+    audio 為整個請求共用的 AudioBuffer，沒有時從 wav_audio_path 讀取該段
+    tracks_stored：tracks 是從 feature store 開啟的（不是這次請求才算的），由這份軌跡取得的語段記為 "tracks" 重用
+    """
+    prosody_mode = "segments" if tracks is None else "tracks"
+    cache_key = cache._generate_cache_key(wav_audio_path, segment["start"], segment["end"], fingerprint, pitch_tracker, prosody_mode)
+    cached_results = cache.get_cached_result(wav_audio_path, segment["start"], segment["end"], fingerprint, pitch_tracker, prosody_mode)
+    if cached_results:
+        print(f"Using cached results for segment {segment['start']}-{segment['end']}")
+        if "pitch_feedback" not in cached_results or not isinstance(cached_results["pitch_feedback"], list) or not cached_results["pitch_feedback"]:
+            print(f"Warning: Invalid cached results for {cache_key}, skipping: {cached_results}")
+            return None
+        return cache_key, cached_results, cached_results["pitch_feedback"][0]
+
+    near_prosody = cache.get_near_prosody(wav_audio_path, segment["start"], segment["end"], fingerprint, pitch_tracker, prosody_mode)
+    if near_prosody is not None:
+        record_segment_reuse("near")
+        prosody = dict(near_prosody, Duration=segment["end"] - segment["start"])
+        return store_segment_prosody(cache, wav_audio_path, segment_index, segment, prosody, cache_key, fingerprint,
+                                     pitch_tracker, prosody_mode)
+
+    print(f"Running new analysis for segment {segment['start']}-{segment['end']}: {segment['text']}")
+    record_segment_reuse("tracks" if tracks is not None and tracks_stored else "recomputed")
+    prosody = analyze_prosody(audio if audio is not None else wav_audio_path, start_time=segment["start"], end_time=segment["end"], pitch_tracker=pitch_tracker, tracks=tracks)
+    return store_segment_prosody(cache, wav_audio_path, segment_index, segment, prosody, cache_key, fingerprint,
+                                 pitch_tracker, prosody_mode)
+
+def store_segment_prosody(cache, wav_audio_path, segment_index, segment, prosody, cache_key=None, fingerprint=None, pitch_tracker=None, prosody_mode=None):
+    """
+    將算好的 prosody 整理成 pitch_feedback 並寫入快取，回傳 (cache_key, results, prosody)；無效時回傳 None
+    """
+    print(f"Prosody for '{segment['text']}': {prosody}")
+    if not prosody or "Pitch Variation" not in prosody:
+        print(f"Warning: No valid prosody data for segment {segment['start']}-{segment['end']}")
+        return None
+    pitch_entry = {
+        "segment_index": segment_index,
+        "text": segment["text"],
+        "Duration": prosody.get("Duration", 0),
+        "Pitch Mean": prosody.get("Pitch Mean", 0),
+        "Pitch Variation": prosody.get("Pitch Variation", 0),
+        "Energy Mean": prosody.get("Energy Mean", 0),
+        "Energy Variation": prosody.get("Energy Variation", 0),
+        "start_time": segment["start"],
+        "end_time": segment["end"]
+    }
+    results = {
+        "text": segment["text"],
+        "pitch_feedback": [pitch_entry]
+    }
+    cache.save_to_cache(wav_audio_path, results, segment["start"], segment["end"], fingerprint, pitch_tracker, prosody_mode)
+    if cache_key is None:
+        cache_key = cache._generate_cache_key(wav_audio_path, segment["start"], segment["end"], fingerprint, pitch_tracker, prosody_mode)
+    return cache_key, results, prosody
+
+def submit_segment_prosody(cache, wav_audio_path, segment_index, segment, executor=None, audio=None, pitch_tracker=None, tracks=None, fingerprint=None, tracks_stored=False):
+    """
+    回傳 (future, finish)：finish(future.result()) 的結果同 analyze_segment_prosody
+    有 executor 且快取未命中時交給 process pool 計算，由呼叫端依語段順序 finish（寫入快取）；否則在主程序直接計算
+    """
+    if executor is not None and tracks is None \
+            and not cache.get_cached_result(wav_audio_path, segment["start"], segment["end"], fingerprint, pitch_tracker) \
+            and cache.get_near_prosody(wav_audio_path, segment["start"], segment["end"], fingerprint, pitch_tracker) is None:
+        print(f"Submitting segment {segment['start']}-{segment['end']} to prosody pool: {segment['text']}")
+        record_segment_reuse("recomputed")
+        return executor.submit(segment["start"], segment["end"]), \
+            lambda prosody: store_segment_prosody(cache, wav_audio_path, segment_index, segment, prosody, fingerprint=fingerprint,
+                                                  pitch_tracker=pitch_tracker)
+    future = Future()
+    future.set_result(analyze_segment_prosody(cache, wav_audio_path, segment_index, segment, audio=audio, pitch_tracker=pitch_tracker,
+                                              tracks=tracks, fingerprint=fingerprint, tracks_stored=tracks_stored))
+    return future, lambda analyzed: analyzed
+
+def process_speech_stream(file_path, cache=None, gender=None, target_style="default", target_speed="standard", streaming=True, pitch_tracker=None, prosody_mode="segments", prosody_workers=None, stutter_mode=None, stutter_cascade=None, reuse_stored_tracks=False, emotion_mode=None):
+    """
+    轉錄 → prosody → 快取寫入的管線，逐段 yield 結果，最後 yield 完整結果
+    prosody_mode="tracks" 時整個音檔的 pitch / RMS 軌跡只算一次（存進 feature store，同一音檔下次直接開啟），每段的統計由前綴和取得
+    prosody_workers > 1 時各段的 prosody 在 process pool 平行計算，結果與快取寫入仍依語段順序
+    reuse_stored_tracks=True 時，若 feature store 已有這個音檔的整檔軌跡（先前以 tracks 模式跑過），整個請求改以 tracks 模式執行，
+    不重新追蹤音高；整檔軌跡是對整個音檔做 peak normalize 後追蹤，pyin 的有聲判定也以整段解碼，
+    Pitch / Energy 數值與逐段 analyze_prosody 不同，因此預設關閉，且結果只讀寫 tracks 模式的快取，不會混入 segments 模式
+    stutter_mode="timeline" 時結巴模型改跑固定長度窗口，結果另外附上 run-length 的結巴區段（stutter_regions）；
+    同時開啟 cascade 時窗口只涵蓋送進模型的語段，stutter_regions_partial 為 True
+    stutter_cascade=True 時結巴模型只推論規則標記的語段，結果附上 skip rate 等指標（stutter_cascade）
+    emotion_mode="timeline" 時情緒模型以固定窗口滑過整段錄音（批次推論），結果附上窗口分數（emotion_timeline）
+    與每個語段依重疊長度加權的情緒（segment_emotions）；None 時不跑情緒模型
+
+    Yields:
+    - {"type": "segment", "transcription": ..., "pitch": ...}：每個有效語段分析完成時
+    - {"type": "result", ...}：stutter 與 pitch 總結（內容同 process_speech_from_file 的回傳值）
+    """
     if cache is None:
         cache = AudioAnalysisCache()
+    if emotion_mode not in (None, "timeline"):
+        raise ValueError(f"Unknown emotion mode: {emotion_mode}. Supported modes: ['timeline']")
 
     wav_audio_path = "data/temp_audio.wav"
-    try:
-        if file_path.endswith(".m4a"):
-            print(f"Converting {file_path} to WAV...")
-            convert_m4a_to_wav(file_path, wav_audio_path)
-        else:
-            wav_audio_path = file_path
-            print(f"Using {file_path} directly as WAV file")
-
-        print(f"File size: {os.path.getsize(wav_audio_path)} bytes")
-        print("Running Whisper to divide sentences...\n")
-        sentences, segments, word_timestamps = transcribe_audio_to_sentences(wav_audio_path)
-        if not segments:
-            raise ValueError("No segments found in audio transcription")
-        print(f"Transcription completed: {len(segments)} segments")
-
-        combined_segments = [
-            seg for seg in segments
-            if seg["text"].strip() and (seg["end"] - seg["start"]) > 0.1
-        ]
-        if not combined_segments:
-            raise ValueError("No valid segments after filtering")
-        print(f"Valid segments after filtering: {len(combined_segments)}")
-
-        transcriptions = [
-            {
-                "segment_index": i + 1,
-                "text": segment["text"],
-                "start_time": segment["start"],
-                "end_time": segment["end"]
-            }
-            for i, segment in enumerate(combined_segments)
-        ]
-
-        analysis_results = {}
-        prosody_results = []
-
-        for i, segment in enumerate(combined_segments):
-            cache_key = cache._generate_cache_key(wav_audio_path, segment["start"], segment["end"])
-            cached_results = cache.get_cached_result(wav_audio_path, segment["start"], segment["end"])
-            if cached_results:
-                print(f"Using cached results for segment {segment['start']}-{segment['end']}")
-                if "pitch_feedback" not in cached_results or not isinstance(cached_results["pitch_feedback"], list) or not cached_results["pitch_feedback"]:
-                    print(f"Warning: Invalid cached results for {cache_key}, skipping: {cached_results}")
-                    continue
-                analysis_results[cache_key] = {"timestamp": datetime.now().isoformat(), "results": cached_results}
-                prosody_results.append(cached_results["pitch_feedback"][0])
+    # 整個請求的快取寫入合併 commit（sqlite 後端）或只改寫一次檔案（json 後端）
+    with cache.batch():
+        executor = None
+        try:
+            if file_path.endswith(".m4a"):
+                print(f"Converting {file_path} to WAV...")
+                convert_m4a_to_wav(file_path, wav_audio_path)
             else:
-                print(f"Running new analysis for segment {segment['start']}-{segment['end']}: {segment['text']}")
-                prosody = analyze_prosody(wav_audio_path, start_time=segment["start"], end_time=segment["end"])
-                print(f"Prosody for '{segment['text']}': {prosody}")
-                if prosody and "Pitch Variation" in prosody:
+                wav_audio_path = file_path
+                print(f"Using {file_path} directly as WAV file")
+
+            print(f"File size: {os.path.getsize(wav_audio_path)} bytes")
+            # 音檔只 hash 一次，之後所有快取 key 都使用這個指紋
+            fingerprint = file_fingerprint(wav_audio_path)
+            # 整個請求只解碼一次，轉錄與各分析器都使用這份波形的切片
+            audio_buffer = AudioBuffer.from_file(wav_audio_path)
+            # tracks_stored：軌跡是從 feature store 開啟的，這次請求不必重新追蹤音高
+            tracks = None
+            if prosody_mode == "tracks" or reuse_stored_tracks:
+                tracks = load_tracks(fingerprint, pitch_tracker=pitch_tracker)
+            tracks_stored = tracks is not None
+            if tracks_stored and prosody_mode != "tracks":
+                print(f"Reusing stored frame tracks for {fingerprint}: running in tracks mode")
+                prosody_mode = "tracks"
+            elif prosody_mode == "tracks" and tracks is None:
+                tracks = get_or_compute_tracks(audio_buffer, fingerprint, pitch_tracker=pitch_tracker)
+            if tracks is None and resolve_workers(prosody_workers) > 1:
+                executor = ParallelProsodyExecutor(audio_buffer, workers=prosody_workers, pitch_tracker=pitch_tracker)
+            print("Running Whisper to divide sentences...\n")
+
+            total_segments = 0
+            combined_segments = []
+            word_timestamps = []
+            transcriptions = []
+            analysis_results = {}
+            prosody_results = []
+            pending = deque()  # 已送出、依語段順序等待完成的 (transcription, future, finish)
+
+            def finish_segment(transcription, future, finish):
+                analyzed = finish(future.result())
+                pitch_entry = None
+                if analyzed:
+                    cache_key, results, prosody = analyzed
                     prosody_results.append(prosody)
-                    pitch_entry = {
-                        "segment_index": i + 1,
-                        "text": segment["text"],
-                        "Duration": prosody.get("Duration", 0),
-                        "Pitch Mean": prosody.get("Pitch Mean", 0),
-                        "Pitch Variation": prosody.get("Pitch Variation", 0),
-                        "Energy Mean": prosody.get("Energy Mean", 0),
-                        "Energy Variation": prosody.get("Energy Variation", 0),
-                        "start_time": segment["start"],
-                        "end_time": segment["end"]
-                    }
-                    results = {
-                        "text": segment["text"],
-                        "pitch_feedback": [pitch_entry]
-                    }
-                    cache.save_to_cache(wav_audio_path, results, segment["start"], segment["end"])
                     analysis_results[cache_key] = {"timestamp": datetime.now().isoformat(), "results": results}
-                else:
-                    print(f"Warning: No valid prosody data for segment {segment['start']}-{segment['end']}")
-
-        stutter_feedback = analyze_stuttering(combined_segments, prosody_results, word_timestamps, wav_audio_path) if prosody_results else []
-        print(f"Stutter feedback: {stutter_feedback}")
-
-        # 將 target_speed 傳遞給 analyze_pitch_segments
-        pitch_feedback = analyze_pitch_segments(cache, audio_path=wav_audio_path, threshold=15, gender="male", target_style=target_style, target_speed=target_speed)
-        print(f"Pitch feedback: {pitch_feedback}")
+                    pitch_entry = results["pitch_feedback"][0]
+                return {
+                    "type": "segment",
+                    "transcription": convert_to_json_serializable(transcription),
+                    "pitch": convert_to_json_serializable(pitch_entry)
+                }
 
-        if wav_audio_path != file_path and os.path.exists(wav_audio_path):
-            os.remove(wav_audio_path)
-            print(f"Cleaned up temporary file: {wav_audio_path}")
+            for segment, words in iter_transcribed_segments(wav_audio_path, cache, streaming=streaming, audio=audio_buffer, fingerprint=fingerprint):
+                total_segments += 1
+                word_timestamps.extend({"word": w["word"], "start": w["start"], "end": w["end"]} for w in words)
+                if not segment["text"].strip() or (segment["end"] - segment["start"]) <= 0.1:
+                    continue
 
-        return {
-            "transcriptions": convert_to_json_serializable(transcriptions),
-            "pitch_feedback": convert_to_json_serializable(pitch_feedback),
-            "stutter_feedback": convert_to_json_serializable(stutter_feedback)
-        }
-    except Exception as e:
-        print(f"Error in process_speech_from_file: {str(e)}")
-        raise
+                combined_segments.append(segment)
+                transcription = {
+                    "segment_index": len(combined_segments),
+                    "text": segment["text"],
+                    "start_time": segment["start"],
+                    "end_time": segment["end"]
+                }
+                transcriptions.append(transcription)
+
+                future, finish = submit_segment_prosody(cache, wav_audio_path, len(combined_segments), segment, executor=executor,
+                                                        audio=audio_buffer, pitch_tracker=pitch_tracker, tracks=tracks,
+                                                        fingerprint=fingerprint, tracks_stored=tracks_stored)
+                pending.append((transcription, future, finish))
+                # 只輸出最前面已完成的段落，保持順序
+                while pending and pending[0][1].done():
+                    yield finish_segment(*pending.popleft())
+
+            while pending:
+                yield finish_segment(*pending.popleft())
+
+            if not total_segments:
+                raise ValueError("No segments found in audio transcription")
+            print(f"Transcription completed: {total_segments} segments")
+            if not combined_segments:
+                raise ValueError("No valid segments after filtering")
+            print(f"Valid segments after filtering: {len(combined_segments)}")
+
+            stutter_details = {}
+            stutter_feedback = analyze_stuttering(combined_segments, prosody_results, word_timestamps, audio_buffer,
+                                                  mode=stutter_mode, cascade=stutter_cascade,
+                                                  details=stutter_details) if prosody_results else []
+            timeline = stutter_details.get("timeline")
+            print(f"Stutter feedback: {stutter_feedback}")
+
+            # 將 target_speed 傳遞給 analyze_pitch_segments
+            pitch_feedback = analyze_pitch_segments(cache, audio_path=wav_audio_path, threshold=15, gender="male", target_style=target_style, target_speed=target_speed, tracks=tracks, fingerprint=fingerprint,
+                                                    pitch_tracker=pitch_tracker, prosody_mode=prosody_mode)
+            print(f"Pitch feedback: {pitch_feedback}")
+
+            emotions = None
+            segment_emotions = None
+            if emotion_mode == "timeline":
+                from models.audio_emotion_classifier import emotion_timeline, aggregate_timeline, get_emotion_model
+                processor, model = get_emotion_model()
+                emotions = emotion_timeline(audio_buffer, processor, model)
+                segment_emotions = [
+                    {"segment_index": i + 1, "emotion": emotion, "score": score, "all_scores": emotion_scores}
+                    for i, (emotion, score, emotion_scores) in enumerate(
+                        aggregate_timeline(emotions, [(seg["start"], seg["end"]) for seg in combined_segments]))
+                ]
+                print(f"Emotion timeline: {len(emotions['window_starts'])} windows")
+
+            yield {
+                "type": "result",
+                "transcriptions": convert_to_json_serializable(transcriptions),
+                "pitch_feedback": convert_to_json_serializable(pitch_feedback),
+                "stutter_feedback": convert_to_json_serializable(stutter_feedback),
+                "stutter_regions": convert_to_json_serializable(timeline["regions"]) if timeline else None,
+                "stutter_regions_partial": bool(stutter_details.get("regions_partial")),
+                "stutter_cascade": convert_to_json_serializable(stutter_details.get("cascade")),
+                "emotion_timeline": convert_to_json_serializable(emotions),
+                "segment_emotions": convert_to_json_serializable(segment_emotions),
+                "timings": {"decode_seconds": audio_buffer.decode_seconds}
+            }
+        except Exception as e:
+            print(f"Error in process_speech_from_file: {str(e)}")
+            raise
+        finally:
+            if executor is not None:
+                executor.close()
+            if wav_audio_path != file_path and os.path.exists(wav_audio_path):
+                os.remove(wav_audio_path)
+                print(f"Cleaned up temporary file: {wav_audio_path}")
+
+def process_speech_from_file(file_path, cache=None, gender=None, target_style="default", target_speed="standard", streaming=False, pitch_tracker=None, prosody_mode="segments", prosody_workers=None, stutter_mode=None, stutter_cascade=None, reuse_stored_tracks=False, emotion_mode=None):
+    result = None
+    for event in process_speech_stream(file_path, cache, gender=gender, target_style=target_style,
+                                       target_speed=target_speed, streaming=streaming, pitch_tracker=pitch_tracker,
+                                       prosody_mode=prosody_mode, prosody_workers=prosody_workers,
+                                       stutter_mode=stutter_mode, stutter_cascade=stutter_cascade,
+                                       reuse_stored_tracks=reuse_stored_tracks, emotion_mode=emotion_mode):
+        if event["type"] == "result":
+            result = event
+    output = {
+        "transcriptions": result["transcriptions"],
+        "pitch_feedback": result["pitch_feedback"],
+        "stutter_feedback": result["stutter_feedback"]
+    }
+    if result["stutter_regions"] is not None:
+        output["stutter_regions"] = result["stutter_regions"]
+        output["stutter_regions_partial"] = result["stutter_regions_partial"]
+    if result["stutter_cascade"] is not None:
+        output["stutter_cascade"] = result["stutter_cascade"]
+    if result["emotion_timeline"] is not None:
+        output["emotion_timeline"] = result["emotion_timeline"]
+        output["segment_emotions"] = result["segment_emotions"]
+    return output
 
 def create_flask_app():
     app = Flask(__name__)
+    app.config["COLD_START_SECONDS"] = None
+
+    @app.route('/api/models', methods=['GET'])
+    def model_status():
+        # cold start 與各模型載入時間；模型在第一次被請求使用時才載入
+        return jsonify({
+            "cold_start_seconds": app.config["COLD_START_SECONDS"],
+            "models": model_stats(),
+            "whisper": pool_stats(),
+            "stutter_cascade": cascade_stats(),
+            "stutter_batch": stutter_batch_stats(),
+            "fingerprints": fingerprint_stats(),
+            "cache": cache_stats()
+        })
 
     @app.route('/api/transcribe', methods=['POST'])
     def transcribe_audio():
@@ -507,6 +792,13 @@ def create_flask_app():
             gender = request.args.get("gender")
             target_style = request.args.get("style", "default")
             target_speed = request.args.get("speed", "standard")  # 新增語速參數
+            pitch_tracker = request.args.get("pitch_tracker")  # "pyin" 或 "yin"，未指定時使用 PITCH_TRACKER
+            prosody_mode = request.args.get("prosody_mode", "segments")  # "segments" 或 "tracks"
+            prosody_workers = request.args.get("prosody_workers", type=int)  # 未指定時使用 PROSODY_WORKERS
+            stutter_mode = request.args.get("stutter_mode")  # "segments" 或 "timeline"，未指定時使用 STUTTER_MODE
+            stutter_cascade = request.args.get("stutter_cascade", type=lambda v: v == "1")  # 未指定時使用 STUTTER_CASCADE
+            reuse_stored_tracks = request.args.get("reuse_stored_tracks") == "1"  # 有存下的整檔軌跡時改用 tracks 模式
+            emotion_mode = request.args.get("emotion_mode")  # "timeline"：附上整段錄音的情緒窗口分數，未指定時不跑情緒模型
             print(f"Gender: {gender}, Target Style: {target_style}, Target Speed: {target_speed}")
             file_ext = os.path.splitext(file.filename)[1]
             temp_filename = f"uploaded_{hashlib.md5(file.filename.encode('utf-8')).hexdigest()}{file_ext}"
@@ -516,15 +808,19 @@ def create_flask_app():
             print(f"File saved: {temp_path}, size: {os.path.getsize(temp_path)} bytes")
 
             cache = AudioAnalysisCache()
-            result = process_speech_from_file(temp_path, cache, gender=gender, target_style=target_style, target_speed=target_speed)
+            result = process_speech_from_file(temp_path, cache, gender=gender, target_style=target_style, target_speed=target_speed, pitch_tracker=pitch_tracker, prosody_mode=prosody_mode, prosody_workers=prosody_workers, stutter_mode=stutter_mode, stutter_cascade=stutter_cascade, reuse_stored_tracks=reuse_stored_tracks, emotion_mode=emotion_mode)
             audio_path = "data/temp_audio.wav" if temp_path.endswith(".m4a") else temp_path
             
             print(f"Processing completed: {len(result['pitch_feedback'])} pitch feedback items, {len(result['stutter_feedback'])} stutter feedback items, {len(result['transcriptions'])} transcriptions")
-            return jsonify({
+            response = {
                 "transcriptions": result["transcriptions"],
                 "pitch_feedback": result["pitch_feedback"],
                 "stutter_feedback": result["stutter_feedback"]
-            })
+            }
+            for key in ("stutter_regions", "stutter_regions_partial", "stutter_cascade", "emotion_timeline", "segment_emotions"):
+                if key in result:
+                    response[key] = result[key]
+            return jsonify(response)
         except Exception as e:
             print(f"Error in /api/transcribe: {str(e)}")
             return jsonify({"error": f"Transcription failed: {str(e)}"}), 500
@@ -535,6 +831,45 @@ def create_flask_app():
             if 'audio_path' in locals() and audio_path != temp_path and os.path.exists(audio_path):
                 os.remove(audio_path)
                 print(f"Cleaned up: {audio_path}")
+
+    @app.route('/api/transcribe/stream', methods=['POST'])
+    def transcribe_audio_stream():
+        # 以 NDJSON 逐段回傳結果，長音檔不必等整段轉錄完成才看到第一筆
+        if "file" not in request.files:
+            print("No file provided in request")
+            return jsonify({"error": "No file provided"}), 400
+
+        file = request.files["file"]
+        gender = request.args.get("gender")
+        target_style = request.args.get("style", "default")
+        target_speed = request.args.get("speed", "standard")
+        pitch_tracker = request.args.get("pitch_tracker")
+        prosody_mode = request.args.get("prosody_mode", "segments")
+        prosody_workers = request.args.get("prosody_workers", type=int)
+        stutter_mode = request.args.get("stutter_mode")
+        stutter_cascade = request.args.get("stutter_cascade", type=lambda v: v == "1")
+        reuse_stored_tracks = request.args.get("reuse_stored_tracks") == "1"
+        emotion_mode = request.args.get("emotion_mode")
+        file_ext = os.path.splitext(file.filename)[1]
+        temp_filename = f"uploaded_{hashlib.md5(file.filename.encode('utf-8')).hexdigest()}{file_ext}"
+        temp_path = os.path.join("data", temp_filename)
+        file.save(temp_path)
+        print(f"File saved: {temp_path}, size: {os.path.getsize(temp_path)} bytes")
+
+        def generate():
+            try:
+                cache = AudioAnalysisCache()
+                for event in process_speech_stream(temp_path, cache, gender=gender, target_style=target_style, target_speed=target_speed, pitch_tracker=pitch_tracker, prosody_mode=prosody_mode, prosody_workers=prosody_workers, stutter_mode=stutter_mode, stutter_cascade=stutter_cascade, reuse_stored_tracks=reuse_stored_tracks, emotion_mode=emotion_mode):
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
+            except Exception as e:
+                print(f"Error in /api/transcribe/stream: {str(e)}")
+                yield json.dumps({"type": "error", "error": f"Transcription failed: {str(e)}"}) + "\n"
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                    print(f"Cleaned up: {temp_path}")
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
         
     @app.route('/api/analyze', methods=['POST'])
     def analyze_audio():
@@ -557,14 +892,24 @@ def create_flask_app():
                     enhanced_feedback.append(item_with_time)
                 return jsonify({"feedback": enhanced_feedback})
             elif 'audio_path' in data:
-                pitch_feedback = analyze_pitch_segments(cache, audio_path=data['audio_path'], threshold=20)
+                # 有 feature store 的軌跡時以 frame 級資料重新計算每段統計，不需重新處理音檔
+                fingerprint = file_fingerprint(data['audio_path'])
+                pitch_tracker = data.get('pitch_tracker')
+                prosody_mode = data.get('prosody_mode', 'segments')  # 讀取哪個模式存下的語段快取
+                tracks = load_tracks(fingerprint, pitch_tracker=pitch_tracker)
+                pitch_feedback = analyze_pitch_segments(cache, audio_path=data['audio_path'], threshold=data.get('threshold', 20),
+                                                        target_style=data.get('style', 'default'),
+                                                        target_speed=data.get('speed', 'standard'), tracks=tracks,
+                                                        fingerprint=fingerprint, pitch_tracker=pitch_tracker,
+                                                        prosody_mode=prosody_mode)
+                segment_keys = [k for k, _ in cache.segments(fingerprint, pitch_tracker, prosody_mode)]
                 enhanced_feedback = []
                 for item in pitch_feedback:
                     if item.get('type') == 'summary':
                         enhanced_feedback.append(item)
                         continue
                     segment_index = item['segment_index'] - 1
-                    segment_key = [k for k in cache.cache_data.keys() if k.startswith(hashlib.md5(open(data['audio_path'], 'rb').read()).hexdigest())][segment_index]
+                    segment_key = segment_keys[segment_index]
                     _, start_time, end_time = segment_key.split('_')
                     item_with_time = item.copy()
                     item_with_time['start_time'] = float(start_time)
@@ -601,10 +946,16 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Audio Analysis Script")
     parser.add_argument("--server", action="store_true", help="Run as Flask server")
+    parser.add_argument("--no-warmup", action="store_true", help="Skip Whisper warm-up (for /api/analyze-only workers)")
     args = parser.parse_args()
 
     if args.server:
+        # 啟動時先載入 Whisper，第一個 /api/transcribe 請求就不用等權重載入
+        if not args.no_warmup:
+            warmup_whisper()
         app = create_flask_app()
+        app.config["COLD_START_SECONDS"] = round(time.perf_counter() - _process_start, 3)
+        print(f"Server ready in {app.config['COLD_START_SECONDS']:.2f}s")
         app.run(host='0.0.0.0', port=5000)
 
 
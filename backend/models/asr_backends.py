@@ -0,0 +1,64 @@
+import os
+from models.whisper_pool import get_whisper_model, decode_options, set_cpu_threads
+
+# 可選擇的語音辨識後端，每個後端回傳 Whisper 格式的結果 {"text", "segments"}
+DEFAULT_ASR_BACKEND = os.environ.get("ASR_BACKEND", "whisper")
+DEFAULT_NUM_THREADS = os.environ.get("ASR_NUM_THREADS")
+
+
+def whisper_backend(audio, model_size=None, device=None, precision=None, word_timestamps=True, **options):
+    """
+    原本的 Whisper 後端（CUDA 可用時使用 GPU）
+    """
+    model = get_whisper_model(model_size, device, precision)
+    return model.transcribe(audio, verbose=False, word_timestamps=word_timestamps,
+                            **decode_options(model_size, device, precision), **options)
+
+
+def whisper_int8_cpu_backend(audio, model_size=None, device=None, precision=None, word_timestamps=True, **options):
+    """
+    CPU 推論節點用：線性層 int8 動態量化的 Whisper
+    """
+    return whisper_backend(audio, model_size, "cpu", "int8", word_timestamps, **options)
+
+
+def whisper_fp32_cpu_backend(audio, model_size=None, device=None, precision=None, word_timestamps=True, **options):
+    """
+    CPU fp32 基準，用來和 int8 版本比較
+    """
+    return whisper_backend(audio, model_size, "cpu", "fp32", word_timestamps, **options)
+
+
+ASR_BACKENDS = {
+    "whisper": whisper_backend,
+    "whisper-int8-cpu": whisper_int8_cpu_backend,
+    "whisper-fp32-cpu": whisper_fp32_cpu_backend,
+}
+
+
+def register_asr_backend(name, backend_fn):
+    """
+    註冊新的語音辨識後端，backend_fn 需回傳 Whisper 格式的結果
+    """
+    ASR_BACKENDS[name] = backend_fn
+
+
+def run_asr(audio, backend=None, model_size=None, device=None, precision=None,
+            num_threads=None, word_timestamps=True, **options):
+    """
+    以指定後端執行語音辨識
+
+    Args:
+    - audio: 音檔路徑或 16 kHz 單聲道 float32 波形
+    - backend: ASR_BACKENDS 中的名稱，None 時使用 ASR_BACKEND 環境變數
+    - num_threads: CPU 推論執行緒數，None 時使用 ASR_NUM_THREADS 環境變數
+
+    Returns:
+    - result: Whisper 格式的辨識結果
+    """
+    backend = backend or DEFAULT_ASR_BACKEND
+    if backend not in ASR_BACKENDS:
+        raise ValueError(f"Unknown ASR backend: {backend}. Supported backends: {list(ASR_BACKENDS.keys())}")
+    set_cpu_threads(num_threads or DEFAULT_NUM_THREADS)
+    return ASR_BACKENDS[backend](audio, model_size=model_size, device=device, precision=precision,
+                                 word_timestamps=word_timestamps, **options)
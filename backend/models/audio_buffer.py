@@ -0,0 +1,54 @@
+import time
+import librosa
+import numpy as np
+
+# 每個請求只解碼一次：16 kHz 單聲道 float32 波形，各分析器拿到的是零複製的切片 view
+SAMPLE_RATE = 16000
+
+
+class AudioBuffer:
+    def __init__(self, audio, sample_rate=SAMPLE_RATE, path=None, decode_seconds=0.0):
+        self.audio = np.ascontiguousarray(audio, dtype=np.float32)
+        self.sample_rate = sample_rate
+        self.path = path
+        self.decode_seconds = decode_seconds
+
+    @classmethod
+    def from_file(cls, path, sample_rate=SAMPLE_RATE):
+        """
+        解碼並重新取樣整個音檔，記錄花費的時間
+        """
+        start = time.perf_counter()
+        audio, sr = librosa.load(path, sr=sample_rate, mono=True)
+        decode_seconds = time.perf_counter() - start
+        print(f"Decoded {path} ({len(audio) / sr:.1f}s audio) in {decode_seconds:.2f}s")
+        return cls(audio, sr, path=path, decode_seconds=decode_seconds)
+
+    @property
+    def duration(self):
+        return len(self.audio) / self.sample_rate
+
+    def slice(self, start_time=None, end_time=None):
+        """
+        回傳 [start_time, end_time) 的 view（不複製資料）
+        """
+        start_sample = max(int((start_time or 0) * self.sample_rate), 0)
+        end_sample = len(self.audio) if end_time is None else min(int(end_time * self.sample_rate), len(self.audio))
+        return self.audio[start_sample:max(start_sample, end_sample)]
+
+
+def load_segment(source, start_time=None, end_time=None, sample_rate=SAMPLE_RATE):
+    """
+    取得一段波形：source 可以是音檔路徑、AudioBuffer 或已解碼的波形
+
+    Returns:
+    - (audio, sr)，與 librosa.load 相同
+    """
+    if isinstance(source, np.ndarray):
+        source = AudioBuffer(source, sample_rate)
+    if isinstance(source, AudioBuffer):
+        if source.sample_rate != sample_rate:
+            raise ValueError(f"AudioBuffer is {source.sample_rate} Hz but {sample_rate} Hz was requested")
+        return source.slice(start_time, end_time), source.sample_rate
+    duration = end_time - start_time if start_time is not None and end_time is not None else None
+    return librosa.load(source, sr=sample_rate, offset=start_time or 0, duration=duration)
@@ -1,19 +1,20 @@
 import os
 import random
-import librosa
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from transformers import AutoConfig, Wav2Vec2FeatureExtractor, HubertPreTrainedModel, HubertModel
-
-project_root = os.path.dirname(os.path.abspath(__file__)) 
-os.chdir(project_root)  
+from models.model_registry import register_model, get_model
+from models.audio_buffer import AudioBuffer, load_segment
 
 model_name_or_path = "xmj2002/hubert-base-ch-speech-emotion-recognition"
 duration = 6
 sample_rate = 16000
-
-config = AutoConfig.from_pretrained(model_name_or_path)
+EMOTION_RUNTIME = os.environ.get("EMOTION_RUNTIME", "torch")  # "torch"、"onnx" 或 "int8"
+# group norm 的 HuBERT 第一層 conv 會把補零一起正規化，attention mask 擋不掉；
+# padding="longest" 時同一批最長 / 最短不超過這個比例（1.0 = 只放同長度的 clip），layer norm 的模型不受限
+EMOTION_MAX_PAD_RATIO = float(os.environ.get("EMOTION_MAX_PAD_RATIO", "1.25"))
 
 def id2class(id):
     if id == 0:
@@ -29,24 +30,25 @@ def id2class(id):
     else:
         return "surprise"
 
-def predict(path, processor, model, start_time=None, end_time=None):
+def predict(path, processor, model, start_time=None, end_time=None, padding="max_length"):
     """
     Emotion analysis for an audio segment
     
     Args:
-    - path: File path to the audio.
+    - path: File path to the audio, or an AudioBuffer / decoded waveform.
     - processor: Processor for extracting features.
     - model: Pre-trained emotion analysis model.
     - start_time: Start time (in seconds) for the audio segment.
     - end_time: End time (in seconds) for the audio segment.
+    - padding: "max_length" pads to 6 s; "longest" keeps the clip's own length (up to 6 s).
     
     Returns:
     - Emotion: The predicted emotion label.
     - Score: The prediction score for the emotion.
     """
     
-    speech, sr = librosa.load(path=path, sr=sample_rate, offset=start_time, duration=(end_time-start_time))
-    speech = processor(speech, padding="max_length", truncation=True, max_length=duration * sr,
+    speech, sr = load_segment(path, start_time, end_time, sample_rate)
+    speech = processor(speech, padding=padding, truncation=True, max_length=duration * sr,
                        return_tensors="pt", sampling_rate=sr).input_values
     with torch.no_grad():
         logit = model(speech)
@@ -60,6 +62,177 @@ def predict(path, processor, model, start_time=None, end_time=None):
     return emotion, emotion_score ,emotion_scores
 
 
+def _scores_to_result(score):
+    id = int(np.argmax(score))
+    emotion = id2class(id)
+    emotion_scores = {id2class(i): score[i] for i in range(len(score))}
+    return emotion, score[id], emotion_scores
+
+
+def _load_clips(items, path=None):
+    """
+    將 (start, end) 範圍或波形轉成波形列表；給 path 時整個音檔只解碼一次再切片
+    """
+    buffer = path if isinstance(path, AudioBuffer) else None
+    clips = []
+    for item in items:
+        if isinstance(item, np.ndarray):
+            clips.append(item)
+            continue
+        if path is None:
+            raise ValueError("path is required when items are (start, end) ranges")
+        if buffer is None:
+            buffer = AudioBuffer.from_file(path, sample_rate)
+        start_time, end_time = item
+        clips.append(buffer.slice(start_time, end_time))
+    return clips
+
+
+def predict_batch(items, processor, model, path=None, max_batch_size=16, max_batch_seconds=None,
+                  padding="max_length", bucket_by_length=False, max_pad_ratio=None):
+    """
+    Batched emotion analysis for many segments of a recording
+
+    Args:
+    - items: List of (start_time, end_time) ranges in `path`, or 16 kHz waveforms.
+    - processor: Processor for extracting features.
+    - model: Pre-trained emotion analysis model.
+    - path: File path to the audio or an AudioBuffer (required for (start, end) ranges).
+    - max_batch_size: Maximum number of clips per forward.
+    - max_batch_seconds: Memory cap, maximum padded audio seconds per forward (None = no cap).
+    - padding: "max_length" pads/truncates every clip to 6 s like `predict`;
+      "longest" pads to the longest clip in the batch and masks the padding in the mean pool.
+    - bucket_by_length: Group clips of similar length into the same batch so that
+      "longest" padding adds as little padding as possible.
+    - max_pad_ratio: With "longest" padding on a group-norm model, the longest clip in a batch is at most
+      this many times the shortest (None = EMOTION_MAX_PAD_RATIO), since the conv GroupNorm sees the padding.
+
+    Returns:
+    - List of (emotion, score, emotion_scores) tuples in the same order as `items`.
+    """
+    clips = _load_clips(items, path)
+    scores = _batched_scores(clips, processor, model, max_batch_size, max_batch_seconds, padding, bucket_by_length,
+                             max_pad_ratio)
+    return [_scores_to_result(score) for score in scores]
+
+
+def _masks_padding(model):
+    # layer norm 的 HuBERT 會把 attention mask 傳進 encoder，補零不影響結果
+    return getattr(getattr(model, "config", None), "feat_extract_norm", None) == "layer"
+
+
+def _batched_scores(clips, processor, model, max_batch_size=16, max_batch_seconds=None,
+                    padding="max_length", bucket_by_length=False, max_pad_ratio=None):
+    """
+    回傳每個 clip 的 softmax 分數陣列 (len(clips), num_class)，順序與 clips 相同
+    padding="longest" 且模型為 group norm 時，一批只收長度在最短 clip 的 max_pad_ratio 倍（預設 EMOTION_MAX_PAD_RATIO）以內的 clip
+    """
+    scores = None
+    max_length = duration * sample_rate
+    max_pad_ratio = EMOTION_MAX_PAD_RATIO if max_pad_ratio is None else max_pad_ratio
+    if padding == "max_length" or _masks_padding(model):
+        max_pad_ratio = None
+
+    # 依長度排序後相鄰的 clip 長度接近，動態補齊時浪費的運算最少
+    order = list(range(len(clips)))
+    if bucket_by_length:
+        order.sort(key=lambda i: min(len(clips[i]), max_length))
+
+    start = 0
+    while start < len(order):
+        batch_size = max_batch_size
+        if max_batch_seconds is not None:
+            if padding == "max_length":
+                padded_seconds = duration
+            else:
+                padded_seconds = max(min(len(clips[i]), max_length) for i in order[start:start + max_batch_size]) / sample_rate
+            batch_size = max(1, min(max_batch_size, int(max_batch_seconds // max(padded_seconds, 1e-3))))
+        batch_ids = order[start:start + batch_size]
+        if max_pad_ratio is not None:
+            lengths = [min(len(clips[i]), max_length) for i in batch_ids]
+            shortest = longest = lengths[0]
+            end = 1
+            while end < len(batch_ids) and max(longest, lengths[end]) <= min(shortest, lengths[end]) * max_pad_ratio:
+                shortest, longest = min(shortest, lengths[end]), max(longest, lengths[end])
+                end += 1
+            batch_ids = batch_ids[:end]
+        batch = [clips[i] for i in batch_ids]
+
+        inputs = processor(batch, padding=padding, truncation=True, max_length=max_length,
+                           return_tensors="pt", sampling_rate=sample_rate,
+                           return_attention_mask=padding != "max_length")
+        attention_mask = inputs.get("attention_mask")
+        with torch.no_grad():
+            logits = model(inputs.input_values, attention_mask=attention_mask)
+        batch_scores = F.softmax(logits, dim=1).detach().cpu().numpy()
+        if scores is None:
+            scores = np.zeros((len(clips), batch_scores.shape[1]), dtype=np.float32)
+        scores[batch_ids] = batch_scores
+        start += len(batch)
+
+    return scores if scores is not None else np.zeros((0, 0), dtype=np.float32)
+
+
+def emotion_timeline(source, processor, model, window_seconds=3.0, hop_seconds=1.5,
+                     max_batch_size=32, max_batch_seconds=None):
+    """
+    Sliding-window emotion scores over the whole recording
+
+    Args:
+    - source: File path to the audio or an AudioBuffer.
+    - window_seconds: Window length (at most 6 s, the model's max_length).
+    - hop_seconds: Hop between window starts.
+    - max_batch_size / max_batch_seconds: Batch limits, as in `predict_batch`.
+
+    Returns:
+    - dict with "window_starts" (n,), "window_ends" (n,), "scores" (n, num_class) float32
+      and "labels" (class names for the score columns).
+    """
+    if window_seconds > duration:
+        raise ValueError(f"window_seconds must be at most {duration} s")
+    if hop_seconds <= 0:
+        raise ValueError("hop_seconds must be positive")
+    buffer = source if isinstance(source, AudioBuffer) else AudioBuffer.from_file(source, sample_rate)
+
+    last_start = max(buffer.duration - window_seconds, 0.0)
+    window_starts = np.arange(0.0, last_start + 1e-9, hop_seconds)
+    if len(window_starts) == 0 or window_starts[-1] < last_start:
+        # 最後一個窗口對齊音檔結尾，確保整段音訊都有被涵蓋
+        window_starts = np.append(window_starts, last_start)
+    window_ends = np.minimum(window_starts + window_seconds, buffer.duration)
+
+    clips = [buffer.slice(s, e) for s, e in zip(window_starts, window_ends)]
+    # 所有窗口等長，"longest" 補齊只會影響貼齊結尾的那一個
+    scores = _batched_scores(clips, processor, model, max_batch_size, max_batch_seconds, padding="longest")
+    return {
+        "window_starts": window_starts,
+        "window_ends": window_ends,
+        "scores": scores,
+        "labels": [id2class(i) for i in range(scores.shape[1])],
+    }
+
+
+def aggregate_timeline(timeline, ranges):
+    """
+    將窗口分數依重疊長度加權平均到每個 (start, end) 範圍
+
+    Returns:
+    - List of (emotion, score, emotion_scores) tuples, like `predict_batch`.
+    """
+    starts, ends, scores = timeline["window_starts"], timeline["window_ends"], timeline["scores"]
+    results = []
+    for start_time, end_time in ranges:
+        overlap = np.clip(np.minimum(ends, end_time) - np.maximum(starts, start_time), 0.0, None)
+        if overlap.sum() <= 0:
+            # 範圍比任何窗口都短且落在窗口之間：使用中心最接近的窗口
+            centers = (starts + ends) / 2
+            overlap = np.zeros_like(overlap)
+            overlap[np.argmin(np.abs(centers - (start_time + end_time) / 2))] = 1.0
+        score = (scores * overlap[:, None]).sum(axis=0) / overlap.sum()
+        results.append(_scores_to_result(score))
+    return results
+
+
 class HubertClassificationHead(nn.Module):
     def __init__(self, config):
         super().__init__()
@@ -81,14 +254,72 @@ class HubertForSpeechClassification(HubertPreTrainedModel):
         self.classifier = HubertClassificationHead(config)
         self.init_weights()
 
-    def forward(self, x):
-        outputs = self.hubert(x)
-        hidden_states = outputs[0]
-        x = torch.mean(hidden_states, dim=1)
+    def forward(self, x, attention_mask=None):
+        if attention_mask is None:
+            outputs = self.hubert(x)
+            hidden_states = outputs[0]
+            x = torch.mean(hidden_states, dim=1)
+        else:
+            # group norm 的 HuBERT 不吃 attention mask，補零會經過 conv 的 GroupNorm（由 _batched_scores 限制補零比例），
+            # 平均時排除補零的 frame
+            hubert_mask = attention_mask if self.config.feat_extract_norm == "layer" else None
+            outputs = self.hubert(x, attention_mask=hubert_mask)
+            hidden_states = outputs[0]
+            frame_mask = self._get_feature_vector_attention_mask(hidden_states.shape[1], attention_mask)
+            frame_mask = frame_mask.unsqueeze(-1).to(hidden_states.dtype)
+            x = (hidden_states * frame_mask).sum(dim=1) / frame_mask.sum(dim=1).clamp(min=1)
         x = self.classifier(x)
         return x
 
-processor = Wav2Vec2FeatureExtractor.from_pretrained(model_name_or_path)
-model = HubertForSpeechClassification.from_pretrained(model_name_or_path, config=config)
-model.eval()
+def load_emotion_model():
+    """
+    下載並建立 HuBERT 情緒模型（由 model_registry 在第一次使用時呼叫）
+    """
+    config = AutoConfig.from_pretrained(model_name_or_path)
+    processor = Wav2Vec2FeatureExtractor.from_pretrained(model_name_or_path)
+    model = HubertForSpeechClassification.from_pretrained(model_name_or_path, config=config)
+    model.eval()
+    return processor, model
+
+def load_emotion_model_onnx():
+    """
+    CPU 推論用：載入匯出的 ONNX 情緒模型（先執行 python -m models.model_export --model emotion）
+    """
+    from models.onnx_runtime import OnnxClassifier
+    from models.model_export import EMOTION_ONNX_PATH
+    processor = Wav2Vec2FeatureExtractor.from_pretrained(model_name_or_path)
+    return processor, OnnxClassifier(EMOTION_ONNX_PATH)
+
+def load_emotion_model_int8():
+    """
+    低記憶體 CPU 模式：線性層 int8 動態量化的情緒模型
+    """
+    from models.quantization import quantize_linear_int8
+    processor, model = load_emotion_model()
+    return processor, quantize_linear_int8(model)
+
+register_model("emotion", load_emotion_model)
+register_model("emotion-onnx", load_emotion_model_onnx)
+register_model("emotion-int8", load_emotion_model_int8)
+
+
+def get_emotion_model(runtime=None):
+    """
+    Args:
+    - runtime: "torch"、"onnx" 或 "int8"，None 時使用 EMOTION_RUNTIME 環境變數
+
+    Returns:
+    - (processor, model)：延遲載入的特徵擷取器與情緒模型
+    """
+    runtime = runtime or EMOTION_RUNTIME
+    return get_model("emotion" if runtime == "torch" else f"emotion-{runtime}")
+
+
+def __getattr__(name):
+    # 相容舊的 `from models.audio_emotion_classifier import processor, model`
+    if name == "processor":
+        return get_emotion_model()[0]
+    if name == "model":
+        return get_emotion_model()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
@@ -0,0 +1,683 @@
+import os
+import json
+import atexit
+import time
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+from models.pitch_tracker import DEFAULT_PITCH_TRACKER
+
+# AudioAnalysisCache 的儲存後端：每筆快取為 key -> {"timestamp": ISO 字串, "results": ...}
+# "json" 是原本整份改寫 cache_data.json 的方式；"sqlite" 以 WAL 模式逐筆寫入，每次寫入成本不隨快取大小增加
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "sqlite")
+CACHE_BATCH_SIZE = int(os.environ.get("CACHE_BATCH_SIZE", "64"))  # batch 內累積這麼多筆就先寫入一次
+# 容量上限：超過時淘汰最久沒被讀寫的項目（LRU）；超過 TTL 的項目讀取時視為不存在，並由 sweep 刪除
+CACHE_TTL_DAYS = float(os.environ.get("CACHE_TTL_DAYS", "7"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "50000"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # results JSON 的總大小
+CACHE_SWEEP_SECONDS = float(os.environ.get("CACHE_SWEEP_SECONDS", "300"))  # 背景 sweeper 間隔，<= 0 時不啟動
+# 語段 key 的時間邊界量化到這個解析度（秒），Whisper 斷句的微小浮點差異仍對到同一個 key
+CACHE_TIME_RESOLUTION = float(os.environ.get("CACHE_TIME_RESOLUTION", "0.05"))
+# 量化後仍未命中時，起訖時間都在這個誤差（秒）內的既有語段可直接沿用，<= 0 時停用
+CACHE_MATCH_TOLERANCE = float(os.environ.get("CACHE_MATCH_TOLERANCE", "0.2"))
+_COLUMNS = "key, timestamp, results, size, last_access, content_hash, seg_start, seg_end"
+_UPSERT = (f"INSERT INTO cache_entries ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+           "ON CONFLICT(key) DO UPDATE SET timestamp = excluded.timestamp, results = excluded.results, "
+           "size = excluded.size, last_access = excluded.last_access")
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "sweeps": 0}
+# 語段精確 key 未命中後的去向：near（沿用邊界相近的語段）、tracks（由 feature store 的 frame 軌跡重建）、recomputed（重新分析）
+_segment_stats = {"near": 0, "tracks": 0, "recomputed": 0}
+
+
+def _count(name, n=1):
+    if n:
+        with _stats_lock:
+            _stats[name] += n
+
+
+def record_segment_reuse(outcome):
+    """
+    outcome: "near"、"tracks" 或 "recomputed"，見 _segment_stats
+    """
+    if outcome not in _segment_stats:
+        raise ValueError(f"Unknown segment reuse outcome: {outcome}. Supported outcomes: {list(_segment_stats.keys())}")
+    with _stats_lock:
+        _segment_stats[outcome] += 1
+
+
+def cache_stats():
+    """
+    程序啟動以來的快取命中、未命中、過期與淘汰次數，以及精確 key 未命中時模糊比對省下重新分析的比例
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+        segments = dict(_segment_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else None
+    stats["limits"] = {"ttl_days": CACHE_TTL_DAYS, "max_entries": CACHE_MAX_ENTRIES, "max_bytes": CACHE_MAX_BYTES}
+    reused = segments["near"] + segments["tracks"]
+    fuzzy_lookups = reused + segments["recomputed"]
+    segments["fuzzy_reuse_rate"] = reused / fuzzy_lookups if fuzzy_lookups else None
+    segments["time_resolution"] = CACHE_TIME_RESOLUTION
+    segments["match_tolerance"] = CACHE_MATCH_TOLERANCE
+    stats["segments"] = segments
+    return stats
+
+
+def quantize_time(seconds, resolution=None):
+    """
+    將語段邊界四捨五入到 resolution 的倍數，回傳固定小數位數的字串（用於快取 key）
+    """
+    resolution = resolution or CACHE_TIME_RESOLUTION
+    digits = max(0, -Decimal(str(resolution)).as_tuple().exponent)
+    return f"{round(float(seconds) / resolution) * resolution:.{digits}f}"
+
+
+# 語段結果的數值定義改變時（例如音高單位）遞增，舊版本的項目不再被查到，由 TTL 淘汰
+SEGMENT_KEY_VERSION = 2
+
+
+def segment_prefix(content_hash, pitch_tracker=None, prosody_mode=None):
+    """
+    "{音檔 hash}:v{SEGMENT_KEY_VERSION}:{音高追蹤器}:{prosody 模式}"：不同追蹤器（pyin / yin）或模式（segments / tracks）的結果數值不同，分開存放
+    """
+    return f"{content_hash}:v{SEGMENT_KEY_VERSION}:{pitch_tracker or DEFAULT_PITCH_TRACKER}:{prosody_mode or 'segments'}"
+
+
+def segment_key(content_hash, start_time, end_time, pitch_tracker=None, prosody_mode=None, resolution=None):
+    prefix = segment_prefix(content_hash, pitch_tracker, prosody_mode)
+    return f"{prefix}_{quantize_time(start_time, resolution)}_{quantize_time(end_time, resolution)}"
+
+
+def nearest_segment(store, prefix, start_time, end_time, tolerance=None):
+    """
+    prefix（segment_prefix）相同、起訖時間都與 [start_time, end_time] 相差不超過 tolerance 的未過期語段中，
+    誤差總和最小的 (key, entry)；沒有時回傳 None
+    只讀起點落在 start_time ± tolerance 的語段，不掃過整個音檔
+    """
+    tolerance = CACHE_MATCH_TOLERANCE if tolerance is None else tolerance
+    if tolerance <= 0:
+        return None
+    best, best_error = None, None
+    cutoff = _ttl_cutoff()
+    for key, entry in store.segments(prefix, start_time - tolerance, start_time + tolerance):
+        _, start, end = parse_segment_key(key)
+        if abs(end - end_time) > tolerance or not _is_fresh(entry, cutoff):
+            continue
+        error = abs(start - start_time) + abs(end - end_time)
+        if best_error is None or error < best_error:
+            best, best_error = (key, entry), error
+    return best
+
+
+def _prefix_range(prefix):
+    # key 上有 UNIQUE index，以範圍查詢取代 LIKE / substr 的全表掃描
+    return prefix, prefix + "\U0010ffff"
+
+
+def parse_segment_key(key):
+    """
+    語段快取的 key 為 "{segment_prefix}_{start}_{end}"；回傳 (prefix, start, end)，其他 key（逐字稿、整檔結果）回傳 None
+    加入追蹤器與模式之前的舊 key 的 prefix 只有音檔 hash，不會再被查到，由 TTL 淘汰
+    """
+    parts = key.rsplit("_", 2)
+    if len(parts) != 3 or key.startswith("transcript_"):
+        return None
+    try:
+        return parts[0], float(parts[1]), float(parts[2])
+    except ValueError:
+        return None
+
+
+def _ttl_cutoff(ttl_days=None):
+    # timestamp 都是 datetime.now().isoformat()，ISO 字串可以直接比較先後
+    return (datetime.now() - timedelta(days=CACHE_TTL_DAYS if ttl_days is None else ttl_days)).isoformat()
+
+
+def _is_fresh(entry, cutoff=None):
+    return entry.get("timestamp", "") > (cutoff or _ttl_cutoff())
+
+
+def _results_size(entry):
+    return len(json.dumps(entry["results"], ensure_ascii=False).encode("utf-8"))
+
+
+def _lru_victims(entries, max_entries, max_bytes):
+    """
+    entries: 可迭代的 (last_access, key, size)；回傳依 LRU 要淘汰的 key，讓剩下的項目數與大小都在上限內
+    """
+    entries = sorted(entries)
+    total_entries = len(entries)
+    total_bytes = sum(size for _, _, size in entries)
+    victims = []
+    for _, key, size in entries:
+        if total_entries <= max_entries and total_bytes <= max_bytes:
+            break
+        victims.append(key)
+        total_entries -= 1
+        total_bytes -= size
+    return victims
+
+
+class _ThreadBatchDepth:
+    """
+    batch 的巢狀深度以執行緒分開計算：store 在程序內共用，同時進行的請求各自在自己的 batch 結束時寫入，
+    不必等所有請求都結束
+    """
+    @property
+    def _batch_depth(self):
+        return getattr(self._local, "batch_depth", 0)
+
+    @_batch_depth.setter
+    def _batch_depth(self, value):
+        self._local.batch_depth = value
+
+
+class JsonCacheStore(_ThreadBatchDepth):
+    """
+    整份快取放在記憶體的 dict，每次寫入（或每個 batch 結束時）改寫整個 JSON 檔
+    載入與寫檔前都會先 sweep，檔案與記憶體用量不超過 CACHE_MAX_ENTRIES / CACHE_MAX_BYTES；
+    最後存取時間只記在記憶體（載入時以 timestamp 為初值），不改變 dict 的寫入順序
+    另外維護 音檔 hash -> 依時間排序的 [(start, end, key)]，segments() 不必掃過整個 dict
+    """
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self._lock = threading.RLock()
+        self.data = self._load()
+        self.last_access = {}
+        self._sizes = {}
+        self._segments = {}
+        for key in self.data:
+            self._index(key)
+        self._local = threading.local()
+        self._dirty = False
+        self.sweep()
+
+    def _load(self):
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    content = f.read().strip()
+                    if not content:
+                        print(f"Cache file {self.cache_file} is empty, initializing with empty dict")
+                        return {}
+                    return json.loads(content)
+            except json.JSONDecodeError as e:
+                print(f"Failed to decode cache file {self.cache_file}: {str(e)}. Initializing with empty dict")
+                return {}
+            except Exception as e:
+                print(f"Error reading cache file {self.cache_file}: {str(e)}. Initializing with empty dict")
+                return {}
+        print(f"Cache file {self.cache_file} does not exist, initializing with empty dict")
+        return {}
+
+    def _save(self):
+        with self._lock:
+            self.sweep()
+            with open(self.cache_file, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            self._dirty = False
+
+    def get(self, key):
+        """
+        回傳未過期的項目；過期或不存在時回傳 None
+        """
+        with self._lock:
+            entry = self.data.get(key)
+            if entry and _is_fresh(entry):
+                self.last_access[key] = time.time()
+                _count("hits")
+                return entry
+        if entry:
+            _count("expired")
+        _count("misses")
+        return None
+
+    def put(self, key, entry):
+        with self._lock:
+            if key not in self.data:
+                self._index(key)
+            self.data[key] = entry
+            self.last_access[key] = time.time()
+            self._sizes.pop(key, None)
+            self._dirty = True
+            if not self._batch_depth:
+                self._save()
+
+    def delete(self, key):
+        with self._lock:
+            if key not in self.data:
+                return
+            self._drop(key)
+            self._dirty = True
+            if not self._batch_depth:
+                self._save()
+
+    def items(self, prefix=""):
+        """
+        依寫入順序回傳 key 以 prefix 開頭的 (key, entry)
+        """
+        with self._lock:
+            return [(key, entry) for key, entry in self.data.items() if key.startswith(prefix)]
+
+    def keys(self, prefix=""):
+        with self._lock:
+            return [key for key in self.data if key.startswith(prefix)]
+
+    def segments(self, prefix, start_min=None, start_max=None):
+        """
+        依 (start, end) 排序回傳 segment_prefix 為 prefix 的所有語段 (key, entry)；給 start_min / start_max 時只回傳起點在範圍內的語段
+        """
+        with self._lock:
+            segments = self._segments.get(prefix, [])
+            lo = 0 if start_min is None else bisect_left(segments, (start_min,))
+            hi = len(segments) if start_max is None else bisect_right(segments, (start_max, float("inf")))
+            return [(key, self.data[key]) for _, _, key in segments[lo:hi]]
+
+    def _index(self, key):
+        parsed = parse_segment_key(key)
+        if parsed:
+            insort(self._segments.setdefault(parsed[0], []), (parsed[1], parsed[2], key))
+
+    def _unindex(self, key):
+        parsed = parse_segment_key(key)
+        if parsed and parsed[0] in self._segments:
+            segments = self._segments[parsed[0]]
+            segments.remove((parsed[1], parsed[2], key))
+            if not segments:
+                del self._segments[parsed[0]]
+
+    def sweep(self, max_entries=None, max_bytes=None, ttl_days=None):
+        """
+        刪除過期項目，再依 LRU 淘汰到上限內（只改記憶體，由 _save 寫回）；回傳 (expired, evicted)
+        """
+        with self._lock:
+            cutoff = _ttl_cutoff(ttl_days)
+            victims = [key for key, entry in self.data.items() if not _is_fresh(entry, cutoff)]
+            expired = len(victims)
+            for key in victims:
+                self._drop(key)
+            for key, entry in self.data.items():
+                if key not in self._sizes:
+                    self._sizes[key] = _results_size(entry)
+            victims = _lru_victims(
+                ((self.last_access.get(key) or datetime.fromisoformat(entry["timestamp"]).timestamp(),
+                  key, self._sizes[key]) for key, entry in self.data.items()),
+                CACHE_MAX_ENTRIES if max_entries is None else max_entries,
+                CACHE_MAX_BYTES if max_bytes is None else max_bytes,
+            )
+            for key in victims:
+                self._drop(key)
+            if expired or victims:
+                self._dirty = True
+        _count("sweeps")
+        _count("expired", expired)
+        _count("evicted", len(victims))
+        return expired, len(victims)
+
+    def _drop(self, key):
+        self._unindex(key)
+        del self.data[key]
+        self.last_access.pop(key, None)
+        self._sizes.pop(key, None)
+
+    @contextmanager
+    def batch(self):
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if not self._batch_depth and self._dirty:
+                    self._save()
+
+    def close(self):
+        if self._dirty:
+            self._save()
+
+
+class SqliteCacheStore(_ThreadBatchDepth):
+    """
+    SQLite（WAL 模式）：每筆快取一列，寫入只影響那一列
+    batch 內的寫入先留在記憶體，累積 batch_size 筆或 batch 結束時以一個短交易寫入，
+    不會在整個請求期間佔住寫入鎖；第一次開啟時會把既有的 JSON 快取匯入（JSON 檔保留不動）
+    每列記錄 results 大小與最後存取時間，過期與 LRU 淘汰由 sweep()（背景 sweeper）執行；
+    讀取命中時的最後存取時間一律先留在記憶體，累積 batch_size 筆、flush、sweep 或程序結束時才寫入
+    語段的 key 另外拆成 content_hash（segment_prefix）/ seg_start / seg_end 欄位並建 index，segments() 只讀該音檔的列
+    """
+    def __init__(self, db_path, migrate_from=None, batch_size=None):
+        self.db_path = db_path
+        self.batch_size = batch_size or CACHE_BATCH_SIZE
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._pending = {}
+        self._touched = {}
+        self._deleted = set()
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # 只對新建的資料庫有效，淘汰後可歸還磁碟空間
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT NOT NULL UNIQUE,"
+            " timestamp TEXT NOT NULL,"
+            " results TEXT NOT NULL,"
+            " size INTEGER NOT NULL DEFAULT 0,"
+            " last_access REAL NOT NULL DEFAULT 0,"
+            " content_hash TEXT,"
+            " seg_start REAL,"
+            " seg_end REAL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._upgrade_schema()
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_last_access ON cache_entries (last_access)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_timestamp ON cache_entries (timestamp)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_segments ON cache_entries (content_hash, seg_start, seg_end)")
+        if migrate_from:
+            self.migrate_json(migrate_from)
+
+    def _columns(self):
+        return {row[1] for row in self.conn.execute("PRAGMA table_info(cache_entries)")}
+
+    def _upgrade_schema(self):
+        # 舊資料庫缺少的欄位：補上後以 results 長度、timestamp 與解析 key 的結果回填
+        # 欄位都已存在時（一般情況）只讀 table_info，不取得寫入鎖
+        if {"size", "last_access", "content_hash"} <= self._columns():
+            return
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                columns = self._columns()
+                if "size" not in columns:
+                    self.conn.execute("ALTER TABLE cache_entries ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                    self.conn.execute("UPDATE cache_entries SET size = length(CAST(results AS BLOB))")
+                if "last_access" not in columns:
+                    self.conn.execute("ALTER TABLE cache_entries ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+                    # timestamp 是本地時間的 ISO 字串，與 migrate_json 相同以 datetime 換算，SQLite 的 julianday 會當成 UTC
+                    rows = self.conn.execute("SELECT id, timestamp FROM cache_entries").fetchall()
+                    self.conn.executemany(
+                        "UPDATE cache_entries SET last_access = ? WHERE id = ?",
+                        [(datetime.fromisoformat(timestamp).timestamp(), row_id) for row_id, timestamp in rows]
+                    )
+                if "content_hash" not in columns:
+                    for column in ("content_hash TEXT", "seg_start REAL", "seg_end REAL"):
+                        self.conn.execute(f"ALTER TABLE cache_entries ADD COLUMN {column}")
+                    rows = self.conn.execute("SELECT id, key FROM cache_entries").fetchall()
+                    parsed = [(parse_segment_key(key), row_id) for row_id, key in rows]
+                    self.conn.executemany(
+                        "UPDATE cache_entries SET content_hash = ?, seg_start = ?, seg_end = ? WHERE id = ?",
+                        [(*segment, row_id) for segment, row_id in parsed if segment]
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def migrate_json(self, cache_file):
+        """
+        將 JSON 快取匯入（每個 JSON 檔只匯入一次，已存在的 key 不覆寫）
+        """
+        marker = f"migrated:{os.path.abspath(cache_file)}"
+        with self._lock:
+            if self.conn.execute("SELECT 1 FROM cache_meta WHERE name = ?", (marker,)).fetchone():
+                return 0
+            if not os.path.exists(cache_file):
+                return 0
+            data = JsonCacheStore(cache_file).data
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 在同一個交易內再檢查一次，多個程序同時啟動時只有一個會匯入
+                if self.conn.execute("SELECT 1 FROM cache_meta WHERE name = ?", (marker,)).fetchone():
+                    self.conn.execute("ROLLBACK")
+                    return 0
+                self.conn.executemany(
+                    f"INSERT OR IGNORE INTO cache_entries ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self._row(key, entry, datetime.fromisoformat(entry["timestamp"]).timestamp())
+                     for key, entry in data.items() if isinstance(entry, dict) and "timestamp" in entry)
+                )
+                self.conn.execute("INSERT INTO cache_meta (name, value) VALUES (?, ?)", (marker, str(len(data))))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        print(f"Migrated {len(data)} cache entries from {cache_file} to {self.db_path}")
+        return len(data)
+
+    @staticmethod
+    def _row(key, entry, last_access):
+        results = json.dumps(entry["results"], ensure_ascii=False)
+        segment = parse_segment_key(key) or (None, None, None)
+        return (key, entry["timestamp"], results, len(results.encode("utf-8")), last_access, *segment)
+
+    @staticmethod
+    def _entry(row):
+        return {"timestamp": row[0], "results": json.loads(row[1])}
+
+    def get(self, key):
+        """
+        回傳未過期的項目；過期或不存在時回傳 None
+        """
+        with self._lock:
+            if key in self._pending:
+                entry = self._pending[key]
+            elif key in self._deleted:
+                entry = None
+            else:
+                row = self.conn.execute("SELECT timestamp, results FROM cache_entries WHERE key = ?", (key,)).fetchone()
+                entry = self._entry(row) if row else None
+            if entry and _is_fresh(entry):
+                self._touch(key)
+                _count("hits")
+                return entry
+        if entry:
+            _count("expired")
+        _count("misses")
+        return None
+
+    def _touch(self, key):
+        # LRU 的最後存取時間先累積在記憶體，和寫入一起 commit；累積 batch_size 筆就寫入一次（batch 內也是），長時間的請求不會無限累積
+        self._touched[key] = time.time()
+        if len(self._touched) >= self.batch_size:
+            self.flush()
+
+    def put(self, key, entry):
+        with self._lock:
+            self._deleted.discard(key)
+            if self._batch_depth:
+                self._pending[key] = entry
+                self._touched[key] = time.time()
+                if len(self._pending) >= self.batch_size:
+                    self.flush()
+            else:
+                self._touched.pop(key, None)
+                self.conn.execute(_UPSERT, self._row(key, entry, time.time()))
+
+    def delete(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+            self._touched.pop(key, None)
+            if self._batch_depth:
+                self._deleted.add(key)
+            else:
+                self.conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def flush(self):
+        """
+        將 batch 內累積的寫入以一個交易 commit；UPSERT 保留原本的 id，覆寫時順序與 JSON dict 相同
+        """
+        with self._lock:
+            if not self._pending and not self._touched and not self._deleted:
+                return
+            rows = [self._row(key, entry, self._touched[key]) for key, entry in self._pending.items()]
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(_UPSERT, rows)
+                self.conn.executemany("UPDATE cache_entries SET last_access = ? WHERE key = ?",
+                                      [(t, key) for key, t in self._touched.items() if key not in self._pending])
+                self.conn.executemany("DELETE FROM cache_entries WHERE key = ?", [(key,) for key in self._deleted])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._pending.clear()
+            self._touched.clear()
+            self._deleted.clear()
+
+    def items(self, prefix=""):
+        """
+        依寫入順序回傳 key 以 prefix 開頭的 (key, entry)
+        """
+        with self._lock:
+            self.flush()
+            rows = self.conn.execute(
+                "SELECT key, timestamp, results FROM cache_entries WHERE key >= ? AND key < ? ORDER BY id",
+                _prefix_range(prefix)
+            ).fetchall()
+        return [(row[0], self._entry(row[1:])) for row in rows]
+
+    def keys(self, prefix=""):
+        with self._lock:
+            self.flush()
+            rows = self.conn.execute(
+                "SELECT key FROM cache_entries WHERE key >= ? AND key < ? ORDER BY id", _prefix_range(prefix)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def segments(self, prefix, start_min=None, start_max=None):
+        """
+        依 (start, end) 排序回傳 segment_prefix 為 prefix 的所有語段 (key, entry)；給 start_min / start_max 時只回傳起點在範圍內的語段
+        """
+        query = "SELECT key, timestamp, results FROM cache_entries WHERE content_hash = ?"
+        params = [prefix]
+        if start_min is not None:
+            query += " AND seg_start >= ?"
+            params.append(start_min)
+        if start_max is not None:
+            query += " AND seg_start <= ?"
+            params.append(start_max)
+        with self._lock:
+            self.flush()
+            rows = self.conn.execute(query + " ORDER BY seg_start, seg_end", params).fetchall()
+        return [(row[0], self._entry(row[1:])) for row in rows]
+
+    def sweep(self, max_entries=None, max_bytes=None, ttl_days=None):
+        """
+        刪除過期項目，再依 LRU 淘汰到上限內；回傳 (expired, evicted)
+        """
+        max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        with self._lock:
+            self.flush()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = self.conn.execute("DELETE FROM cache_entries WHERE timestamp <= ?",
+                                            (_ttl_cutoff(ttl_days),)).rowcount
+                total_entries, total_bytes = self.conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+                victims = []
+                if total_entries > max_entries or total_bytes > max_bytes:
+                    # 依最後存取時間從最舊的開始走（有 index），剩下的項目在上限內就停
+                    for row_id, size in self.conn.execute("SELECT id, size FROM cache_entries ORDER BY last_access, id"):
+                        if total_entries <= max_entries and total_bytes <= max_bytes:
+                            break
+                        victims.append((row_id,))
+                        total_entries -= 1
+                        total_bytes -= size
+                    self.conn.executemany("DELETE FROM cache_entries WHERE id = ?", victims)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            if expired or victims:
+                self.conn.execute("PRAGMA incremental_vacuum")
+        _count("sweeps")
+        _count("expired", expired)
+        _count("evicted", len(victims))
+        return expired, len(victims)
+
+    @contextmanager
+    def batch(self):
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self.flush()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.conn.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_cache_store(cache_file, backend=None):
+    """
+    backend: "json" 或 "sqlite"，None 時使用 CACHE_BACKEND 環境變數（預設 sqlite）
+    sqlite 的資料庫與 cache_file 放在同一目錄（cache_data.json -> cache_data.sqlite3），第一次開啟時匯入 JSON
+    每個 (backend, cache_file) 在程序內只開啟一次（連線、schema 檢查與 JSON 匯入只做一次），之後回傳同一個 store；
+    程序結束時 flush 尚未寫入的項目與最後存取時間
+    """
+    backend = backend or CACHE_BACKEND
+    if backend not in ("json", "sqlite"):
+        raise ValueError(f"Unknown cache backend: {backend}. Supported backends: ['json', 'sqlite']")
+    key = (backend, os.path.abspath(cache_file))
+    with _stores_lock:
+        if key not in _stores:
+            if backend == "json":
+                store = JsonCacheStore(cache_file)
+                atexit.register(store.close)
+            else:
+                store = SqliteCacheStore(os.path.splitext(cache_file)[0] + ".sqlite3", migrate_from=cache_file)
+                atexit.register(store.flush)
+            _stores[key] = store
+        return _stores[key]
+
+
+_sweepers = {}
+_sweepers_lock = threading.Lock()
+
+
+def start_cache_sweeper(cache_file, backend=None, interval=None):
+    """
+    背景執行緒定期對 cache_file 的 SQLite 快取做過期刪除與 LRU 淘汰（順便寫入累積的最後存取時間），每個資料庫在程序內只啟動一個
+    JSON 後端在載入與寫檔時已經 sweep，另開執行緒改寫同一個檔案會和請求的寫入互相覆蓋，因此不啟動
+    """
+    backend = backend or CACHE_BACKEND
+    interval = CACHE_SWEEP_SECONDS if interval is None else interval
+    if backend != "sqlite" or interval <= 0:
+        return None
+    key = os.path.abspath(cache_file)
+    with _sweepers_lock:
+        if key in _sweepers:
+            return _sweepers[key]
+
+        def run():
+            store = open_cache_store(cache_file, backend)
+            while True:
+                try:
+                    expired, evicted = store.sweep()
+                    if expired or evicted:
+                        print(f"Cache sweep: expired {expired}, evicted {evicted} entries from {store.db_path}")
+                except Exception as e:
+                    print(f"Cache sweep failed for {cache_file}: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name=f"cache-sweeper-{os.path.basename(cache_file)}", daemon=True)
+        thread.start()
+        _sweepers[key] = thread
+        return thread
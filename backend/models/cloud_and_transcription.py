@@ -1,18 +1,24 @@
-import gdown
-from moviepy.editor import VideoFileClip
-import whisper
-from pydub import AudioSegment
+import os
+from models.asr_backends import run_asr
+from models.vad import compress_silence
+from models.audio_buffer import AudioBuffer
+
+# 轉錄前先用能量 VAD 去除靜音（ASR_VAD=0 可關閉）
+VAD_ENABLED = os.environ.get("ASR_VAD", "1") == "1"
+ASR_SAMPLE_RATE = 16000  # whisper.audio.SAMPLE_RATE
 
 def download_file_from_cloud(url, output_path):
     """
     下載檔案（例如從Google Drive或AWS S3）
     """
+    import gdown
     gdown.download(url, output_path, quiet=False)
 
 def convert_m4a_to_wav(m4a_path, wav_path):
     """
     將 M4A 檔案轉換為 WAV 格式
     """
+    from pydub import AudioSegment
     try:
         audio = AudioSegment.from_file(m4a_path, format="m4a")
         audio.export(wav_path, format="wav")
@@ -24,18 +30,45 @@ def extract_audio_from_video(video_path, output_audio_path):
     """
     從影片中提取音訊
     """
+    from moviepy.editor import VideoFileClip
     video = VideoFileClip(video_path)
     audio = video.audio
     audio.write_audiofile(output_audio_path, codec='pcm_s16le')
 
-import whisper
+def load_audio_for_asr(audio_path, vad=None):
+    """
+    載入 16 kHz 波形（audio_path 也可以是已解碼的 AudioBuffer）；啟用 VAD 時去除非語音區段
+
+    Returns:
+    - audio: 要送進 ASR 的波形
+    - time_map: VadTimeMap（未啟用 VAD 時為 None）
+    - vad_stats: 略過的音訊長度統計（未啟用 VAD 時為 None）
+    """
+    if isinstance(audio_path, AudioBuffer):
+        # 與其他分析器共用同一份解碼結果
+        audio = audio_path.audio
+    else:
+        import whisper
+        audio = whisper.load_audio(audio_path)
+    if not (VAD_ENABLED if vad is None else vad):
+        return audio, None, None
+    compressed, time_map, vad_stats = compress_silence(audio, ASR_SAMPLE_RATE)
+    print(f"VAD skipped {vad_stats['skipped_seconds']:.1f}s of {vad_stats['original_seconds']:.1f}s "
+          f"({vad_stats['skipped_ratio']:.0%}) in {vad_stats['speech_regions']} speech regions")
+    return compressed, time_map, vad_stats
 
-def transcribe_audio_to_sentences(audio_path, device='cuda'):
+def transcribe_audio_to_sentences(audio_path, device=None, model_size=None, precision=None,
+                                  backend=None, num_threads=None, vad=None, return_vad_stats=False):
     try:
-        model = whisper.load_model("medium").to(device)  # 使用 large 模型以提高精度
-        result = model.transcribe(audio_path, verbose=False, word_timestamps=True)
-        
-        segments = result['segments']
+        audio, time_map, vad_stats = load_audio_for_asr(audio_path, vad)
+        segments = []
+        if len(audio) > 0:
+            # 模型來自共用模型池；backend 可選 "whisper"、"whisper-int8-cpu" 等
+            result = run_asr(audio, backend=backend, model_size=model_size, device=device,
+                             precision=precision, num_threads=num_threads)
+            segments = result['segments']
+        if time_map is not None:
+            segments = [time_map.remap_segment(seg) for seg in segments]
         sentences = []
         for seg in segments:
             sentences.append({
@@ -54,7 +87,91 @@ def transcribe_audio_to_sentences(audio_path, device='cuda'):
                         "end": word["end"]
                     })
         
+        if return_vad_stats:
+            return sentences, segments, word_timestamps, vad_stats
         return sentences, segments, word_timestamps
     except Exception as e:
         print(f"Error in transcribe_audio_to_sentences: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+
+# 串流轉錄設定：每個窗口 30 秒（Whisper 一次解碼的長度），相鄰窗口重疊 5 秒
+STREAM_WINDOW_SECONDS = 30.0
+STREAM_OVERLAP_SECONDS = 5.0
+SEAM_TOLERANCE = 0.1  # 接縫處判斷重複的容許誤差（秒）
+
+
+def _offset_words(words, offset):
+    return [
+        {"word": w["word"], "start": w["start"] + offset, "end": w["end"] + offset}
+        for w in words
+    ]
+
+
+def stream_transcribe_audio(audio_path, window_seconds=STREAM_WINDOW_SECONDS, overlap_seconds=STREAM_OVERLAP_SECONDS,
+                            device=None, model_size=None, precision=None, backend=None, num_threads=None, vad=None):
+    """
+    串流版的 transcribe_audio_to_sentences：以重疊窗口解碼，每個語段一確定就 yield
+
+    相鄰窗口在重疊區的中點交接：前一個窗口只輸出中點之前開始的單字（跨過中點的語段截在該處），
+    窗口尾端被截斷處解出的單字留給下一個窗口重新解碼；後一個窗口中已輸出過的內容以單字時間戳去除，避免接縫重複。
+    沒有單字時間戳的語段無法截斷，中點之前開始就整段輸出。
+    啟用 VAD 時窗口切在去除靜音後的波形上，輸出前再換回原始時間。
+
+    Yields:
+    - (sentence, segment, word_timestamps)：格式與 transcribe_audio_to_sentences 的單一元素相同，
+      時間皆為原音檔時間
+    """
+    if overlap_seconds >= window_seconds:
+        raise ValueError("overlap_seconds must be smaller than window_seconds")
+
+    audio, time_map, _ = load_audio_for_asr(audio_path, vad)
+    sr = ASR_SAMPLE_RATE
+    total_seconds = len(audio) / sr
+    committed_until = 0.0
+    window_start = 0.0
+
+    while window_start < total_seconds:
+        window_end = min(window_start + window_seconds, total_seconds)
+        is_last = window_end >= total_seconds
+        chunk = audio[int(window_start * sr):int(window_end * sr)]
+        result = run_asr(chunk, backend=backend, model_size=model_size, device=device,
+                         precision=precision, num_threads=num_threads)
+
+        # 最後一個窗口輸出全部，其餘只輸出重疊區中點之前開始的單字
+        commit_boundary = total_seconds if is_last else window_end - overlap_seconds / 2
+        for seg in result["segments"]:
+            start = seg["start"] + window_start
+            end = seg["end"] + window_start
+            if start >= commit_boundary:
+                break
+            words = _offset_words(seg.get("words", []), window_start)
+            text = seg["text"]
+
+            if start < committed_until - SEAM_TOLERANCE:
+                # 與前一窗口重疊：只保留尚未輸出的單字
+                words = [w for w in words if w["start"] >= committed_until - SEAM_TOLERANCE]
+                if not words:
+                    continue
+                text = "".join(w["word"] for w in words)
+                start = words[0]["start"]
+
+            if end > commit_boundary and words:
+                # 跨過中點的語段只輸出中點之前開始的單字，其餘由下一個窗口輸出
+                words = [w for w in words if w["start"] < commit_boundary]
+                if not words:
+                    continue
+                text = "".join(w["word"] for w in words)
+                end = words[-1]["end"]
+
+            segment = dict(seg, text=text, start=start, end=end, words=words)
+            committed_until = max(committed_until, end)
+            if time_map is not None:
+                segment = time_map.remap_segment(segment)
+                words = segment["words"]
+            sentence = {"text": text.strip(), "start": segment["start"], "end": segment["end"]}
+            yield sentence, segment, words
+
+        if is_last:
+            break
+        window_start = window_end - overlap_seconds
@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import shutil
+import numpy as np
+from models.frame_tracks import FrameTracks, INDEX_ARRAYS
+from models.pitch_tracker import DEFAULT_PITCH_TRACKER
+
+# frame 級軌跡的磁碟儲存：以音檔內容 hash 分目錄，每條軌跡與前綴和 / range-max 表各一個 .npy，
+# 讀取時全部 memory-map，不必重新解碼、追蹤音高或建表，只有查詢到的位置會被讀進記憶體
+FEATURE_STORE_DIR = os.environ.get("FEATURE_STORE_DIR", "cache/features")
+_TRACK_ARRAYS = ("f0", "voiced", "rms", "block_peaks")
+_FORMAT_VERSION = 3
+
+
+def track_store_path(content_hash, pitch_tracker=None, store_dir=None):
+    """
+    <store_dir>/<content_hash>/<pitch_tracker>；不同追蹤器的軌跡分開存
+    """
+    return os.path.join(store_dir or FEATURE_STORE_DIR, content_hash, pitch_tracker or DEFAULT_PITCH_TRACKER)
+
+
+def has_tracks(content_hash, pitch_tracker=None, store_dir=None):
+    return os.path.exists(os.path.join(track_store_path(content_hash, pitch_tracker, store_dir), "meta.json"))
+
+
+def save_tracks(content_hash, tracks, pitch_tracker=None, store_dir=None):
+    """
+    寫到暫存目錄後再 rename，其他程序不會讀到寫一半的檔案
+    """
+    path = track_store_path(content_hash, pitch_tracker, store_dir)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+    for name in _TRACK_ARRAYS:
+        np.save(os.path.join(tmp_path, f"{name}.npy"), getattr(tracks, name))
+    for name, array in tracks.index_arrays().items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+    meta = {
+        "version": _FORMAT_VERSION,
+        "sample_rate": tracks.sample_rate,
+        "hop_length": tracks.hop_length,
+        "pitch_range": list(tracks.pitch_range),
+        "num_frames": int(len(tracks.rms)),
+        "created": time.time(),
+    }
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    if os.path.exists(path):
+        shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # 另一個請求同時寫入了同一份軌跡，內容相同，保留先寫完的
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return path
+
+
+def load_tracks(content_hash, pitch_tracker=None, store_dir=None):
+    """
+    以 memory-map 開啟已存的軌跡，沒有或格式不符時回傳 None
+    """
+    path = track_store_path(content_hash, pitch_tracker, store_dir)
+    try:
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != _FORMAT_VERSION:
+            return None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in _TRACK_ARRAYS + INDEX_ARRAYS}
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Failed to open stored tracks at {path}: {e}")
+        return None
+    return FrameTracks(arrays["f0"], arrays["voiced"], arrays["rms"], arrays["block_peaks"],
+                       sample_rate=meta["sample_rate"], hop_length=meta["hop_length"],
+                       pitch_range=tuple(meta["pitch_range"]),
+                       index={name: arrays[name] for name in INDEX_ARRAYS})
+
+
+def get_or_compute_tracks(source, content_hash, pitch_tracker=None, store_dir=None):
+    """
+    先從 feature store 開啟，沒有時計算整個音檔的軌跡並存起來
+    """
+    start = time.perf_counter()
+    tracks = load_tracks(content_hash, pitch_tracker, store_dir)
+    if tracks is not None:
+        print(f"Opened stored frame tracks for {content_hash} in {time.perf_counter() - start:.3f}s")
+        return tracks
+    tracks = FrameTracks.compute(source, pitch_tracker=pitch_tracker)
+    save_tracks(content_hash, tracks, pitch_tracker, store_dir)
+    print(f"Computed and stored frame tracks for {content_hash} in {time.perf_counter() - start:.2f}s")
+    return tracks
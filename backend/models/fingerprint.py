@@ -0,0 +1,55 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 音檔內容指紋：每個檔案只以串流方式 hash 一次，之後依 (路徑, 大小, mtime, inode) 查表
+# 仍使用 MD5，與既有快取的 key 相容
+CHUNK_SIZE = 1 << 20
+MEMO_SIZE = int(os.environ.get("FINGERPRINT_MEMO_SIZE", "1024"))
+
+_memo = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "bytes_hashed": 0}
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    """
+    以固定大小的區塊串流計算 MD5，不把整個檔案讀進記憶體
+    """
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """
+    回傳檔案內容的 MD5 hex；檔案沒有變動（大小、mtime、inode 相同）時直接使用先前的結果
+    """
+    key = _stat_key(path)
+    with _lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            _stats["hits"] += 1
+            return _memo[key]
+    fingerprint = hash_file(path)
+    with _lock:
+        _stats["misses"] += 1
+        _stats["bytes_hashed"] += key[1]
+        _memo[key] = fingerprint
+        _memo.move_to_end(key)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return fingerprint
+
+
+def fingerprint_stats():
+    with _lock:
+        return dict(_stats, memo_entries=len(_memo))
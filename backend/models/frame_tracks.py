@@ -0,0 +1,182 @@
+import librosa
+import numpy as np
+from models.audio_buffer import AudioBuffer, SAMPLE_RATE
+from models.pitch_tracker import track_pitch_blocked, frame_blocks, block_audio, FRAME_LENGTH, HOP_LENGTH, PITCH_RANGE
+
+
+def _prefix(values):
+    return np.concatenate([[0.0], np.cumsum(values, dtype=np.float64)])
+
+
+class _RangeMax:
+    """
+    Sparse table：O(n log n) 建表後任意區間最大值 O(1)
+    各層串接成一個 table，offsets[level] 為該層的起點，可以直接存成 .npy 再以 memory-map 開啟
+    """
+    def __init__(self, table, offsets):
+        self.table = table
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, values):
+        levels = [np.asarray(values, dtype=np.float32)]
+        width = 1
+        while 2 * width <= len(values):
+            prev = levels[-1]
+            levels.append(np.maximum(prev[:-width], prev[width:]))
+            width *= 2
+        offsets = np.cumsum([0] + [len(level) for level in levels[:-1]], dtype=np.int64)
+        return cls(np.concatenate(levels), offsets)
+
+    def query(self, start, end):
+        if end <= start:
+            return 0.0
+        level = int(np.log2(end - start))
+        offset = int(self.offsets[level])
+        return float(max(self.table[offset + start], self.table[offset + end - (1 << level)]))
+
+
+INDEX_ARRAYS = ("pitch_count", "pitch_sum", "pitch_sq", "rms_sum", "rms_sq", "peak_table", "peak_offsets")
+
+
+class FrameTracks:
+    """
+    整個音檔只計算一次的 frame 級 pitch / voicing / RMS 軌跡，
+    任意時間範圍的 prosody 統計以前綴和在 O(1) 內取得
+    index 為 index_arrays() 存下的前綴和與 range-max 表（feature store 以 memory-map 開啟），傳入時不重新建表
+    """
+    def __init__(self, f0, voiced, rms, block_peaks, sample_rate=SAMPLE_RATE, hop_length=HOP_LENGTH,
+                 pitch_range=PITCH_RANGE, index=None):
+        self.f0 = np.asarray(f0, dtype=np.float32)
+        self.voiced = np.asarray(voiced, dtype=bool)
+        self.rms = np.asarray(rms, dtype=np.float32)
+        self.block_peaks = np.asarray(block_peaks, dtype=np.float32)
+        self.sample_rate = sample_rate
+        self.hop_length = hop_length
+        self.pitch_range = pitch_range
+        if index is None:
+            self._build_index()
+        else:
+            self._pitch_count, self._pitch_sum, self._pitch_sq, self._rms_sum, self._rms_sq = (
+                index[name] for name in INDEX_ARRAYS[:5])
+            self._peaks = _RangeMax(index["peak_table"], index["peak_offsets"])
+
+    def _build_index(self):
+        # 與 analyze_prosody 相同：只統計有聲且在 80–600 Hz 內的 frame
+        f0 = np.nan_to_num(self.f0.astype(np.float64))
+        valid = self.voiced & (f0 > self.pitch_range[0]) & (f0 < self.pitch_range[1])
+        pitch = np.where(valid, f0, 0.0)
+        self._pitch_count = _prefix(valid)
+        self._pitch_sum = _prefix(pitch)
+        self._pitch_sq = _prefix(pitch ** 2)
+        rms = self.rms.astype(np.float64)
+        self._rms_sum = _prefix(rms)
+        self._rms_sq = _prefix(rms ** 2)
+        self._peaks = _RangeMax.build(self.block_peaks)
+
+    def index_arrays(self):
+        """
+        前綴和與 range-max 表，名稱同 INDEX_ARRAYS
+        """
+        return {
+            "pitch_count": self._pitch_count,
+            "pitch_sum": self._pitch_sum,
+            "pitch_sq": self._pitch_sq,
+            "rms_sum": self._rms_sum,
+            "rms_sq": self._rms_sq,
+            "peak_table": self._peaks.table,
+            "peak_offsets": self._peaks.offsets,
+        }
+
+    @classmethod
+    def compute(cls, source, pitch_tracker=None, sample_rate=SAMPLE_RATE, frame_length=FRAME_LENGTH,
+                hop_length=HOP_LENGTH, block_frames=None):
+        """
+        從音檔路徑或 AudioBuffer 計算整個音檔的軌跡
+        pitch 與 RMS 以 block_frames（預設 PITCH_BLOCK_FRAMES）個 frame 為一塊分段計算，峰值記憶體不隨錄音長度增加
+        """
+        buffer = source if isinstance(source, AudioBuffer) else AudioBuffer.from_file(source, sample_rate)
+        audio = buffer.audio
+        peak = np.max(np.abs(audio)) if len(audio) else 0.0
+
+        f0, voiced = track_pitch_blocked(audio, buffer.sample_rate, tracker=pitch_tracker, block_frames=block_frames,
+                                         frame_length=frame_length, hop_length=hop_length,
+                                         scale=1.0 / peak if peak > 0 else 1.0)
+        rms = np.concatenate([
+            librosa.feature.rms(y=block_audio(audio, chunk_start, chunk_end), frame_length=frame_length,
+                                hop_length=hop_length).flatten()[skip:skip + count]
+            for chunk_start, chunk_end, skip, count in frame_blocks(len(audio), block_frames, frame_length, hop_length)
+        ])
+        # 每 hop 個樣本的峰值，用來重現 analyze_prosody 對每段做的 peak normalize
+        num_blocks = int(np.ceil(len(audio) / hop_length))
+        padded = np.pad(np.abs(audio), (0, num_blocks * hop_length - len(audio)))
+        block_peaks = padded.reshape(num_blocks, hop_length).max(axis=1) if num_blocks else np.zeros(0)
+
+        num_frames = min(len(f0), len(rms))
+        return cls(f0[:num_frames], voiced[:num_frames], rms[:num_frames], block_peaks,
+                   buffer.sample_rate, hop_length)
+
+    @property
+    def duration(self):
+        return len(self.block_peaks) * self.hop_length / self.sample_rate
+
+    def frame_range(self, start_time=None, end_time=None):
+        """
+        中心落在 [start_time, end_time] 內的 frame 區間 [i0, i1)
+        """
+        frames_per_second = self.sample_rate / self.hop_length
+        i0 = 0 if start_time is None else int(np.ceil(start_time * frames_per_second))
+        i1 = len(self.rms) if end_time is None else int(np.floor(end_time * frames_per_second)) + 1
+        i0 = min(max(i0, 0), len(self.rms))
+        return i0, min(max(i1, i0), len(self.rms))
+
+    def _peak(self, start_time, end_time):
+        b0 = int((start_time or 0) * self.sample_rate) // self.hop_length
+        b1 = len(self.block_peaks) if end_time is None else int(np.ceil(end_time * self.sample_rate / self.hop_length))
+        return self._peaks.query(max(b0, 0), min(b1, len(self.block_peaks)))
+
+    def pitch_stats(self, start_time=None, end_time=None):
+        """
+        Returns:
+        - (pitch_mean, pitch_variation, voiced_frames)
+        """
+        i0, i1 = self.frame_range(start_time, end_time)
+        count = self._pitch_count[i1] - self._pitch_count[i0]
+        if count <= 0:
+            return 0.0, 0.0, 0
+        mean = (self._pitch_sum[i1] - self._pitch_sum[i0]) / count
+        variance = (self._pitch_sq[i1] - self._pitch_sq[i0]) / count - mean ** 2
+        return float(mean), float(np.sqrt(max(variance, 0.0))), int(count)
+
+    def energy_stats(self, start_time=None, end_time=None):
+        """
+        Returns:
+        - (energy_mean, energy_variation)，已依該範圍的峰值正規化
+        """
+        i0, i1 = self.frame_range(start_time, end_time)
+        count = i1 - i0
+        if count <= 0:
+            return 0.0, 0.0
+        peak = self._peak(start_time, end_time)
+        scale = 1.0 / peak if peak > 0 else 1.0
+        mean = (self._rms_sum[i1] - self._rms_sum[i0]) / count
+        variance = (self._rms_sq[i1] - self._rms_sq[i0]) / count - mean ** 2
+        return float(mean * scale), float(np.sqrt(max(variance, 0.0)) * scale)
+
+    def prosody(self, start_time=None, end_time=None):
+        """
+        與 analyze_prosody 相同格式的結果
+        """
+        if start_time is not None and end_time is not None:
+            duration = end_time - start_time
+        else:
+            duration = self.duration - (start_time or 0)
+        pitch_mean, pitch_variation, _ = self.pitch_stats(start_time, end_time)
+        energy_mean, energy_variation = self.energy_stats(start_time, end_time)
+        return {
+            "Duration": duration,
+            "Pitch Mean": pitch_mean,
+            "Pitch Variation": pitch_variation,
+            "Energy Mean": energy_mean,
+            "Energy Variation": energy_variation,
+        }
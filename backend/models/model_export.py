@@ -0,0 +1,176 @@
+"""
+將 HuBERT 情緒模型與結巴模型匯出為 ONNX，並與 eager PyTorch 比對數值
+
+用法（在 backend 目錄下執行）：
+    python -m models.model_export --model all --audio data/lecture.wav --clips 20
+
+給 --audio 時從真實音檔切出 Whisper 語段長度的 clip，經過特徵擷取器後逐段比對 logits 與標籤一致率；
+否則以隨機輸入比對。
+"""
+import argparse
+import os
+import numpy as np
+import torch
+from models.onnx_runtime import EXPORT_DIR, OnnxClassifier
+from models.quantization import agreement_report
+
+EMOTION_ONNX_PATH = os.environ.get("EMOTION_ONNX_PATH", os.path.join(EXPORT_DIR, "emotion.onnx"))
+STUTTER_ONNX_PATH = os.environ.get("STUTTER_ONNX_PATH", os.path.join(EXPORT_DIR, "stutter.onnx"))
+OPSET_VERSION = 17
+
+
+class _LogitsOnly(torch.nn.Module):
+    # transformers 的分類模型回傳 ModelOutput，匯出時只保留 logits
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_values):
+        return self.model(input_values).logits
+
+
+def _export(module, inputs, input_names, output_path):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    dynamic_axes = {name: {0: "batch", 1: "samples"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+    with torch.no_grad():
+        torch.onnx.export(
+            module, inputs, output_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET_VERSION,
+            do_constant_folding=True,
+        )
+    print(f"Exported {output_path}")
+    return output_path
+
+
+def load_eager_stutter_model():
+    from transformers import AutoModelForAudioClassification
+    from models.prosody_analyzer import MODEL_PATH
+    model = AutoModelForAudioClassification.from_pretrained(MODEL_PATH)
+    model.eval()
+    return model
+
+
+def export_emotion_model(output_path=EMOTION_ONNX_PATH):
+    """
+    匯出情緒模型，輸入為 input_values 與 attention_mask（batch 與長度皆為動態）
+    """
+    from models.audio_emotion_classifier import load_emotion_model, sample_rate
+    _, model = load_emotion_model()
+    dummy = torch.randn(2, 3 * sample_rate)
+    mask = torch.ones(2, 3 * sample_rate, dtype=torch.long)
+    return _export(model, (dummy, mask), ["input_values", "attention_mask"], output_path)
+
+
+def export_stutter_model(output_path=STUTTER_ONNX_PATH):
+    """
+    匯出結巴模型，輸入為 input_values（batch 與長度皆為動態）
+    """
+    model = load_eager_stutter_model()
+    dummy = torch.randn(1, 3 * 16000)
+    return _export(_LogitsOnly(model), (dummy,), ["input_values"], output_path)
+
+
+def sample_clips(audio_path, num_clips=20, seed=0, sample_rate=16000, median_seconds=3.0, sigma=0.6,
+                 low=0.5, high=15.0):
+    """
+    從真實音檔隨機切出 num_clips 段，長度模擬 Whisper 語段（對數常態，中位數約 3 秒）
+    """
+    from models.audio_buffer import AudioBuffer
+    rng = np.random.default_rng(seed)
+    audio = AudioBuffer.from_file(audio_path, sample_rate).audio
+    clips = []
+    for seconds in np.clip(rng.lognormal(np.log(median_seconds), sigma, size=num_clips), low, high):
+        length = min(int(seconds * sample_rate), len(audio))
+        start = rng.integers(0, len(audio) - length + 1)
+        clips.append(audio[start:start + length])
+    return clips
+
+
+def _as_results(logits):
+    scores = np.exp(logits - logits.max(axis=1, keepdims=True))
+    scores = scores / scores.sum(axis=1, keepdims=True)
+    return [(int(row.argmax()), float(row.max()), dict(enumerate(row))) for row in scores]
+
+
+def validate_export(onnx_path, eager_fn, lengths_seconds=(1.0, 2.7, 6.0), batch_size=2, atol=1e-3, seed=0,
+                    clips=None, preprocess=None):
+    """
+    比較 ONNX 與 eager 模型的 logits
+    給 clips（16 kHz 波形）時逐段以 preprocess（特徵擷取器）轉成 input_values 後比對，否則以不同長度的隨機輸入比對
+
+    Returns:
+    - report: 每個輸入的最大絕對誤差與 argmax 是否一致、兩者的標籤一致率與分數差（agreement_report），以及整體是否通過
+    """
+    if clips is not None:
+        inputs = [preprocess(clip) if preprocess else torch.from_numpy(np.asarray(clip, dtype=np.float32))[None]
+                  for clip in clips]
+    else:
+        rng = np.random.default_rng(seed)
+        inputs = [torch.from_numpy(rng.standard_normal((batch_size, int(seconds * 16000))).astype(np.float32))
+                  for seconds in lengths_seconds]
+    onnx_model = OnnxClassifier(onnx_path)
+    report = {"checks": [], "passed": True}
+    reference, candidate = [], []
+    for x in inputs:
+        seconds = x.shape[1] / 16000
+        with torch.no_grad():
+            expected = eager_fn(x).numpy()
+        actual = onnx_model(x.numpy()).numpy()
+        max_abs_diff = float(np.max(np.abs(expected - actual)))
+        argmax_match = bool(np.all(expected.argmax(axis=1) == actual.argmax(axis=1)))
+        passed = max_abs_diff <= atol and argmax_match
+        reference.extend(_as_results(expected))
+        candidate.extend(_as_results(actual))
+        report["checks"].append({"seconds": seconds, "max_abs_diff": max_abs_diff, "argmax_match": argmax_match})
+        report["passed"] = report["passed"] and passed
+        if clips is None:
+            print(f"{os.path.basename(onnx_path)} {seconds:.1f}s: max |diff| = {max_abs_diff:.2e}, "
+                  f"argmax match = {argmax_match}")
+    report["agreement"] = agreement_report(reference, candidate)
+    print(f"{os.path.basename(onnx_path)} on {len(inputs)} {'audio clips' if clips is not None else 'random inputs'}: "
+          f"max |diff| = {max(c['max_abs_diff'] for c in report['checks']):.2e}, "
+          f"label agreement {report['agreement']['label_agreement']:.1%}, "
+          f"max score delta {report['agreement']['max_score_delta']:.4f}")
+    if not report["passed"]:
+        print(f"Warning: {onnx_path} does not match the eager model within atol={atol}")
+    return report
+
+
+def export_and_validate(which="all", audio_path=None, num_clips=20, seed=0):
+    """
+    給 audio_path 時以該音檔切出的 clip 驗證，否則以隨機輸入驗證
+    """
+    clips = sample_clips(audio_path, num_clips, seed) if audio_path else None
+    reports = {}
+    if which in ("emotion", "all"):
+        from models.audio_emotion_classifier import load_emotion_model, sample_rate
+        path = export_emotion_model()
+        processor, eager = load_emotion_model()
+        reports["emotion"] = validate_export(
+            path, lambda x: eager(x), seed=seed, clips=clips,
+            preprocess=lambda clip: processor(clip, sampling_rate=sample_rate, return_tensors="pt").input_values)
+    if which in ("stutter", "all"):
+        from transformers import AutoFeatureExtractor
+        from models.prosody_analyzer import MODEL_PATH
+        path = export_stutter_model()
+        eager = load_eager_stutter_model()
+        feature_extractor = AutoFeatureExtractor.from_pretrained(MODEL_PATH)
+        reports["stutter"] = validate_export(
+            path, lambda x: eager(x).logits, seed=seed, clips=clips,
+            preprocess=lambda clip: feature_extractor(clip, sampling_rate=feature_extractor.sampling_rate,
+                                                      return_tensors="pt").input_values)
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export HuBERT classifiers to ONNX")
+    parser.add_argument("--model", choices=["emotion", "stutter", "all"], default="all")
+    parser.add_argument("--audio", default=None, help="Wav file to slice validation clips from")
+    parser.add_argument("--clips", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    export_and_validate(args.model, args.audio, args.clips, args.seed)
@@ -0,0 +1,56 @@
+import threading
+import time
+
+# 延遲載入的模型登記表：模型在第一次使用時才載入，並記錄載入時間
+_loaders = {}
+_instances = {}
+_load_times = {}
+_registry_lock = threading.RLock()
+
+
+def register_model(name, loader):
+    """
+    登記模型的載入函式（不會立即載入）
+    """
+    _loaders[name] = loader
+
+
+def get_model(name):
+    """
+    取得模型，第一次呼叫時才執行載入函式
+    """
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+
+    with _registry_lock:
+        if name not in _instances:
+            if name not in _loaders:
+                raise KeyError(f"Unknown model: {name}. Registered models: {list(_loaders.keys())}")
+            start = time.perf_counter()
+            _instances[name] = _loaders[name]()
+            _load_times[name] = time.perf_counter() - start
+            print(f"Loaded model '{name}' in {_load_times[name]:.2f}s")
+    return _instances[name]
+
+
+def is_loaded(name):
+    return name in _instances
+
+
+def unload_model(name):
+    with _registry_lock:
+        _instances.pop(name, None)
+
+
+def model_stats():
+    """
+    每個已登記模型是否已載入，以及載入花費的秒數
+    """
+    return {
+        name: {
+            "loaded": name in _instances,
+            "load_seconds": round(_load_times[name], 3) if name in _load_times else None,
+        }
+        for name in _loaders
+    }
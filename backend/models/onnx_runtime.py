@@ -0,0 +1,90 @@
+import os
+import numpy as np
+import torch
+
+# 匯出的 ONNX 模型預設放在 backend/exported_models
+EXPORT_DIR = os.environ.get(
+    "EXPORTED_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "exported_models")
+)
+DEFAULT_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", "0"))  # 0 表示由 onnxruntime 決定
+DEFAULT_INTER_OP_THREADS = int(os.environ.get("ONNX_INTER_OP_THREADS", "1"))
+
+
+def create_session(onnx_path, intra_op_threads=None, inter_op_threads=None, graph_optimization="all",
+                   optimized_model_path=None):
+    """
+    建立 CPU 推論用的 onnxruntime session
+
+    Args:
+    - intra_op_threads: 單一運算子內的平行執行緒數
+    - inter_op_threads: 運算子之間的平行執行緒數（>1 時使用平行執行模式）
+    - graph_optimization: "disable" / "basic" / "extended" / "all"
+    - optimized_model_path: 將最佳化後的圖存檔，下次可直接載入
+    """
+    import onnxruntime as ort
+
+    levels = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    if graph_optimization not in levels:
+        raise ValueError(f"Unknown graph optimization level: {graph_optimization}. Supported: {list(levels.keys())}")
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = DEFAULT_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+    options.inter_op_num_threads = DEFAULT_INTER_OP_THREADS if inter_op_threads is None else inter_op_threads
+    options.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if options.inter_op_num_threads > 1
+                              else ort.ExecutionMode.ORT_SEQUENTIAL)
+    options.graph_optimization_level = levels[graph_optimization]
+    if optimized_model_path:
+        options.optimized_model_filepath = optimized_model_path
+    return ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class OnnxClassifier:
+    """
+    ONNX 版的音訊分類模型，呼叫介面與 HubertForSpeechClassification 相同：
+    model(input_values, attention_mask=None) 回傳 logits tensor
+    """
+    def __init__(self, onnx_path, intra_op_threads=None, inter_op_threads=None, graph_optimization="all"):
+        self.onnx_path = onnx_path
+        self.session = create_session(onnx_path, intra_op_threads, inter_op_threads, graph_optimization)
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def __call__(self, input_values, attention_mask=None):
+        input_values = np.asarray(input_values, dtype=np.float32)
+        feeds = {"input_values": input_values}
+        if "attention_mask" in self.input_names:
+            if attention_mask is None:
+                attention_mask = np.ones(input_values.shape, dtype=np.int64)
+            feeds["attention_mask"] = np.asarray(attention_mask, dtype=np.int64)
+        logits = self.session.run(["logits"], feeds)[0]
+        return torch.from_numpy(logits)
+
+    def eval(self):
+        return self
+
+
+class OnnxAudioClassificationPipeline:
+    """
+    取代 transformers 的 audio-classification pipeline：輸入波形，
+    回傳依分數排序的 [{"label", "score"}, ...]
+    """
+    def __init__(self, onnx_path, feature_extractor, id2label, **session_kwargs):
+        self.model = OnnxClassifier(onnx_path, **session_kwargs)
+        self.feature_extractor = feature_extractor
+        self.id2label = {int(k): v for k, v in id2label.items()}
+
+    def __call__(self, audio):
+        inputs = self.feature_extractor(audio, sampling_rate=self.feature_extractor.sampling_rate,
+                                        return_tensors="np")
+        logits = self.model(inputs["input_values"]).numpy()[0]
+        probs = np.exp(logits - logits.max())
+        probs = probs / probs.sum()
+        return [
+            {"label": self.id2label[i], "score": float(probs[i])}
+            for i in np.argsort(-probs)
+        ]
@@ -0,0 +1,140 @@
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# 多核心的 prosody 分析：整個波形只複製一次到 shared memory，worker 只收到 (start, end)，不必 pickle 陣列
+PROSODY_WORKERS = int(os.environ.get("PROSODY_WORKERS", "1"))  # 1 = 在主程序逐段計算，0 = 使用全部核心
+PROSODY_WORKER_THREADS = int(os.environ.get("PROSODY_WORKER_THREADS", "1"))  # 每個 worker 的 BLAS / numba 執行緒數
+PROSODY_MP_CONTEXT = os.environ.get("PROSODY_MP_CONTEXT", "spawn")  # 已載入 torch 的程序 fork 不安全，預設 spawn
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                    "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS", "NUMBA_NUM_THREADS")
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def resolve_workers(workers=None):
+    """
+    None 時使用 PROSODY_WORKERS，<= 0 時使用全部核心
+    """
+    workers = PROSODY_WORKERS if workers is None else int(workers)
+    return (os.cpu_count() or 1) if workers <= 0 else workers
+
+
+def _init_worker(num_threads):
+    # 還沒載入的函式庫由環境變數限制；已載入的（spawn 會先 import 主程式）在執行期調整
+    for name in _THREAD_ENV_VARS:
+        os.environ[name] = str(num_threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=num_threads)
+    except ImportError:
+        pass
+    try:
+        import numba
+        numba.set_num_threads(min(num_threads, numba.config.NUMBA_NUM_THREADS))
+    except ImportError:
+        pass
+
+
+def get_prosody_pool(workers=None, threads_per_worker=None):
+    """
+    取得共用的 process pool（依 worker 數快取，跨請求重複使用）
+    """
+    workers = resolve_workers(workers)
+    threads_per_worker = threads_per_worker or PROSODY_WORKER_THREADS
+    key = (workers, threads_per_worker)
+    with _pools_lock:
+        if key not in _pools:
+            print(f"Starting prosody process pool: {workers} workers x {threads_per_worker} threads ({PROSODY_MP_CONTEXT})")
+            _pools[key] = ProcessPoolExecutor(max_workers=workers,
+                                              mp_context=multiprocessing.get_context(PROSODY_MP_CONTEXT),
+                                              initializer=_init_worker, initargs=(threads_per_worker,))
+        return _pools[key]
+
+
+@atexit.register
+def shutdown_prosody_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+
+
+def _attach(name):
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13：worker 與主程序共用同一個 resource tracker，重複登記無妨，由主程序 unlink
+        return shared_memory.SharedMemory(name=name)
+
+
+def _analyze_shared(name, length, sample_rate, start_time, end_time, pitch_tracker):
+    """
+    worker 端：attach shared memory 成零複製的 ndarray，再用一般的 analyze_prosody 計算這段
+    """
+    import numpy as np
+    from models.audio_buffer import AudioBuffer
+    from models.prosody_analyzer import analyze_prosody
+    shm = _attach(name)
+    try:
+        audio = np.ndarray(length, dtype=np.float32, buffer=shm.buf)
+        result = analyze_prosody(AudioBuffer(audio, sample_rate), start_time=start_time, end_time=end_time,
+                                 sample_rate=sample_rate, pitch_tracker=pitch_tracker)
+        del audio
+        return result
+    finally:
+        shm.close()
+
+
+class SharedAudio:
+    """
+    AudioBuffer 在 shared memory 裡的一份拷貝，由建立者負責 close（unlink）
+    """
+    def __init__(self, audio_buffer):
+        import numpy as np
+        from multiprocessing import shared_memory
+        self.sample_rate = audio_buffer.sample_rate
+        self.length = len(audio_buffer.audio)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(audio_buffer.audio.nbytes, 1))
+        np.ndarray(self.length, dtype=np.float32, buffer=self._shm.buf)[:] = audio_buffer.audio
+        self.name = self._shm.name
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+class ParallelProsodyExecutor:
+    """
+    每個請求一個：submit(start, end) 回傳 Future（結果同 analyze_prosody），
+    呼叫端依送出順序取結果即可保持語段順序
+    """
+    def __init__(self, audio_buffer, workers=None, pitch_tracker=None):
+        self.pool = get_prosody_pool(workers)
+        self.pitch_tracker = pitch_tracker
+        self.shared = SharedAudio(audio_buffer)
+        self._futures = []
+
+    def submit(self, start_time, end_time):
+        future = self.pool.submit(_analyze_shared, self.shared.name, self.shared.length, self.shared.sample_rate,
+                                  start_time, end_time, self.pitch_tracker)
+        self._futures.append(future)
+        return future
+
+    def close(self):
+        # 請求中斷時取消還沒開始的段落，再釋放 shared memory
+        for future in self._futures:
+            future.cancel()
+        self.shared.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,192 @@
+import os
+import inspect
+import numpy as np
+
+# 可替換的音高追蹤器：每個追蹤器回傳 (f0, voiced_flag)，格式與 librosa.pyin 相同（無聲 frame 的 f0 為 NaN）
+DEFAULT_PITCH_TRACKER = os.environ.get("PITCH_TRACKER", "pyin")
+FMIN = 65.40639132514966  # librosa.note_to_hz('C2')
+FMAX = 1046.5022612023945  # librosa.note_to_hz('C6')
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+PITCH_RANGE = (80, 600)  # analyze_prosody 只統計這個範圍內的音高
+# 原本的 librosa.pyin 呼叫沒有傳 sr（librosa 預設 22050），16 kHz 音訊的 F0 是真實 Hz 的 22050 / 16000 倍；
+# 既有的門檻（analyze_pitch_segments 的 15、30–60 Hz 與 PITCH_RANGE）都以這個單位調出，所有追蹤器都回傳這個單位
+LEGACY_PYIN_SR = 22050
+# 整個音檔追蹤時每次處理的 frame 數（16 kHz 下約 65 秒），峰值記憶體固定，不隨錄音長度增加
+PITCH_BLOCK_FRAMES = int(os.environ.get("PITCH_BLOCK_FRAMES", "2048"))
+
+
+def pyin_tracker(audio, sr, fmin=FMIN, fmax=FMAX, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH):
+    """
+    原本的 librosa.pyin（準確但慢）；與原本的呼叫相同不傳 sr，F0 為 LEGACY_PYIN_SR 單位（sr 只為了與其他追蹤器介面一致）
+    """
+    import librosa
+    f0, voiced_flag, _ = librosa.pyin(audio, fmin=fmin, fmax=fmax,
+                                      frame_length=frame_length, hop_length=hop_length)
+    return f0, voiced_flag
+
+
+def _frame(audio, frame_length, hop_length):
+    # 與 librosa 的 center=True 相同：前後補零半個 frame
+    padded = np.pad(audio, frame_length // 2)
+    if len(padded) < frame_length:
+        padded = np.pad(padded, (0, frame_length - len(padded)))
+    return np.lib.stride_tricks.sliding_window_view(padded, frame_length)[::hop_length]
+
+
+def _cumulative_mean_normalized_difference(frames, max_lag):
+    """
+    一次算完所有 frame 的 YIN 差分函數 d(tau) 並做累積平均正規化
+    """
+    frame_length = frames.shape[1]
+    window = frame_length - max_lag
+    n_fft = 1 << int(np.ceil(np.log2(frame_length + window)))
+
+    # 自相關 sum_j x[j] * x[j + tau]（j < window），用 FFT 一次算完
+    spectrum = np.fft.rfft(frames, n_fft, axis=1)
+    head = np.fft.rfft(frames[:, :window], n_fft, axis=1)
+    acf = np.fft.irfft(spectrum * np.conj(head), n_fft, axis=1)[:, :max_lag + 1]
+
+    # 能量項以平方的前綴和取得
+    energy = np.concatenate([np.zeros((frames.shape[0], 1)), np.cumsum(frames ** 2, axis=1)], axis=1)
+    lags = np.arange(max_lag + 1)
+    energy_lag = energy[:, lags + window] - energy[:, lags]
+    diff = np.maximum(energy[:, [window]] + energy_lag - 2 * acf, 0.0)
+
+    cumulative = np.cumsum(diff[:, 1:], axis=1)
+    cmnd = np.ones_like(diff)
+    cmnd[:, 1:] = diff[:, 1:] * lags[1:] / np.maximum(cumulative, 1e-12)
+    return cmnd
+
+
+def yin_tracker(audio, sr, fmin=FMIN, fmax=FMAX, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH,
+                threshold=0.15, silence_db=-60.0, reference_rms=None):
+    """
+    向量化的 YIN：所有 frame 以 NumPy 一次處理，速度遠快於 pyin
+    fmin / fmax 與回傳的 F0 都和 pyin_tracker 相同是 LEGACY_PYIN_SR 單位（真實 Hz 的 LEGACY_PYIN_SR / sr 倍），門檻可以共用
+    reference_rms: 靜音門檻的參考音量，None 時為這段音訊最大的 frame RMS（分塊追蹤時傳入整個音檔的值）
+
+    Returns:
+    - f0: 每個 frame 的基頻（無聲為 NaN）
+    - voiced_flag: 每個 frame 是否有聲
+    """
+    audio = np.asarray(audio, dtype=np.float64)
+    # 以 LEGACY_PYIN_SR 單位的頻率換算 lag 時使用 LEGACY_PYIN_SR，與 pyin 的搜尋範圍相同
+    min_lag = max(int(np.floor(LEGACY_PYIN_SR / fmax)), 1)
+    max_lag = int(np.ceil(LEGACY_PYIN_SR / fmin))
+    if frame_length <= max_lag + 1:
+        raise ValueError(f"frame_length must exceed {max_lag + 1} samples for fmin={fmin} Hz")
+
+    frames = _frame(audio, frame_length, hop_length)
+    cmnd = _cumulative_mean_normalized_difference(frames, max_lag + 1)
+
+    # 在 [min_lag, max_lag] 找第一個低於門檻的局部最小值
+    search = cmnd[:, min_lag:max_lag + 1]
+    left = cmnd[:, min_lag - 1:max_lag]
+    right = cmnd[:, min_lag + 1:max_lag + 2]
+    candidates = (search < threshold) & (search <= left) & (search <= right)
+    has_candidate = candidates.any(axis=1)
+    tau = np.argmax(candidates, axis=1) + min_lag
+
+    # 拋物線內插取得次取樣精度
+    rows = np.arange(len(tau))
+    prev, curr, nxt = cmnd[rows, tau - 1], cmnd[rows, tau], cmnd[rows, tau + 1]
+    denom = prev - 2 * curr + nxt
+    shift = np.where(np.abs(denom) > 1e-12, 0.5 * (prev - nxt) / np.where(denom == 0, 1, denom), 0.0)
+    period = tau + np.clip(shift, -1, 1)
+
+    # 極小聲的 frame 直接視為無聲
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    reference_rms = rms.max() if reference_rms is None else reference_rms
+    loud = 20 * np.log10(np.maximum(rms, 1e-10) / max(reference_rms, 1e-10)) > silence_db
+
+    voiced_flag = has_candidate & loud
+    f0 = np.where(voiced_flag, LEGACY_PYIN_SR / period, np.nan)
+    return f0, voiced_flag
+
+
+PITCH_TRACKERS = {
+    "pyin": pyin_tracker,
+    "yin": yin_tracker,
+}
+
+
+def register_pitch_tracker(name, tracker_fn):
+    """
+    註冊新的音高追蹤器，tracker_fn(audio, sr, ...) 需回傳 (f0, voiced_flag)
+    """
+    PITCH_TRACKERS[name] = tracker_fn
+
+
+def track_pitch(audio, sr, tracker=None, **kwargs):
+    """
+    以指定的追蹤器估計音高，tracker 為 None 時使用 PITCH_TRACKER 環境變數（預設 pyin）
+    """
+    tracker = tracker or DEFAULT_PITCH_TRACKER
+    if tracker not in PITCH_TRACKERS:
+        raise ValueError(f"Unknown pitch tracker: {tracker}. Supported trackers: {list(PITCH_TRACKERS.keys())}")
+    return PITCH_TRACKERS[tracker](audio, sr, **kwargs)
+
+
+def frame_blocks(num_samples, block_frames=None, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH):
+    """
+    將 center=True 的 frame 序列切成每塊 block_frames 個 frame，
+    每塊前後多取 frame_length 個樣本（對齊 hop）當作重疊，讓每個保留的 frame 都看到與整段處理時相同的樣本
+
+    Yields:
+    - (chunk_start, chunk_end, skip, count)：對 audio[chunk_start:chunk_end]（chunk_start < 0 的部分補零）
+      以 center=True 分 frame 後，第 skip 起的 count 個 frame 即整個音檔的第 i0 起的 frame
+    """
+    block_frames = block_frames or PITCH_BLOCK_FRAMES
+    num_frames = 1 + num_samples // hop_length
+    overlap = -(-frame_length // hop_length) * hop_length
+    for i0 in range(0, num_frames, block_frames):
+        i1 = min(i0 + block_frames, num_frames)
+        yield i0 * hop_length - overlap, (i1 - 1) * hop_length + overlap + 1, overlap // hop_length, i1 - i0
+
+
+def block_audio(audio, chunk_start, chunk_end):
+    # 音檔開頭之前的部分補零，與 center=True 的補零相同
+    chunk = audio[max(chunk_start, 0):chunk_end]
+    return np.pad(chunk, (-chunk_start, 0)) if chunk_start < 0 else chunk
+
+
+def track_pitch_blocked(audio, sr, tracker=None, block_frames=None, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH,
+                        scale=1.0, **kwargs):
+    """
+    整個音檔的音高追蹤：分塊呼叫 track_pitch 再串接，峰值記憶體只與 block_frames 有關
+    scale 在每塊上相乘（例如 1 / peak），不必先複製整個正規化後的音檔
+    pyin 的 Viterbi 解碼在每塊重新開始，塊邊界附近的有聲判定可能與整段解碼略有不同
+    """
+    tracker = tracker or DEFAULT_PITCH_TRACKER
+    if tracker not in PITCH_TRACKERS:
+        raise ValueError(f"Unknown pitch tracker: {tracker}. Supported trackers: {list(PITCH_TRACKERS.keys())}")
+    blocks = list(frame_blocks(len(audio), block_frames, frame_length, hop_length))
+    if "reference_rms" in inspect.signature(PITCH_TRACKERS[tracker]).parameters and "reference_rms" not in kwargs:
+        # 以音量做門檻的追蹤器需要整個音檔的參考值，先以同樣的分塊算出最大 frame RMS
+        kwargs["reference_rms"] = max(
+            float(np.sqrt(np.mean(_frame(block_audio(audio, a, b).astype(np.float64) * scale,
+                                         frame_length, hop_length)[skip:skip + count] ** 2, axis=1)).max())
+            for a, b, skip, count in blocks
+        )
+    f0_blocks, voiced_blocks = [], []
+    for chunk_start, chunk_end, skip, count in blocks:
+        chunk = block_audio(audio, chunk_start, chunk_end) * scale
+        f0, voiced = track_pitch(chunk, sr, tracker=tracker, frame_length=frame_length, hop_length=hop_length, **kwargs)
+        f0_blocks.append(f0[skip:skip + count])
+        voiced_blocks.append(voiced[skip:skip + count])
+    return np.concatenate(f0_blocks), np.concatenate(voiced_blocks)
+
+
+def summarize_pitch(f0, voiced_flag, pitch_range=PITCH_RANGE):
+    """
+    與 analyze_prosody 相同的統計：只取有聲且落在 80–600 Hz 的 frame
+
+    Returns:
+    - (pitch_mean, pitch_variation)
+    """
+    pitch_values = f0[voiced_flag]
+    pitch_values = pitch_values[(pitch_values > pitch_range[0]) & (pitch_values < pitch_range[1])]
+    pitch_mean = np.mean(pitch_values) if len(pitch_values) > 0 else 0
+    pitch_variation = np.std(pitch_values) if len(pitch_values) > 0 else 0
+    return pitch_mean, pitch_variation
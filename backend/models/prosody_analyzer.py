@@ -1,10 +1,266 @@
+import os
+import random
+import threading
 import librosa
 import numpy as np
-from transformers import pipeline
+from models.model_registry import register_model, get_model
+from models.audio_buffer import AudioBuffer, load_segment
+from models.pitch_tracker import track_pitch, summarize_pitch
+from models.word_timeline import WordTimeline
 
 # Load the model locally
-MODEL_PATH = r"E:\code\Grade_Third_project\stutter_detection_model"  # 使用原始字符串避免反斜杠問題
-pipe = pipeline("audio-classification", model=MODEL_PATH, device=0)
+MODEL_PATH = os.environ.get(
+    "STUTTER_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "stutter_detection_model")
+)
+STUTTER_RUNTIME = os.environ.get("STUTTER_RUNTIME", "torch")  # "torch"、"onnx" 或 "int8"
+STUTTER_BATCH_SIZE = int(os.environ.get("STUTTER_BATCH_SIZE", "8"))
+STUTTER_MAX_PADDED_SECONDS = float(os.environ.get("STUTTER_MAX_PADDED_SECONDS", "30"))  # 比這長的語段單獨推論
+# 模型第一層 conv 的 GroupNorm 會把補零一起算進去，attention mask 擋不掉，補零越多分數與逐段推論差越多；
+# 依長度排序分批，同一批最長 / 最短不超過這個比例（1.0 = 只放同長度的 clip，結果與 pipe(clip) 相同）
+STUTTER_MAX_PAD_RATIO = float(os.environ.get("STUTTER_MAX_PAD_RATIO", "1.25"))
+# 補齊的 batch 以這個比例抽一個 clip 重跑 pipe(clip) 比對（多一次推論），預設關閉
+STUTTER_PADDED_CHECK_RATE = float(os.environ.get("STUTTER_PADDED_CHECK_RATE", "0"))
+STUTTER_MODE = os.environ.get("STUTTER_MODE", "segments")  # "segments"：整段送進模型；"timeline"：固定長度窗口
+STUTTER_WINDOW_SECONDS = float(os.environ.get("STUTTER_WINDOW_SECONDS", "3.0"))  # 與模型訓練片段長度相同
+STUTTER_HOP_SECONDS = float(os.environ.get("STUTTER_HOP_SECONDS", "1.5"))
+NONSTUTTER_LABEL = "nonstutter"
+
+def load_stutter_pipeline():
+    """
+    建立結巴偵測 pipeline（由 model_registry 在第一次使用時呼叫）
+    """
+    import torch
+    from transformers import pipeline
+    device = 0 if torch.cuda.is_available() else -1
+    return pipeline("audio-classification", model=MODEL_PATH, device=device)
+
+def load_stutter_pipeline_onnx():
+    """
+    CPU 推論用：以匯出的 ONNX 結巴模型取代 transformers pipeline（先執行 python -m models.model_export --model stutter）
+    """
+    from transformers import AutoConfig, AutoFeatureExtractor
+    from models.onnx_runtime import OnnxAudioClassificationPipeline
+    from models.model_export import STUTTER_ONNX_PATH
+    config = AutoConfig.from_pretrained(MODEL_PATH)
+    feature_extractor = AutoFeatureExtractor.from_pretrained(MODEL_PATH)
+    return OnnxAudioClassificationPipeline(STUTTER_ONNX_PATH, feature_extractor, config.id2label)
+
+def load_stutter_pipeline_int8():
+    """
+    低記憶體 CPU 模式：線性層 int8 動態量化的結巴模型
+    """
+    from transformers import pipeline
+    from models.quantization import quantize_linear_int8
+    pipe = pipeline("audio-classification", model=MODEL_PATH, device=-1)
+    pipe.model = quantize_linear_int8(pipe.model)
+    return pipe
+
+register_model("stutter", load_stutter_pipeline)
+register_model("stutter-onnx", load_stutter_pipeline_onnx)
+register_model("stutter-int8", load_stutter_pipeline_int8)
+
+def get_stutter_pipeline(runtime=None):
+    # runtime: "torch"、"onnx" 或 "int8"，None 時使用 STUTTER_RUNTIME 環境變數
+    runtime = runtime or STUTTER_RUNTIME
+    return get_model("stutter" if runtime == "torch" else f"stutter-{runtime}")
+
+def _supports_attention_mask(model):
+    from models.onnx_runtime import OnnxClassifier
+    return not isinstance(model, OnnxClassifier) or "attention_mask" in model.input_names
+
+_padded_check_lock = threading.Lock()
+_padded_checks = {"batches": 0, "checked": 0, "label_agreement": 0, "max_score_delta": 0.0}
+
+def stutter_batch_stats():
+    """
+    補齊 batch 與逐段 pipeline 的比對紀錄：STUTTER_PADDED_CHECK_RATE > 0 時，抽中的 batch 以最短（補零最多）的 clip 重跑 pipe(clip)
+    """
+    with _padded_check_lock:
+        stats = dict(_padded_checks)
+    stats["max_pad_ratio"] = STUTTER_MAX_PAD_RATIO
+    stats["check_rate"] = STUTTER_PADDED_CHECK_RATE
+    stats["label_agreement_rate"] = stats["label_agreement"] / stats["checked"] if stats["checked"] else None
+    return stats
+
+def _record_padded_check(pipe, clip, result):
+    reference = pipe(clip)
+    ref_scores = {res["label"]: res["score"] for res in reference}
+    delta = max(abs(float(ref_scores[res["label"]]) - res["score"]) for res in result if res["label"] in ref_scores)
+    with _padded_check_lock:
+        _padded_checks["checked"] += 1
+        _padded_checks["label_agreement"] += int(reference[0]["label"] == result[0]["label"])
+        _padded_checks["max_score_delta"] = max(_padded_checks["max_score_delta"], delta)
+
+def stutter_predict_batch(clips, pipe=None, max_batch_size=None, max_padded_seconds=None, max_pad_ratio=None, check_rate=None):
+    """
+    以 batch 一次推論多個語段，取代逐段呼叫 pipe(clip)
+    clips 依長度排序後分批，同一批只補齊到最長的語段，且最長 / 最短不超過 max_pad_ratio（預設 STUTTER_MAX_PAD_RATIO），
+    長於 max_padded_seconds 的語段單獨推論；補零會經過 GroupNorm，分數與逐段推論略有差異，max_pad_ratio=1.0 時只有同長度的 clip 同批
+    check_rate（預設 STUTTER_PADDED_CHECK_RATE）> 0 時抽樣比對補齊的 batch 與 pipeline，記錄在 stutter_batch_stats()
+
+    Returns:
+    - 每個 clip 一個 [{"label", "score"}, ...]（依分數排序），格式與 pipe(clip) 相同，順序與 clips 相同
+    """
+    import torch
+    pipe = pipe or get_stutter_pipeline()
+    max_batch_size = max_batch_size or STUTTER_BATCH_SIZE
+    max_padded_seconds = max_padded_seconds or STUTTER_MAX_PADDED_SECONDS
+    max_pad_ratio = STUTTER_MAX_PAD_RATIO if max_pad_ratio is None else max_pad_ratio
+    check_rate = STUTTER_PADDED_CHECK_RATE if check_rate is None else check_rate
+    feature_extractor = pipe.feature_extractor
+    model = pipe.model
+    id2label = pipe.id2label if hasattr(pipe, "id2label") else model.config.id2label
+    sr = feature_extractor.sampling_rate
+    if not _supports_attention_mask(model):
+        # 匯出的 ONNX 模型沒有 attention_mask 輸入，只能把同長度的 clip 放同一批
+        max_pad_ratio = 1.0
+    max_samples = int(max_padded_seconds * sr)
+
+    def fits(first, candidate):
+        length = len(clips[candidate])
+        return length == len(clips[first]) or (length <= max_samples and length <= len(clips[first]) * max_pad_ratio)
+
+    results = [None] * len(clips)
+    order = sorted(range(len(clips)), key=lambda i: len(clips[i]))
+    start = 0
+    while start < len(order):
+        end = start + 1
+        while end < len(order) and end - start < max_batch_size and fits(order[start], order[end]):
+            end += 1
+        batch_ids = order[start:end]
+        inputs = feature_extractor([np.asarray(clips[i], dtype=np.float32) for i in batch_ids], sampling_rate=sr,
+                                   padding=True, return_attention_mask=True, return_tensors="np")
+        with torch.no_grad():
+            if hasattr(model, "config"):
+                device = model.device
+                logits = model(input_values=torch.from_numpy(inputs["input_values"]).to(device),
+                               attention_mask=torch.from_numpy(inputs["attention_mask"]).to(device)).logits
+            else:
+                logits = model(inputs["input_values"], inputs["attention_mask"])
+        probs = torch.softmax(logits.float(), dim=-1).cpu().numpy()
+        for i, row in zip(batch_ids, probs):
+            results[i] = [{"label": id2label[j], "score": float(row[j])} for j in np.argsort(-row)]
+        if len(clips[batch_ids[0]]) != len(clips[batch_ids[-1]]):
+            with _padded_check_lock:
+                _padded_checks["batches"] += 1
+            if check_rate > 0 and random.random() < check_rate:
+                _record_padded_check(pipe, clips[batch_ids[0]], results[batch_ids[0]])
+        start = end
+    return results
+
+def stutter_timeline(source, pipe=None, window_seconds=None, hop_seconds=None, max_batch_size=32, threshold=0.5,
+                     ranges=None):
+    """
+    將整個錄音切成固定長度、可重疊的窗口，以大 batch 推論，
+    再把連續判為同一結巴類別的窗口合併成 run-length 區段
+
+    Args:
+    - source: 音檔路徑或 AudioBuffer
+    - window_seconds / hop_seconds: 窗口長度與間隔，None 時使用 STUTTER_WINDOW_SECONDS / STUTTER_HOP_SECONDS
+    - threshold: 最高分的結巴類別分數需達到此值才算結巴窗口
+    - ranges: [(start, end), ...]，只推論與這些範圍重疊的窗口（cascade 模式），None 時推論整個錄音
+
+    Returns:
+    - dict："window_starts"、"window_ends" (n,)、"scores" (n, num_labels)、"labels"（欄位對應的類別）、
+      "window_labels"（每個窗口的判定）與 "regions"：[{"label", "start", "end", "score", "windows"}, ...]，
+      只含 prolongation / repetition / blocks 等結巴區段，依時間排序
+    """
+    window_seconds = window_seconds or STUTTER_WINDOW_SECONDS
+    hop_seconds = hop_seconds or STUTTER_HOP_SECONDS
+    if hop_seconds <= 0 or hop_seconds > window_seconds:
+        raise ValueError("hop_seconds must be positive and at most window_seconds")
+    buffer = source if isinstance(source, AudioBuffer) else AudioBuffer.from_file(source, 16000)
+
+    last_start = max(buffer.duration - window_seconds, 0.0)
+    window_starts = np.arange(0.0, last_start + 1e-9, hop_seconds)
+    if len(window_starts) == 0 or window_starts[-1] < last_start:
+        # 最後一個窗口對齊音檔結尾，確保整段音訊都有被涵蓋
+        window_starts = np.append(window_starts, last_start)
+    window_ends = np.minimum(window_starts + window_seconds, buffer.duration)
+
+    # 每個窗口只代表中間 hop 長度的一格，重疊的窗口不會把區段拉寬
+    margin = (window_seconds - hop_seconds) / 2
+    cell_starts = np.clip(window_starts + margin, 0.0, None)
+    cell_ends = np.minimum(cell_starts + hop_seconds, window_ends)
+    if len(cell_starts):
+        cell_starts[0] = 0.0
+        cell_ends[-1] = buffer.duration
+        cell_starts[1:] = np.maximum(cell_starts[1:], cell_ends[:-1])
+
+    window_ids = np.arange(len(window_starts))
+    if ranges is not None:
+        keep = np.zeros(len(window_starts), dtype=bool)
+        for start_time, end_time in ranges:
+            keep |= (window_starts < end_time) & (window_ends > start_time)
+        window_ids = window_ids[keep]
+        window_starts, window_ends = window_starts[keep], window_ends[keep]
+        cell_starts, cell_ends = cell_starts[keep], cell_ends[keep]
+
+    clips = [buffer.slice(s, e) for s, e in zip(window_starts, window_ends)]
+    outputs = stutter_predict_batch(clips, pipe, max_batch_size=max_batch_size, max_padded_seconds=window_seconds)
+    labels = sorted(outputs[0], key=lambda res: res["label"]) if outputs else []
+    labels = [res["label"] for res in labels]
+    scores = np.array([[{res["label"]: res["score"] for res in out}[label] for label in labels] for out in outputs],
+                      dtype=np.float32).reshape(len(outputs), len(labels))
+
+    top = scores.argmax(axis=1) if len(labels) else np.zeros(0, dtype=int)
+    window_labels = [
+        labels[j] if labels[j] != NONSTUTTER_LABEL and scores[i, j] >= threshold else NONSTUTTER_LABEL
+        for i, j in enumerate(top)
+    ]
+
+    regions = []
+    for i, label in enumerate(window_labels):
+        if label == NONSTUTTER_LABEL:
+            continue
+        score = float(scores[i, labels.index(label)])
+        if regions and regions[-1]["label"] == label and regions[-1]["last_window"] == window_ids[i] - 1:
+            region = regions[-1]
+            region["end"] = float(cell_ends[i])
+            region["score"] = max(region["score"], score)
+            region["windows"] += 1
+            region["last_window"] = window_ids[i]
+        else:
+            regions.append({"label": label, "start": float(cell_starts[i]), "end": float(cell_ends[i]),
+                            "score": score, "windows": 1, "last_window": window_ids[i]})
+    for region in regions:
+        del region["last_window"]
+
+    return {
+        "window_starts": window_starts,
+        "window_ends": window_ends,
+        "scores": scores,
+        "labels": labels,
+        "window_labels": window_labels,
+        "regions": regions,
+    }
+
+def timeline_model_results(timeline, start_time, end_time):
+    """
+    將與 [start_time, end_time] 重疊的窗口分數依重疊長度加權平均，格式同 pipe(clip)
+    """
+    starts, ends, scores = timeline["window_starts"], timeline["window_ends"], timeline["scores"]
+    overlap = np.clip(np.minimum(ends, end_time) - np.maximum(starts, start_time), 0.0, None)
+    if overlap.sum() <= 0:
+        centers = (starts + ends) / 2
+        overlap = np.zeros_like(overlap)
+        overlap[np.argmin(np.abs(centers - (start_time + end_time) / 2))] = 1.0
+    score = (scores * overlap[:, None]).sum(axis=0) / overlap.sum()
+    return [{"label": timeline["labels"][j], "score": float(score[j])} for j in np.argsort(-score)]
+
+def overlapping_region(regions, start_time, end_time):
+    """
+    回傳與 [start_time, end_time] 重疊最多的結巴區段，沒有重疊時回傳 None
+    """
+    best, best_overlap = None, 0.0
+    for region in regions:
+        if region["start"] >= end_time:
+            break
+        overlap = min(region["end"], end_time) - max(region["start"], start_time)
+        if overlap > best_overlap:
+            best, best_overlap = region, overlap
+    return best
 
 def convert_to_json_serializable(obj):
     if isinstance(obj, np.floating):
@@ -19,10 +275,14 @@ def convert_to_json_serializable(obj):
         return {key: convert_to_json_serializable(value) for key, value in obj.items()}
     return obj
 
-def analyze_prosody(audio_path, start_time=None, end_time=None, sample_rate=16000):
+def analyze_prosody(audio_path, start_time=None, end_time=None, sample_rate=16000, pitch_tracker=None, tracks=None):
+    if tracks is not None:
+        # 整個音檔的 FrameTracks 已算好：直接以前綴和取得這段的統計，不用重新載入與計算
+        return convert_to_json_serializable(tracks.prosody(start_time, end_time))
+
     try:
-        duration = end_time - start_time if start_time is not None and end_time is not None else None
-        audio, sr = librosa.load(audio_path, sr=sample_rate, offset=start_time or 0, duration=duration)
+        # audio_path 可以是路徑或 AudioBuffer（整個請求只解碼一次，這裡拿到的是切片 view）
+        audio, sr = load_segment(audio_path, start_time, end_time, sample_rate)
 
         if audio is None or len(audio) == 0:
             print(f"Error: Audio file {audio_path} could not be loaded or is empty.")
@@ -37,16 +297,9 @@ def analyze_prosody(audio_path, start_time=None, end_time=None, sample_rate=1600
         return None
 
     try:
-        pitch_values, voiced_flag, _ = librosa.pyin(
-            audio,
-            fmin=librosa.note_to_hz('C2'),
-            fmax=librosa.note_to_hz('C6')
-        )
-        pitch_values = pitch_values[voiced_flag]
-        pitch_values = pitch_values[(pitch_values > 80) & (pitch_values < 600)]
-
-        pitch_mean = np.mean(pitch_values) if len(pitch_values) > 0 else 0
-        pitch_variation = np.std(pitch_values) if len(pitch_values) > 0 else 0
+        # pitch_tracker: "pyin"（預設）或 "yin"（向量化，較快），None 時使用 PITCH_TRACKER 環境變數
+        pitch_values, voiced_flag = track_pitch(audio, sr, tracker=pitch_tracker)
+        pitch_mean, pitch_variation = summarize_pitch(pitch_values, voiced_flag)
 
         rms_energy = librosa.feature.rms(y=audio).flatten()
         energy_mean = np.mean(rms_energy)
@@ -66,7 +319,186 @@ def analyze_prosody(audio_path, start_time=None, end_time=None, sample_rate=1600
 
 
 
-def analyze_stuttering(segments, prosody_results, word_timestamps, audio_path):
+# 閾值設定
+STUTTER_REPETITION_THRESHOLD = 2  # 詞語重複閾值
+PAUSE_THRESHOLD = 1.5  # 語段間停頓閾值
+WORD_PAUSE_THRESHOLD = 0.25  # 單字間停頓閾值
+WORD_DURATION_THRESHOLD = 0.7  # 聲音拉長閾值
+INTERJECTION_ENERGY_THRESHOLD = 0.3  # 插入語能量閾值
+MODEL_CONFIDENCE_THRESHOLD = 0.7  # 模型預測置信度閾值
+INTERJECTIONS = {"嗯", "啊", "這個", "那個", "就是", "然後", "呃"}
+
+# cascade：先跑規則，結巴模型只推論被規則標記的語段與隨機抽樣的語段
+STUTTER_CASCADE = os.environ.get("STUTTER_CASCADE", "0") == "1"
+STUTTER_AUDIT_RATE = float(os.environ.get("STUTTER_AUDIT_RATE", "0.05"))
+STUTTER_AUDIT_SEED = os.environ.get("STUTTER_AUDIT_SEED")  # 未設定時每次請求隨機取一個 seed（記錄在 cascade 指標）
+_cascade_lock = threading.Lock()
+_cascade_totals = {"segments": 0, "model_segments": 0, "flagged": 0, "flagged_positives": 0,
+                   "audited": 0, "audit_positives": 0, "unflagged": 0}
+
+def _word_flags(word_timeline):
+    """
+    對整份逐字稿一次算出插入語與聲音拉長的候選字
+    """
+    return {
+        "interjection": np.array([word in INTERJECTIONS for word in word_timeline.words], dtype=bool),
+        "prolonged": word_timeline.per_char_durations > WORD_DURATION_THRESHOLD,
+    }
+
+def _rule_based_issues(i, segment, prosody, word_timeline, word_flags):
+    """
+    只用字時間戳與能量的規則偵測；severity / confidence / model_label 在模型結果出來後填入
+    """
+    words = segment["text"].split()
+    segment_feedback = []
+
+    # 詞語重複檢測
+    repetition_count = 1
+    for j in range(1, len(words)):
+        if words[j] == words[j-1]:
+            repetition_count += 1
+            if repetition_count >= STUTTER_REPETITION_THRESHOLD:
+                print(f"Repetition detected: '{words[j]}' repeated {repetition_count} times")
+                segment_feedback.append({
+                    "type": "repetition",
+                    "segment_index": i + 1,
+                    "text": segment["text"],
+                    "severity": None,
+                    "message": f"詞語重複: '{words[j]}' 重複 {repetition_count} 次。",
+                    "start_time": segment["start"],
+                    "end_time": segment["end"],
+                    "confidence": None,
+                    "model_label": None
+                })
+        else:
+            repetition_count = 1
+
+    # 單字級別分析：字的範圍以 searchsorted 取得，拉長與插入語候選已對整份逐字稿一次算好
+    idx = word_timeline.range(segment["start"], segment["end"])
+    print(f"Word timestamps count: {len(idx)}")
+
+    interjection = word_flags["interjection"][idx] & (prosody["Energy Variation"] > INTERJECTION_ENERGY_THRESHOLD)
+    prolonged = word_flags["prolonged"][idx]
+    segment_text = segment["text"].strip()
+    for k, is_interjection, is_prolonged in zip(idx[interjection | prolonged], interjection[interjection | prolonged],
+                                                prolonged[interjection | prolonged]):
+        word = word_timeline.words[k]
+        if segment_text.endswith(word):
+            continue
+        wt = word_timeline.word(k)
+
+        # 插入語檢測
+        if is_interjection:
+            print(f"Interjection detected: '{word}'")
+            segment_feedback.append({
+                "type": "interjection",
+                "segment_index": i + 1,
+                "text": segment["text"],
+                "severity": None,
+                "message": f"插入語: '{word}' (持續時間 {word_timeline.durations[k]:.1f} 秒)。",
+                "start_time": wt["start"],
+                "end_time": wt["end"],
+                "confidence": None,
+                "model_label": None
+            })
+
+        # 聲音拉長檢測
+        if is_prolonged:
+            avg_word_duration = word_timeline.per_char_durations[k]
+            print(f"Word prolongation detected: '{word}' (avg duration per char: {avg_word_duration:.2f}s)")
+            segment_feedback.append({
+                "type": "prolongation",
+                "segment_index": i + 1,
+                "text": segment["text"],
+                "severity": None,
+                "message": f"聲音拉長: '{word}' 平均持續時間 {avg_word_duration:.1f} 秒/字元。",
+                "start_time": wt["start"],
+                "end_time": wt["end"],
+                "confidence": None,
+                "model_label": None
+            })
+
+    # 單字間停頓檢測
+    pauses = word_timeline.pauses(idx)
+    for j in np.flatnonzero(pauses > WORD_PAUSE_THRESHOLD):
+        previous, current = word_timeline.word(idx[j]), word_timeline.word(idx[j + 1])
+        word_pause = pauses[j]
+        print(f"Word pause detected: {word_pause:.2f}s")
+        segment_feedback.append({
+            "type": "pause",
+            "segment_index": i + 1,
+            "text": segment["text"],
+            "severity": None,
+            "message": f"單字間停頓: '{previous['word']}' 和 '{current['word']}' 間停頓 {word_pause:.1f} 秒。",
+            "start_time": previous["end"],
+            "end_time": current["start"],
+            "confidence": None,
+            "model_label": None
+        })
+    return segment_feedback
+
+def _is_model_positive(model_results):
+    top = max(model_results, key=lambda x: x["score"])
+    return top["label"] != NONSTUTTER_LABEL and top["score"] > MODEL_CONFIDENCE_THRESHOLD
+
+def _cascade_metrics(flagged, unflagged, audited, segment_model_results):
+    """
+    skip_rate：沒有送進模型的語段比例
+    estimated_recall_loss：以抽樣語段中模型判為結巴的比例，推估被略過語段裡模型會抓到、但 cascade 漏掉的比例
+    """
+    flagged_positives = sum(_is_model_positive(segment_model_results[i]) for i in flagged)
+    audit_positives = sum(_is_model_positive(segment_model_results[i]) for i in audited)
+    skipped = len(unflagged) - len(audited)
+    estimated_missed = audit_positives / len(audited) * skipped if audited else None
+    found = flagged_positives + audit_positives
+    total = len(flagged) + len(unflagged)
+    metrics = {
+        "segments": total,
+        "flagged": len(flagged),
+        "audited": len(audited),
+        "model_segments": len(flagged) + len(audited),
+        "skip_rate": skipped / total if total else 0.0,
+        "flagged_positives": flagged_positives,
+        "audit_positives": audit_positives,
+        "estimated_missed": estimated_missed,
+        "estimated_recall_loss": (estimated_missed / (found + estimated_missed)
+                                  if estimated_missed is not None and found + estimated_missed > 0 else None),
+    }
+    with _cascade_lock:
+        _cascade_totals["segments"] += total
+        _cascade_totals["model_segments"] += metrics["model_segments"]
+        _cascade_totals["flagged"] += len(flagged)
+        _cascade_totals["flagged_positives"] += flagged_positives
+        _cascade_totals["audited"] += len(audited)
+        _cascade_totals["audit_positives"] += audit_positives
+        _cascade_totals["unflagged"] += len(unflagged)
+    return metrics
+
+def cascade_stats():
+    """
+    程序啟動以來 cascade 模式的累計指標
+    """
+    with _cascade_lock:
+        totals = dict(_cascade_totals)
+    skipped = totals["unflagged"] - totals["audited"]
+    estimated_missed = totals["audit_positives"] / totals["audited"] * skipped if totals["audited"] else None
+    found = totals["flagged_positives"] + totals["audit_positives"]
+    totals["skip_rate"] = skipped / totals["segments"] if totals["segments"] else 0.0
+    totals["estimated_recall_loss"] = (estimated_missed / (found + estimated_missed)
+                                       if estimated_missed is not None and found + estimated_missed > 0 else None)
+    return totals
+
+def analyze_stuttering(segments, prosody_results, word_timestamps, audio_path, batch_size=None, max_padded_seconds=None,
+                       mode=None, timeline=None, cascade=None, audit_rate=None, audit_seed=None, details=None):
+    """
+    mode="timeline" 時模型只跑固定長度窗口（stutter_timeline），每段的模型分數由窗口加權平均取得，
+    規則偵測到的問題再對應到時間重疊的結巴區段；timeline 可傳入已算好的結果
+    cascade=True（或 STUTTER_CASCADE=1）時先跑規則，模型只推論被標記的語段（timeline 模式為與其重疊的窗口）
+    再加上 audit_rate 比例的隨機抽樣語段；沒有規則問題的語段原本就不會產生回饋，略過模型不影響結果
+    audit_seed 為抽樣用的 seed（int）或 random.Random，None 時使用 STUTTER_AUDIT_SEED；用到的 seed 記錄在 cascade 指標，可重現同一次抽樣
+    details 為 dict 時會填入 "timeline"、"regions_partial" 與 "cascade"（skip rate、推估 recall 損失）；
+    timeline + cascade 時窗口只涵蓋送進模型的語段，結巴區段不完整，regions_partial 為 True
+    """
     print(f"Starting stuttering analysis with {len(segments)} segments, {len(prosody_results)} prosody results, {len(word_timestamps)} word timestamps")
     print("Segments:", segments)
     print("Prosody Results:", prosody_results)
@@ -76,17 +508,58 @@ def analyze_stuttering(segments, prosody_results, word_timestamps, audio_path):
         print("Error: Mismatch between segments and prosody results or empty input")
         return []
 
-    # 閾值設定
-    STUTTER_REPETITION_THRESHOLD = 2  # 詞語重複閾值
-    PAUSE_THRESHOLD = 1.5  # 語段間停頓閾值
-    WORD_PAUSE_THRESHOLD = 0.25  # 單字間停頓閾值
-    WORD_DURATION_THRESHOLD = 0.7  # 聲音拉長閾值
-    INTERJECTION_ENERGY_THRESHOLD = 0.3  # 插入語能量閾值
-    MODEL_CONFIDENCE_THRESHOLD = 0.7  # 模型預測置信度閾值
-    INTERJECTIONS = {"嗯", "啊", "這個", "那個", "就是", "然後", "呃"}
-
     # 加載音頻文件
-    audio, sr = librosa.load(audio_path, sr=16000)
+    audio, sr = load_segment(audio_path, sample_rate=16000)
+
+    # 1. 數據分析：規則偵測只需要字時間戳與能量，先對所有有效語段跑完
+    valid_ids = [i for i, prosody in enumerate(prosody_results) if prosody and "Duration" in prosody]
+    word_timeline = word_timestamps if isinstance(word_timestamps, WordTimeline) else WordTimeline(word_timestamps)
+    word_flags = _word_flags(word_timeline)
+    rule_issues = {i: _rule_based_issues(i, segments[i], prosody_results[i], word_timeline, word_flags) for i in valid_ids}
+
+    cascade = STUTTER_CASCADE if cascade is None else cascade
+    audited = []
+    if cascade:
+        audit_rate = STUTTER_AUDIT_RATE if audit_rate is None else audit_rate
+        flagged = [i for i in valid_ids if rule_issues[i]]
+        unflagged = [i for i in valid_ids if not rule_issues[i]]
+        if isinstance(audit_seed, random.Random):
+            rng = audit_seed
+        else:
+            audit_seed = STUTTER_AUDIT_SEED if audit_seed is None else audit_seed
+            audit_seed = random.randrange(2 ** 32) if audit_seed is None else int(audit_seed)
+            rng = random.Random(audit_seed)
+        audited = [i for i in unflagged if rng.random() < audit_rate]
+        model_ids = sorted(flagged + audited)
+        print(f"Stutter cascade: {len(flagged)} flagged + {len(audited)} audited of {len(valid_ids)} segments")
+    else:
+        model_ids = valid_ids
+
+    # 2. 模型預測結巴：一次以 batch 完成（batch_size / max_padded_seconds 預設取環境變數）
+    mode = mode or STUTTER_MODE
+    regions_partial = False
+    if mode == "timeline":
+        if timeline is None and model_ids:
+            ranges = [(segments[i]["start"], segments[i]["end"]) for i in model_ids] if cascade else None
+            timeline = stutter_timeline(AudioBuffer(audio, sr), ranges=ranges)
+            regions_partial = ranges is not None
+        if timeline is not None:
+            print(f"Stutter timeline: {len(timeline['window_starts'])} windows, regions: {timeline['regions']}")
+        segment_model_results = {i: timeline_model_results(timeline, segments[i]["start"], segments[i]["end"]) for i in model_ids}
+    elif mode == "segments":
+        clips = [audio[int(segments[i]["start"] * sr):int(segments[i]["end"] * sr)] for i in model_ids]
+        batch_results = stutter_predict_batch(clips, max_batch_size=batch_size, max_padded_seconds=max_padded_seconds)
+        segment_model_results = dict(zip(model_ids, batch_results))
+    else:
+        raise ValueError(f"Unknown stutter mode: {mode}. Supported modes: ['segments', 'timeline']")
+
+    if details is not None:
+        details["timeline"] = timeline
+        details["regions_partial"] = regions_partial
+        if cascade:
+            details["cascade"] = _cascade_metrics(flagged, unflagged, audited, segment_model_results)
+            details["cascade"]["audit_seed"] = None if isinstance(audit_seed, random.Random) else audit_seed
+            print(f"Stutter cascade metrics: {details['cascade']}")
 
     feedback = []
     for i, (segment, prosody) in enumerate(zip(segments, prosody_results)):
@@ -94,12 +567,11 @@ def analyze_stuttering(segments, prosody_results, word_timestamps, audio_path):
         if not prosody or "Duration" not in prosody:
             print(f"Skipping segment {i + 1} due to missing Duration: {prosody}")
             continue
+        if i not in segment_model_results:
+            print(f"Segment {i + 1} skipped by cascade: no data analysis issues detected")
+            continue
 
-        # 1. 模型預測結巴
-        start_sample = int(segment["start"] * sr)
-        end_sample = int(segment["end"] * sr)
-        segment_audio = audio[start_sample:end_sample]
-        model_results = pipe(segment_audio)
+        model_results = segment_model_results[i]
         print(f"Model results for segment {i + 1}: {model_results}")
 
         # 提取模型預測的各類結巴概率
@@ -108,96 +580,20 @@ def analyze_stuttering(segments, prosody_results, word_timestamps, audio_path):
         max_stutter_prob = stutter_probs[max_stutter_label]
         print(f"Max stutter label: {max_stutter_label}, Probability: {max_stutter_prob:.4f}")
 
-        # 如果模型預測為 nonstutter，跳過此語段
- 
-
-        words = segment["text"].split()
-        segment_feedback = []
-
-        # 2. 數據分析：檢查任何結巴問題
-        # 詞語重複檢測
-        repetition_count = 1
-        for j in range(1, len(words)):
-            if words[j] == words[j-1]:
-                repetition_count += 1
-                if repetition_count >= STUTTER_REPETITION_THRESHOLD:
-                    print(f"Repetition detected: '{words[j]}' repeated {repetition_count} times")
-                    segment_feedback.append({
-                        "type": "repetition",
-                        "segment_index": i + 1,
-                        "text": segment["text"],
-                        "severity": "high" if max_stutter_prob > 0.9 else "medium",
-                        "message": f"詞語重複: '{words[j]}' 重複 {repetition_count} 次。",
-                        "start_time": segment["start"],
-                        "end_time": segment["end"],
-                        "confidence": max_stutter_prob,
-                        "model_label": max_stutter_label
-                    })
-            else:
-                repetition_count = 1
-
-        # 單字級別分析
-        segment_word_timestamps = [
-            wt for wt in word_timestamps
-            if wt["start"] >= segment["start"] and wt["end"] <= segment["end"]
-        ]
-        print(f"Word timestamps count: {len(segment_word_timestamps)}")
-
-        for wt in segment_word_timestamps:
-            word = wt["word"].strip()
-            word_duration = wt["end"] - wt["start"]
-            num_chars = len(word)
-            avg_word_duration = word_duration / num_chars if num_chars > 1 else word_duration
-            is_end_word = segment["text"].strip().endswith(word)
-            if is_end_word:
-                continue
-
-            # 插入語檢測
-            if word in INTERJECTIONS and prosody["Energy Variation"] > INTERJECTION_ENERGY_THRESHOLD:
-                print(f"Interjection detected: '{word}'")
-                segment_feedback.append({
-                    "type": "interjection",
-                    "segment_index": i + 1,
-                    "text": segment["text"],
-                    "severity": "high" if max_stutter_prob > 0.9 else "medium",
-                    "message": f"插入語: '{word}' (持續時間 {word_duration:.1f} 秒)。",
-                    "start_time": wt["start"],
-                    "end_time": wt["end"],
-                    "confidence": max_stutter_prob,
-                    "model_label": max_stutter_label
-                })
-
-            # 聲音拉長檢測
-            if avg_word_duration > WORD_DURATION_THRESHOLD:
-                print(f"Word prolongation detected: '{word}' (avg duration per char: {avg_word_duration:.2f}s)")
-                segment_feedback.append({
-                    "type": "prolongation",
-                    "segment_index": i + 1,
-                    "text": segment["text"],
-                    "severity": "high" if max_stutter_prob > 0.9 else "medium",
-                    "message": f"聲音拉長: '{word}' 平均持續時間 {avg_word_duration:.1f} 秒/字元。",
-                    "start_time": wt["start"],
-                    "end_time": wt["end"],
-                    "confidence": max_stutter_prob,
-                    "model_label": max_stutter_label
-                })
-
-        # 單字間停頓檢測
-        for j in range(1, len(segment_word_timestamps)):
-            word_pause = segment_word_timestamps[j]["start"] - segment_word_timestamps[j-1]["end"]
-            if word_pause > WORD_PAUSE_THRESHOLD:
-                print(f"Word pause detected: {word_pause:.2f}s")
-                segment_feedback.append({
-                    "type": "pause",
-                    "segment_index": i + 1,
-                    "text": segment["text"],
-                    "severity": "high" if max_stutter_prob > 0.9 else "medium",
-                    "message": f"單字間停頓: '{segment_word_timestamps[j-1]['word']}' 和 '{segment_word_timestamps[j]['word']}' 間停頓 {word_pause:.1f} 秒。",
-                    "start_time": segment_word_timestamps[j-1]["end"],
-                    "end_time": segment_word_timestamps[j]["start"],
-                    "confidence": max_stutter_prob,
-                    "model_label": max_stutter_label
-                })
+        segment_feedback = rule_issues[i]
+        for item in segment_feedback:
+            item["severity"] = "high" if max_stutter_prob > 0.9 else "medium"
+            item["confidence"] = max_stutter_prob
+            item["model_label"] = max_stutter_label
+
+        if mode == "timeline":
+            # 每個問題對應到時間重疊的模型結巴區段，信心值改用該區段的分數
+            for item in segment_feedback:
+                region = overlapping_region(timeline["regions"], item["start_time"], item["end_time"])
+                if region:
+                    item["model_label"] = region["label"]
+                    item["confidence"] = region["score"]
+                    item["severity"] = "high" if region["score"] > 0.9 else "medium"
 
         # 3. 結合邏輯：模型不是 nonstutter 且數據分析有任何問題
         if (max_stutter_prob > MODEL_CONFIDENCE_THRESHOLD and max_stutter_label != "repetition") or segment_feedback:
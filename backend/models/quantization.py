@@ -0,0 +1,50 @@
+import io
+import numpy as np
+import torch
+
+# HuBERT 分類模型的 int8 動態量化：線性層權重存成 int8，啟動值在推論時動態量化（僅 CPU）
+
+
+def quantize_linear_int8(model):
+    """
+    將模型中所有 nn.Linear 換成 int8 動態量化版本
+    """
+    model = model.cpu().eval()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def model_size_mb(model):
+    """
+    以序列化後 state_dict 的大小估計常駐記憶體
+    """
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes / (1024 * 1024)
+
+
+def agreement_report(reference_results, candidate_results):
+    """
+    比較兩組 [(label, top_score, scores), ...] 的結果
+
+    Returns:
+    - label_agreement: 標籤相同的比例
+    - top_score_delta_mean / top_score_delta_max: 參考標籤分數的絕對差
+    - max_score_delta: 所有類別分數的最大絕對差
+    """
+    if not reference_results:
+        return {"count": 0, "label_agreement": None, "top_score_delta_mean": None,
+                "top_score_delta_max": None, "max_score_delta": None}
+    labels_match = []
+    top_deltas = []
+    score_deltas = []
+    for (ref_label, _, ref_scores), (cand_label, _, cand_scores) in zip(reference_results, candidate_results):
+        labels_match.append(ref_label == cand_label)
+        top_deltas.append(abs(float(ref_scores[ref_label]) - float(cand_scores[ref_label])))
+        score_deltas.append(max(abs(float(ref_scores[k]) - float(cand_scores[k])) for k in ref_scores))
+    return {
+        "count": len(labels_match),
+        "label_agreement": float(np.mean(labels_match)),
+        "top_score_delta_mean": float(np.mean(top_deltas)),
+        "top_score_delta_max": float(np.max(top_deltas)),
+        "max_score_delta": float(np.max(score_deltas)),
+    }
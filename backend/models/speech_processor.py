@@ -1,10 +1,12 @@
-import whisper
+from models.whisper_pool import get_whisper_model, decode_options
 
 class SpeechProcessor:
-    def __init__(self):
-        self.model = whisper.load_model("small").to("cuda")
+    def __init__(self, model_size="small", device=None, precision=None):
+        # 與伺服器共用 Whisper 模型池，CUDA 不可用時自動改用 CPU
+        self.model = get_whisper_model(model_size, device, precision)
+        self.decode_options = decode_options(model_size, device, precision)
     
     def transcribe_audio(self, audio_path):
         print("\n開始音頻轉錄...")
-        result = self.model.transcribe(audio_path)
-        return result 
\ No newline at end of file
+        result = self.model.transcribe(audio_path, **self.decode_options)
+        return result 
@@ -2,8 +2,12 @@ from moviepy.editor import VideoFileClip
 import librosa
 import numpy as np
 import json
-import whisper
 import os
+# 在 backend 目錄下以 python -m models.train_stutter 執行，`models.` 套件才能被 import
+from models.whisper_pool import get_whisper_model, decode_options
+from models.audio_buffer import AudioBuffer, load_segment
+from models.pitch_tracker import track_pitch, summarize_pitch
+from models.frame_tracks import FrameTracks
 
 # 從影片提取音頻（僅用於影片檔案）
 def extract_audio_from_video(video_path, output_audio_path):
@@ -12,31 +16,36 @@ def extract_audio_from_video(video_path, output_audio_path):
     audio.write_audiofile(output_audio_path, codec='pcm_s16le')
 
 # 語音轉文字
-def transcribe_audio_to_sentences(audio_path, device='cuda'):
+def transcribe_audio_to_sentences(audio_path, device=None):
     try:
-        model = whisper.load_model("medium").to(device)
-        result = model.transcribe(audio_path, verbose=False, word_timestamps=True)
+        model = get_whisper_model("medium", device)
+        result = model.transcribe(audio_path, verbose=False, word_timestamps=True,
+                                  **decode_options("medium", device))
         return result['segments']
     except Exception as e:
         print(f"Error in transcribe_audio_to_sentences: {str(e)}")
         raise
 
 # 分析單字語音特徵
-def analyze_word_prosody(audio_path, start_time, end_time, sample_rate=16000):
+def analyze_word_prosody(audio_path, start_time, end_time, sample_rate=16000, pitch_tracker=None, tracks=None):
     try:
         duration = end_time - start_time
-        audio, sr = librosa.load(audio_path, sr=sample_rate, offset=start_time, duration=duration)
+        if tracks is not None:
+            # 直接從整個音檔的 frame 軌跡取這個字的統計
+            pitch_mean, _, _ = tracks.pitch_stats(start_time, end_time)
+            energy_mean, _ = tracks.energy_stats(start_time, end_time)
+            return {
+                "Duration": duration,
+                "Pitch Mean": pitch_mean,
+                "Energy Mean": energy_mean
+            }
+        audio, sr = load_segment(audio_path, start_time, end_time, sample_rate)
         if len(audio) == 0:
             return None
         audio = librosa.util.normalize(audio)
         
-        pitch_values, voiced_flag, _ = librosa.pyin(
-            audio, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C6')
-        )
-        pitch_values = pitch_values[voiced_flag]
-        pitch_values = pitch_values[(pitch_values > 80) & (pitch_values < 600)]
-
-        pitch_mean = np.mean(pitch_values) if len(pitch_values) > 0 else 0
+        pitch_values, voiced_flag = track_pitch(audio, sr, tracker=pitch_tracker)
+        pitch_mean, _ = summarize_pitch(pitch_values, voiced_flag)
         rms_energy = librosa.feature.rms(y=audio).flatten()
         energy_mean = np.mean(rms_energy)
 
@@ -66,7 +75,7 @@ def save_segment_to_json(output_dir, output_file, data, segment_text):
         print(f"Error saving to JSON: {str(e)}")
 
 # 處理單一句子的結巴標記
-def mark_stutter_in_sentence(audio_path, segment):
+def mark_stutter_in_sentence(audio_path, segment, tracks=None):
     sentence_text = segment['text'].strip()
     print(f"\nProcessing sentence: '{sentence_text}'")
     print(f"Time: {segment['start']}s - {segment['end']}s")
@@ -108,7 +117,7 @@ def mark_stutter_in_sentence(audio_path, segment):
     i = 0
     while i < len(segment.get("words", [])):
         word = segment["words"][i]
-        prosody = analyze_word_prosody(audio_path, word["start"], word["end"])
+        prosody = analyze_word_prosody(audio_path, word["start"], word["end"], tracks=tracks)
         if not prosody:
             print(f"Skipping word '{word['word']}' due to missing prosody data")
             i += 1
@@ -170,9 +179,12 @@ def mark_stutter_in_sentence(audio_path, segment):
     return marked_words
 
 # 主流程：逐句處理音頻並儲存到指定目錄
-def process_audio_for_stutter_marking(audio_path, device='cuda'):
+def process_audio_for_stutter_marking(audio_path, device=None):
     print(f"Transcribing audio from {audio_path}...")
     segments = transcribe_audio_to_sentences(audio_path, device)
+    # 整個音檔只解碼一次，逐字分析時使用切片
+    audio_buffer = AudioBuffer.from_file(audio_path)
+    tracks = FrameTracks.compute(audio_buffer)
     
     # 從音檔路徑提取主體名稱（去掉路徑和副檔名）
     audio_name = os.path.splitext(os.path.basename(audio_path))[0]  # 例如 "male01"
@@ -186,7 +198,7 @@ def process_audio_for_stutter_marking(audio_path, device='cuda'):
     i = 0
     serial_number = 1  # 流水號從 001 開始
     while i < len(segments):
-        result = mark_stutter_in_sentence(audio_path, segments[i])
+        result = mark_stutter_in_sentence(audio_buffer, segments[i], tracks=tracks)
         if result == "reback" and i > 0:
             i -= 1
             if all_marked_results:
@@ -0,0 +1,126 @@
+import librosa
+import numpy as np
+
+# 以 frame RMS 能量做的簡易語音活動偵測（與 analyze_prosody 使用相同的 librosa.feature.rms）
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+ENERGY_THRESHOLD_DB = -40.0  # 相對於整段最大 RMS 的門檻
+MIN_SPEECH_SECONDS = 0.25  # 短於此長度的能量突波視為雜音
+MIN_SILENCE_SECONDS = 0.6  # 短於此長度的靜音視為句中停頓，不切開
+PADDING_SECONDS = 0.2  # 每段語音前後保留的邊界
+GAP_SECONDS = 0.3  # 壓縮後語段之間保留的靜音，讓 Whisper 仍能看到斷句
+
+
+def detect_speech_regions(audio, sr=16000, threshold_db=ENERGY_THRESHOLD_DB,
+                          min_speech=MIN_SPEECH_SECONDS, min_silence=MIN_SILENCE_SECONDS,
+                          padding=PADDING_SECONDS):
+    """
+    找出有聲段落
+
+    Returns:
+    - regions: [(start_sec, end_sec), ...]，依時間排序且互不重疊
+    """
+    if len(audio) == 0:
+        return []
+    rms = librosa.feature.rms(y=audio, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH).flatten()
+    if not np.any(rms > 0):
+        return []
+    rms_db = librosa.amplitude_to_db(rms, ref=np.max)
+    voiced = rms_db > threshold_db
+
+    # 找出連續有聲的 frame 區間
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    frame_seconds = HOP_LENGTH / sr
+    total_seconds = len(audio) / sr
+
+    regions = []
+    for start_frame, end_frame in zip(starts, ends):
+        start = start_frame * frame_seconds
+        end = min(end_frame * frame_seconds + FRAME_LENGTH / sr / 2, total_seconds)
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+
+    padded = []
+    for start, end in regions:
+        if end - start < min_speech:
+            continue
+        start = max(0.0, start - padding)
+        end = min(total_seconds, end + padding)
+        if padded and start <= padded[-1][1]:
+            padded[-1][1] = max(padded[-1][1], end)
+        else:
+            padded.append([start, end])
+    return [(float(start), float(end)) for start, end in padded]
+
+
+class VadTimeMap:
+    """
+    壓縮後時間 → 原音檔時間的對照表
+    """
+    def __init__(self, compressed_starts, original_starts, durations):
+        self.compressed_starts = np.asarray(compressed_starts, dtype=np.float64)
+        self.original_starts = np.asarray(original_starts, dtype=np.float64)
+        self.durations = np.asarray(durations, dtype=np.float64)
+
+    def to_original(self, t):
+        if len(self.compressed_starts) == 0:
+            return t
+        idx = max(int(np.searchsorted(self.compressed_starts, t, side="right")) - 1, 0)
+        offset = min(max(t - self.compressed_starts[idx], 0.0), self.durations[idx])
+        return float(self.original_starts[idx] + offset)
+
+    def remap_segment(self, segment):
+        """
+        將 Whisper 語段（含 words）的時間換回原音檔時間
+        """
+        remapped = dict(segment, start=self.to_original(segment["start"]), end=self.to_original(segment["end"]))
+        if "words" in segment:
+            remapped["words"] = [
+                dict(w, start=self.to_original(w["start"]), end=self.to_original(w["end"]))
+                for w in segment["words"]
+            ]
+        return remapped
+
+
+def compress_silence(audio, sr=16000, regions=None, gap_seconds=GAP_SECONDS):
+    """
+    移除非語音區段，只在語段之間保留短暫靜音
+
+    Returns:
+    - compressed: 壓縮後的波形
+    - time_map: VadTimeMap，用來把 ASR 時間戳換回原始時間
+    - stats: 原始長度、保留長度、略過長度與比例
+    """
+    if regions is None:
+        regions = detect_speech_regions(audio, sr)
+    gap = np.zeros(int(gap_seconds * sr), dtype=audio.dtype)
+
+    pieces = []
+    compressed_starts, original_starts, durations = [], [], []
+    cursor = 0
+    for start, end in regions:
+        start_sample, end_sample = int(start * sr), int(end * sr)
+        if pieces:
+            pieces.append(gap)
+            cursor += len(gap)
+        compressed_starts.append(cursor / sr)
+        original_starts.append(start_sample / sr)
+        durations.append((end_sample - start_sample) / sr)
+        pieces.append(audio[start_sample:end_sample])
+        cursor += end_sample - start_sample
+
+    compressed = np.concatenate(pieces) if pieces else np.zeros(0, dtype=audio.dtype)
+    original_seconds = len(audio) / sr
+    kept_seconds = float(sum(durations))
+    stats = {
+        "original_seconds": original_seconds,
+        "kept_seconds": kept_seconds,
+        "skipped_seconds": original_seconds - kept_seconds,
+        "skipped_ratio": (original_seconds - kept_seconds) / original_seconds if original_seconds > 0 else 0.0,
+        "speech_regions": len(regions),
+    }
+    return compressed, VadTimeMap(compressed_starts, original_starts, durations), stats
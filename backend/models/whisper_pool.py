@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+import numpy as np
+
+# torch / whisper 在第一次用到時才 import，讓不需要轉錄的 worker 快速啟動
+# 全域 Whisper 模型池：同一個 (model size, device, precision) 只載入一次
+DEFAULT_MODEL_SIZE = os.environ.get("WHISPER_MODEL_SIZE", "medium")
+DEFAULT_DEVICE = os.environ.get("WHISPER_DEVICE")  # None 表示自動選擇
+DEFAULT_PRECISION = os.environ.get("WHISPER_PRECISION")  # None 表示依裝置決定
+SUPPORTED_PRECISIONS = ("fp16", "fp32", "int8")
+
+_model_pool = {}
+_load_times = {}
+_pool_lock = threading.Lock()
+
+
+def resolve_device(device=None):
+    """
+    決定實際使用的裝置，CUDA 不可用時退回 CPU
+    """
+    import torch
+    device = device or DEFAULT_DEVICE
+    if device is None:
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    if device.startswith("cuda") and not torch.cuda.is_available():
+        print(f"CUDA not available, falling back to CPU for Whisper (requested {device})")
+        return "cpu"
+    return device
+
+
+def resolve_precision(device, precision=None):
+    """
+    決定推論精度：CUDA 預設 fp16，CPU 預設 fp32（CPU 不支援 fp16 解碼）
+    int8 為 CPU 專用的動態量化模式
+    """
+    precision = precision or DEFAULT_PRECISION
+    if precision is None:
+        return "fp16" if device.startswith("cuda") else "fp32"
+    if precision not in SUPPORTED_PRECISIONS:
+        raise ValueError(f"Unknown Whisper precision: {precision}. Supported: {list(SUPPORTED_PRECISIONS)}")
+    if precision == "fp16" and not device.startswith("cuda"):
+        return "fp32"
+    if precision == "int8" and device != "cpu":
+        raise ValueError("int8 Whisper is only supported on CPU")
+    return precision
+
+
+def _replace_with_plain_linear(module):
+    """
+    Whisper 使用自訂的 Linear 子類別，quantize_dynamic 只認得 nn.Linear，
+    先換成共用同一組權重的 nn.Linear 才能量化
+    """
+    import torch
+    for name, child in module.named_children():
+        if isinstance(child, torch.nn.Linear) and type(child) is not torch.nn.Linear:
+            plain = torch.nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+            plain.weight = child.weight
+            plain.bias = child.bias
+            setattr(module, name, plain)
+        else:
+            _replace_with_plain_linear(child)
+    return module
+
+
+def quantize_whisper_int8(model):
+    """
+    將 Whisper 的所有線性層做 int8 動態量化（僅 CPU）
+    """
+    from models.quantization import quantize_linear_int8
+    return quantize_linear_int8(_replace_with_plain_linear(model.cpu()))
+
+
+def set_cpu_threads(num_threads=None, num_interop_threads=None):
+    """
+    控制 CPU 推論使用的執行緒數量，None 表示維持現狀
+    """
+    import torch
+    if num_threads:
+        torch.set_num_threads(int(num_threads))
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(int(num_interop_threads))
+        except RuntimeError:
+            # inter-op 執行緒數只能在第一次平行運算前設定
+            print("Could not change inter-op threads after parallel work has started")
+    return torch.get_num_threads()
+
+
+def _pool_key(model_size=None, device=None, precision=None):
+    model_size = model_size or DEFAULT_MODEL_SIZE
+    device = resolve_device(device)
+    precision = resolve_precision(device, precision)
+    return model_size, device, precision
+
+
+def get_whisper_model(model_size=None, device=None, precision=None):
+    """
+    從模型池取得 Whisper 模型，第一次呼叫時才載入
+
+    Args:
+    - model_size: "tiny", "base", "small", "medium", "large"
+    - device: "cuda" / "cpu"，None 時自動選擇
+    - precision: "fp16" / "fp32" / "int8"，None 時依裝置決定
+
+    Returns:
+    - model: 已載入的 Whisper 模型（整個 process 共用）
+    """
+    key = _pool_key(model_size, device, precision)
+    model = _model_pool.get(key)
+    if model is not None:
+        return model
+
+    with _pool_lock:
+        model = _model_pool.get(key)
+        if model is None:
+            import whisper
+            model_size, device, precision = key
+            start = time.perf_counter()
+            model = whisper.load_model(model_size, device=device)
+            if precision == "int8":
+                model = quantize_whisper_int8(model)
+            model.eval()
+            _load_times[key] = time.perf_counter() - start
+            _model_pool[key] = model
+            print(f"Loaded Whisper {model_size} on {device} ({precision}) in {_load_times[key]:.2f}s")
+    return model
+
+
+def decode_options(model_size=None, device=None, precision=None):
+    """
+    回傳對應精度的 transcribe 參數
+    """
+    _, _, precision = _pool_key(model_size, device, precision)
+    return {"fp16": precision == "fp16"}
+
+
+def warmup_whisper(model_size=None, device=None, precision=None):
+    """
+    伺服器啟動時預先載入模型並跑一次短解碼，讓第一個請求不用付載入成本
+    """
+    import torch
+    model = get_whisper_model(model_size, device, precision)
+    start = time.perf_counter()
+    silence = np.zeros(16000, dtype=np.float32)  # 1 秒靜音
+    with torch.no_grad():
+        model.transcribe(silence, verbose=None, **decode_options(model_size, device, precision))
+    print(f"Whisper warm-up finished in {time.perf_counter() - start:.2f}s")
+    return model
+
+
+def pool_stats():
+    """
+    目前模型池中的模型與載入時間（秒）
+    """
+    return {
+        f"{size}/{device}/{precision}": round(seconds, 3)
+        for (size, device, precision), seconds in _load_times.items()
+    }
@@ -0,0 +1,40 @@
+import numpy as np
+
+# 整份逐字稿的欄式字時間軸：start / end / 字元數各一個 NumPy 陣列，依 start 排序，
+# 語段內的字以 searchsorted 在 O(log n) 找到，不必每段重新掃過全部的字
+
+
+class WordTimeline:
+    def __init__(self, word_timestamps):
+        starts = np.array([wt["start"] for wt in word_timestamps], dtype=np.float64)
+        order = np.argsort(starts, kind="stable")
+        self.raw_words = [word_timestamps[k]["word"] for k in order]
+        self.words = [word.strip() for word in self.raw_words]
+        self.starts = starts[order]
+        self.ends = np.array([word_timestamps[k]["end"] for k in order], dtype=np.float64)
+        self.char_lengths = np.array([len(word) for word in self.words], dtype=np.int64)
+        self.durations = self.ends - self.starts
+        # 每字元平均持續時間：單一字元（或空字串）時為整個字的持續時間
+        self.per_char_durations = np.where(self.char_lengths > 1,
+                                           self.durations / np.maximum(self.char_lengths, 1), self.durations)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def range(self, start_time, end_time):
+        """
+        完全落在 [start_time, end_time] 內的字的索引（依時間排序）
+        """
+        lo = np.searchsorted(self.starts, start_time, side="left")
+        hi = np.searchsorted(self.starts, end_time, side="right")
+        idx = np.arange(lo, hi)
+        return idx[self.ends[idx] <= end_time]
+
+    def pauses(self, idx):
+        """
+        idx 中相鄰兩字之間的停頓長度（len(idx) - 1 個）
+        """
+        return self.starts[idx[1:]] - self.ends[idx[:-1]]
+
+    def word(self, k):
+        return {"word": self.raw_words[k], "start": float(self.starts[k]), "end": float(self.ends[k])}